@@ -0,0 +1,306 @@
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from cache import LlmCache, OcrCache, file_digest
+from chunk_packer import CHUNK_TOKEN_BUDGET
+from chunk_pdf import (DEFAULT_RENDER, add_ocr_args, add_render_args, iter_document,
+                       render_policy, s3_client, select_ocr, textract_client)
+from instrument import recording
+from ocr import TEXTRACT_JOB_BUCKET, TEXTRACT_TPS, TextractJobOCR, TextractOCR, TokenBucket
+from page_filter import MIN_PAGE_SCORE
+from parcel_index import ParcelIndex
+
+# Batch mode: run every PDF under the given directories/globs through the
+# pipeline, one document per worker process.  Each document's results land
+# in their own JSONL file (written to a temp file and renamed into place),
+# and a SQLite manifest records the content hash and status of every
+# document so an interrupted batch picks up where it stopped.
+
+DEFAULT_OUT_DIR = "batch_output"
+MANIFEST_NAME = "manifest.sqlite"
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+_worker = {}
+
+
+def find_documents(inputs):
+    """Expand directories (recursively) and glob patterns into a sorted list of PDF paths."""
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths = glob.glob(os.path.join(glob.escape(item), "**", "*"), recursive=True)
+        else:
+            paths = glob.glob(item, recursive=True) or [item]
+        for path in paths:
+            if os.path.isfile(path) and path.lower().endswith(".pdf"):
+                found.add(os.path.abspath(path))
+    return sorted(found)
+
+
+def output_path(out_dir, path, sha):
+    # the hash prefix keeps same-named exhibits from different folders apart
+    stem = os.path.splitext(os.path.basename(path))[0].strip()
+    return os.path.join(out_dir, f"{stem}.{sha[:12]}.jsonl")
+
+
+def write_atomic(path, lines):
+    """Write `lines` to `path` so readers only ever see the old file or the complete new one."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".jsonl")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line)
+                f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Manifest:
+    """
+    Per-document status for one output directory.  Only the parent process
+    writes to it; every status change is committed immediately, so after a
+    crash the manifest shows exactly which documents finished.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " path TEXT PRIMARY KEY, sha256 TEXT NOT NULL, status TEXT NOT NULL,"
+            " output TEXT, chunks INTEGER, segments INTEGER, seconds REAL,"
+            " error TEXT, updated REAL NOT NULL)"
+        )
+
+    def is_done(self, path, sha):
+        row = self._conn.execute(
+            "SELECT sha256, status, output FROM documents WHERE path = ?", (path,)
+        ).fetchone()
+        return (row is not None and row[0] == sha and row[1] == DONE
+                and row[2] is not None and os.path.exists(row[2]))
+
+    def mark(self, path, sha, status, output=None, chunks=None, segments=None,
+             seconds=None, error=None):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents"
+            " (path, sha256, status, output, chunks, segments, seconds, error, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, sha, status, output, chunks, segments, seconds, error, time.time()),
+        )
+
+    def counts(self):
+        return dict(self._conn.execute(
+            "SELECT status, COUNT(*) FROM documents GROUP BY status"
+        ).fetchall())
+
+    def close(self):
+        self._conn.close()
+
+
+def _init_worker(refresh_llm_cache, render_workers, fast_path, policy, min_page_score,
+                 chunk_tokens, instrument, inventory, textract_tps, ocr_mode, bucket):
+    # each worker opens its own cache connections; SQLite handles the
+    # cross-process locking
+    _worker["ocr_cache"] = OcrCache()
+    _worker["llm_cache"] = LlmCache(bypass=refresh_llm_cache)
+    _worker["render_workers"] = render_workers
+    _worker["fast_path"] = fast_path
+    _worker["policy"] = policy
+    _worker["min_page_score"] = min_page_score
+    _worker["chunk_tokens"] = chunk_tokens
+    _worker["instrument"] = instrument
+    _worker["inventory"] = inventory
+    _worker["textract_tps"] = textract_tps
+    _worker["ocr_mode"] = ocr_mode
+    _worker["bucket"] = bucket
+    _worker["ocr"] = {}
+
+
+def _worker_ocr(path):
+    # this worker's OCR backends, made on first use and shared by all its
+    # documents, so the worker never exceeds its share of the account's rate
+    # (one token bucket between both, since they draw on the same quota)
+    backends = _worker["ocr"]
+    mode = _worker["ocr_mode"]
+    if not backends:
+        limiter = TokenBucket(_worker["textract_tps"])
+        backends["sync"] = (TextractOCR(textract_client(), limiter=limiter)
+                            if mode != "job" else None)
+        backends["job"] = (TextractJobOCR(textract_client(), s3_client(), bucket=_worker["bucket"],
+                                          limiter=limiter) if mode != "sync" else None)
+    return select_ocr(path, backends["sync"], backends["job"], mode)
+
+
+def process_document(path, out):
+    """
+    Extract one PDF into `out` (JSONL, one prompt/completion record per
+    chunk, the first also carrying the document's inventory fields unless
+    inventory extraction is off).  With instrumentation on, the document's stage
+    summary and Chrome trace are written alongside as .summary.json and
+    .trace.json.
+    """
+    start = time.perf_counter()
+    records = []
+    segments = 0
+    document = os.path.basename(path)
+    inventory = {} if _worker["inventory"] else None
+    with recording(document) if _worker["instrument"] else nullcontext() as recorder:
+        extractions = iter_document(path, _worker["ocr_cache"], _worker["llm_cache"],
+                                    render_workers=_worker["render_workers"],
+                                    fast_path=_worker["fast_path"], policy=_worker["policy"],
+                                    min_page_score=_worker["min_page_score"],
+                                    chunk_tokens=_worker["chunk_tokens"],
+                                    log=lambda msg: print(f"{document}: {msg}"),
+                                    ocr=_worker_ocr(path), inventory=inventory)
+        for i, (chunk, segs) in enumerate(extractions):
+            segments += len(segs)
+            records.append({
+                "document":   document,
+                "chunk":      i,
+                "prompt":     chunk.text,
+                "completion": json.dumps({"segments": segs}, ensure_ascii=False),
+            })
+    # the inventory is only complete once the last chunk is out; it's
+    # written once per document, on the first record
+    if inventory is not None and records:
+        records[0]["inventory"] = inventory
+    write_atomic(out, (json.dumps(record, ensure_ascii=False) for record in records))
+    if recorder is not None:
+        stem = os.path.splitext(out)[0]
+        recorder.write_summary(f"{stem}.summary.json")
+        recorder.write_trace(f"{stem}.trace.json")
+    return len(records), segments, time.perf_counter() - start
+
+
+def run_batch(paths, out_dir=DEFAULT_OUT_DIR, workers=None, refresh_llm_cache=False,
+              render_workers=0, fast_path=True, policy=None, min_page_score=None, chunk_tokens=None,
+              instrument=False, inventory=True, index=None, textract_tps=None, ocr_mode="auto",
+              bucket=None, log=print):
+    """
+    Process `paths` across `workers` processes, skipping documents the
+    manifest already has as done with the same content hash.  The Textract
+    rate, `textract_tps` (default ocr.TEXTRACT_TPS), is split evenly
+    between the workers.  `ocr_mode` and `bucket` (default
+    ocr.TEXTRACT_JOB_BUCKET) choose the OCR backend as in
+    chunk_pdf.select_ocr.  With `index` (a parcel_index path) each output
+    is indexed as it completes.  Returns the manifest's status counts.
+    """
+    if policy is None:
+        policy = DEFAULT_RENDER
+    if min_page_score is None:
+        min_page_score = MIN_PAGE_SCORE
+    if chunk_tokens is None:
+        chunk_tokens = CHUNK_TOKEN_BUDGET
+    if textract_tps is None:
+        textract_tps = TEXTRACT_TPS
+    if bucket is None:
+        bucket = TEXTRACT_JOB_BUCKET
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(out_dir, MANIFEST_NAME))
+    if index is not None:
+        index = ParcelIndex(index)
+    try:
+        todo = []
+        for path in paths:
+            sha = file_digest(path)
+            if manifest.is_done(path, sha):
+                continue
+            manifest.mark(path, sha, PENDING)
+            todo.append((path, sha))
+        log(f"{len(paths)} documents, {len(paths) - len(todo)} already done, {len(todo)} to process")
+
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(refresh_llm_cache, render_workers, fast_path,
+                                           policy, min_page_score, chunk_tokens,
+                                           instrument, inventory,
+                                           textract_tps / workers, ocr_mode, bucket)) as pool:
+            running = {}
+            queue = iter(todo)
+            limit = 2 * workers
+
+            def submit():
+                for path, sha in queue:
+                    out = output_path(out_dir, path, sha)
+                    manifest.mark(path, sha, RUNNING, out)
+                    running[pool.submit(process_document, path, out)] = (path, sha, out)
+                    if len(running) >= limit:
+                        return
+
+            submit()
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path, sha, out = running.pop(future)
+                    try:
+                        chunks, segments, seconds = future.result()
+                    except Exception as exc:
+                        manifest.mark(path, sha, FAILED, error=f"{type(exc).__name__}: {exc}")
+                        log(f"failed  {path}: {exc}")
+                    else:
+                        manifest.mark(path, sha, DONE, out, chunks, segments, seconds)
+                        log(f"done    {path}: {segments} segments in {seconds:.1f}s")
+                        if index is not None:
+                            index.add_file(out)
+                submit()
+        return manifest.counts()
+    finally:
+        manifest.close()
+        if index is not None:
+            index.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract metes-and-bounds calls from every PDF "
+                                                 "under the given directories or globs.")
+    parser.add_argument("inputs", nargs="+", help="directories (searched recursively) or glob patterns")
+    parser.add_argument("--out", default=DEFAULT_OUT_DIR,
+                        help=f"output directory for JSONL results and the manifest (default {DEFAULT_OUT_DIR})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="documents processed in parallel (default: CPU count)")
+    parser.add_argument("--render-workers", type=int, default=0,
+                        help="render processes per document; 0 renders inside the document worker")
+    parser.add_argument("--refresh-llm-cache", action="store_true",
+                        help="ignore cached LLM responses (fresh ones are still stored)")
+    parser.add_argument("--no-fast-path", action="store_true",
+                        help="send every chunk to the LLM instead of parsing plain calls locally")
+    parser.add_argument("--min-page-score", type=float,
+                        help="pages scoring below this skip LLM extraction; 0 keeps every page")
+    parser.add_argument("--chunk-tokens", type=int,
+                        help="deed-text tokens packed into one LLM request")
+    parser.add_argument("--instrument", action="store_true",
+                        help="write a stage summary and Chrome trace next to each document's output")
+    parser.add_argument("--no-inventory", action="store_true",
+                        help="skip extracting each document's inventory clause")
+    parser.add_argument("--textract-tps", type=float,
+                        help="Textract requests per second for the whole batch, split between "
+                             "the workers (default: ocr.TEXTRACT_TPS)")
+    parser.add_argument("--index", metavar="PATH",
+                        help="add each finished document to this parcel index (see parcel_index.py)")
+    add_render_args(parser)
+    add_ocr_args(parser)
+    args = parser.parse_args(argv)
+
+    paths = find_documents(args.inputs)
+    counts = run_batch(paths, args.out, args.workers, args.refresh_llm_cache,
+                       args.render_workers, not args.no_fast_path, render_policy(args),
+                       args.min_page_score, args.chunk_tokens, args.instrument,
+                       not args.no_inventory, args.index, args.textract_tps, args.ocr,
+                       args.bucket)
+    print(f"Manifest: {counts}")
+
+
+if __name__ == "__main__":
+    main()
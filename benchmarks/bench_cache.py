@@ -0,0 +1,87 @@
+"""
+Put and get cost of cache.SqliteCache as it fills.
+
+Puts --entries values of about the size of a page's Textract blocks into a
+fresh cache, reporting the mean put time over each tenth of the run (which
+should stay flat as the table grows), then times hits on random keys, and
+fills past a small max_bytes to time puts that evict.  Checks that the
+running size total matches the stored entries and that eviction keeps the
+cache under its limit.
+
+    python benchmarks/bench_cache.py [--entries 150000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cache import SqliteCache
+
+
+def value(rng, words):
+    return {"Blocks": [{"BlockType": "WORD", "Text": rng.choice(words), "Confidence": 99.0}
+                       for _ in range(rng.randint(20, 60))]}
+
+
+def stored_bytes(cache):
+    return cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+def fill(cache, rng, words, count, label):
+    bands = 10
+    step = max(1, count // bands)
+    start = time.perf_counter()
+    for n in range(count):
+        cache.put(f"{label}-{n}", value(rng, words))
+        if (n + 1) % step == 0:
+            now = time.perf_counter()
+            print(f"  puts {n + 1 - step:>8,}-{n + 1:<8,} {1000 * (now - start) / step:6.3f} ms/put")
+            start = now
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=150_000)
+    parser.add_argument("--gets", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    words = ["BEGINNING", "THENCE", "North", "South", "feet", "iron", "rod", "found", "set",
+             "along", "line", "corner", "Section", "Block", "Survey"] + [str(n) for n in range(500)]
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SqliteCache(os.path.join(tmp, "cache.sqlite"))
+        try:
+            print(f"filling to {args.entries:,} entries")
+            fill(cache, rng, words, args.entries, "k")
+            stats = cache.stats()
+            assert stats["bytes"] == stored_bytes(cache), "size total drifted"
+
+            start = time.perf_counter()
+            for _ in range(args.gets):
+                assert cache.get(f"k-{rng.randrange(args.entries)}") is not None
+            print(f"gets: {1000 * (time.perf_counter() - start) / args.gets:.3f} ms/hit")
+        finally:
+            cache.close()
+
+        # a cache a tenth the size of what goes through it evicts all along
+        limit = stats["bytes"] // 10
+        cache = SqliteCache(os.path.join(tmp, "small.sqlite"), max_bytes=limit)
+        try:
+            print(f"filling {args.entries // 2:,} entries through a {limit / 1e6:.1f} MB cache")
+            fill(cache, rng, words, args.entries // 2, "s")
+            stats = cache.stats()
+            assert stats["bytes"] == stored_bytes(cache) <= limit, (stats, limit)
+            print(f"  {stats['evictions']:,} evicted, {stats['entries']:,} entries "
+                  f"({stats['bytes'] / 1e6:.1f} MB) left")
+        finally:
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
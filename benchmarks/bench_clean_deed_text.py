@@ -0,0 +1,148 @@
+"""
+Golden-corpus check and throughput benchmark for chunk_pdf.clean_deed_text.
+
+The corpus is every deed text in output.json, the calls and monuments in
+segments.json and the prompts in TrainingMaterials/training_fixed.jsonl, plus a few deterministic variants of
+each (case changes, extra line breaks, header/EXHIBIT/path noise) so every
+pass gets exercised.  The sha256 of the expected output for each corpus
+entry is pinned in fixtures/clean_deed_text_golden.json; outputs must match
+byte for byte.  Throughput is reported in pages/sec against the original
+regex chain.
+
+    python benchmarks/bench_clean_deed_text.py [--regenerate]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chunk_pdf import clean_deed_pages, clean_deed_text, format_bearing
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures",
+                      "clean_deed_text_golden.json")
+
+
+def legacy_clean_deed_text(text):
+    # the original pass-per-rule implementation, kept as the reference
+    text = re.sub(r"Texas Department of Transportation.*?Page\s*\d+\s*of\s*\d+", "", text,
+                  flags=re.IGNORECASE)
+    text = re.sub(r"\bEXHIBIT\b", "", text, flags=re.IGNORECASE)
+    text = re.sub(r"[A-Za-z]:\\(?:[^\s\\]+\\)*[^\s\\]+", "", text)
+    text = re.sub(r"\*+", "", text)
+    text = re.sub(r"(?i)\bTHENCE\b", r"\nTHENCE", text)
+    pattern = re.compile(r"""
+        [\:\.,]\s*
+        (
+          (?:N|S|E|W|North|South|East|West)
+          \s*(?:[0-9]|[1-8]\d|90)\s*(?:°|degrees?)\s*
+          (?:[0-5]?\d)\s*(?:'|minutes?)\s*
+          (?:[0-5]?\d)\s*(?:"|seconds?)\s*
+          (?:E|W|East|West)?
+          (?:
+            \s*,?\s*a\s*distance\s*of\s*,?\s*
+            \d+(?:\.\d+)?\s*(?:feet|chains)
+          )?
+        )
+        (?=
+            [\:\.,\s]*(?:N|S|E|W|North|South|East|West)\b
+          | [\:\.,]
+        )
+        """, flags=re.IGNORECASE | re.VERBOSE)
+    text = pattern.sub(lambda m: f", {m.group(1)},\n", text)
+    text = re.sub(r'(?m)^[\:\.,]\s*(?!(?:[NSEW]:))', 'THENCE ', text)
+    text = re.sub(r"\s{2,}", " ", text).strip()
+    text = re.sub(
+        r'([,.:])\s*'
+        r'(?=(?:N(?!:)|S(?!:)|E(?!:)|W(?!:)|North(?!:)|South(?!:)|East(?!:)|West(?!:))\b)',
+        r'\1\n', text, flags=re.IGNORECASE)
+    text = re.sub(
+        r'(?m)^(?=\s*(?:N(?!:)|S(?!:)|E(?!:)|W(?!:)|North(?!:)|South(?!:)|East(?!:)|West(?!:))\b)',
+        'THENCE ', text)
+    text = re.sub(r"\s{2,}", " ", text).strip()
+    return text
+
+
+def source_texts():
+    with open(os.path.join(ROOT, "output.json"), encoding="utf-8") as f:
+        yield json.load(f)["prompt"]
+    with open(os.path.join(ROOT, "segments.json"), encoding="utf-8") as f:
+        segments = json.load(f)["segments"]
+    # rebuild call text from the extracted segments
+    yield " ".join(
+        f"THENCE {s['bearing']}, {s['description'] or ''}, A DISTANCE OF {s['distance']} "
+        f"{s['unit']} TO A {s['monument']};"
+        for s in segments if s["bearing"]
+    )
+    for s in segments:
+        yield " ".join(str(s[k]) for k in ("description", "monument") if s[k])
+    # despite the extension this file is a single JSON array of chat examples
+    with open(os.path.join(ROOT, "TrainingMaterials", "training_fixed.jsonl"), encoding="utf-8") as f:
+        for example in json.load(f):
+            yield next(m["content"] for m in example if m["role"] == "user")
+
+
+def corpus():
+    for text in source_texts():
+        yield text
+        yield text.lower()
+        yield text.upper()
+        yield text.replace(", ", ",\n").replace("; ", ";\n\n")
+        yield ("EXHIBIT \"A\" ** C:\\Jobs\\1194\\deed.dwg " + text
+               + " Texas Department of Transportation ROW CSJ 0912 Page 1 of 3 ***")
+
+
+def sha(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pages_per_sec(fn, pages, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(pages)
+        best = min(best, time.perf_counter() - t)
+    return len(pages) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--regenerate", action="store_true",
+                        help="rewrite the golden hashes from the reference implementation")
+    args = parser.parse_args()
+
+    pages = list(corpus())
+    if args.regenerate:
+        with open(GOLDEN, "w", encoding="utf-8") as f:
+            json.dump([sha(legacy_clean_deed_text(p)) for p in pages], f, indent=0)
+        print(f"wrote {len(pages)} golden hashes to {GOLDEN}")
+
+    with open(GOLDEN, encoding="utf-8") as f:
+        golden = json.load(f)
+    if len(golden) != len(pages):
+        sys.exit(f"corpus has {len(pages)} entries but golden file has {len(golden)}; "
+                 "re-run with --regenerate if the corpus sources changed")
+    mismatches = [i for i, (p, h) in enumerate(zip(pages, golden)) if sha(clean_deed_text(p)) != h]
+    print(f"golden: {len(pages)} texts, {len(mismatches)} mismatches {mismatches[:10]}")
+
+    old = pages_per_sec(lambda ps: [legacy_clean_deed_text(p) for p in ps], pages)
+    new = pages_per_sec(clean_deed_pages, pages)
+    print(f"clean_deed_text: {old:,.0f} pages/sec original, {new:,.0f} pages/sec current "
+          f"({new / old:.2f}x)")
+
+    bearings = ["North 10 degrees 2 minutes 3 seconds East", "SOUTH 76°36'01\" WEST",
+                "N 89°31'26\" E"] * 10000
+    t = time.perf_counter()
+    for b in bearings:
+        format_bearing(b)
+    print(f"format_bearing: {len(bearings) / (time.perf_counter() - t):,.0f} bearings/sec")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
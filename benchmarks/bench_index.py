@@ -0,0 +1,182 @@
+"""
+Build and query timings for parcel_index.
+
+Lays out a grid of adjoining lots at state plane magnitudes (jittered
+corners shared between neighbours, each side split into two calls, call
+text drawn from the recorded segment pool), writes them as batch JSONL
+files, indexes them, and times the queries the index exists for: corners
+near a point, calls mentioning a monument, and a lot's adjoiners.  Also
+checks that re-adding unchanged files is a no-op, that a rewritten file
+replaces its documents, and that a document name repeated in another file
+is indexed as a second document.
+
+    python benchmarks/bench_index.py [--segments 300000] [--queries 500]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_traverse import bearing_text
+from fakes import load_recordings, load_segment_pool
+from parcel_index import ParcelIndex, phrase
+
+BASE_NORTH = 10_400_000.0
+BASE_EAST = 3_100_000.0
+LOT = 250.0
+# segments per lot: a point of beginning and two calls per side
+LOT_SEGMENTS = 9
+
+
+def grid(rng, rows, cols):
+    return [[(BASE_NORTH - r * LOT + rng.uniform(-20, 20), BASE_EAST + c * LOT + rng.uniform(-20, 20))
+             for c in range(cols + 1)] for r in range(rows + 1)]
+
+
+def call(rng, pool, start, end, last):
+    dn, de = end[0] - start[0], end[1] - start[1]
+    source = rng.choice(pool)
+    return {"callType": "line", "locationDescription": "POINT OF BEGINNING" if last else None,
+            "bearing": bearing_text(math.degrees(math.atan2(de, dn))),
+            "distance": round(math.hypot(dn, de), 2), "unit": "feet",
+            "monument": source.get("monument"), "description": source.get("description")}
+
+
+def lot_segments(rng, pool, points, r, c):
+    """Segments for lot (r, c), clockwise from its north-west corner."""
+    ring = [points[r][c], points[r][c + 1], points[r + 1][c + 1], points[r + 1][c]]
+    segments = [{"callType": "point", "locationDescription": "BEGINNING", "bearing": None,
+                 "distance": None, "unit": None, "baseNorth": round(ring[0][0], 3),
+                 "baseEast": round(ring[0][1], 3), "monument": "1/2\" IRON ROD FOUND"}]
+    for i, start in enumerate(ring):
+        end = ring[(i + 1) % 4]
+        middle = ((start[0] + end[0]) / 2, (start[1] + end[1]) / 2)
+        segments.append(call(rng, pool, start, middle, False))
+        segments.append(call(rng, pool, middle, end, i == 3))
+    return segments
+
+
+def write_corpus(directory, rng, pool, rows, cols, per_file):
+    points = grid(rng, rows, cols)
+    paths = []
+    lots = [(r, c) for r in range(rows) for c in range(cols)]
+    for start in range(0, len(lots), per_file):
+        path = os.path.join(directory, f"part-{start // per_file:05d}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for r, c in lots[start:start + per_file]:
+                completion = json.dumps({"segments": lot_segments(rng, pool, points, r, c)})
+                f.write(json.dumps({"document": f"lot-{r}-{c}.pdf", "chunk": 0,
+                                    "completion": completion}) + "\n")
+        paths.append(path)
+    return points, paths
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, 1000 * (time.perf_counter() - start)
+
+
+def summary(label, millis):
+    millis = sorted(millis)
+    print(f"{label:<40} median {statistics.median(millis):6.2f} ms   "
+          f"p99 {millis[int(0.99 * (len(millis) - 1))]:6.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--segments", type=int, default=300_000)
+    parser.add_argument("--per-file", type=int, default=200, help="documents per JSONL file")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    pool = [s for s in load_segment_pool(load_recordings()) if s.get("monument") or s.get("description")]
+    side = max(1, math.isqrt(args.segments // LOT_SEGMENTS))
+    with tempfile.TemporaryDirectory() as tmp:
+        points, paths = write_corpus(tmp, rng, pool, side, side, args.per_file)
+        index = ParcelIndex(os.path.join(tmp, "parcels.sqlite"))
+        try:
+            start = time.perf_counter()
+            documents = sum(index.add_file(path) for path in paths)
+            built = time.perf_counter() - start
+            stats = index.stats()
+            print(f"{documents} documents, {stats['segments']} segments, {stats['corners']} corners "
+                  f"indexed in {built:.1f}s ({stats['segments'] / built:,.0f} segments/s)")
+
+            again, millis = timed(lambda: sum(index.add_file(path) for path in paths))
+            print(f"re-add unchanged files: {again} documents in {millis:.0f} ms")
+            with open(paths[0], "a", encoding="utf-8"):
+                pass
+            os.utime(paths[0])
+            replaced, millis = timed(index.add_file, paths[0])
+            assert index.stats()["segments"] == stats["segments"], "re-index duplicated rows"
+            print(f"re-add touched file: {replaced} documents replaced in {millis:.0f} ms")
+
+            # the same PDF basename from another folder is another document,
+            # and emptying its file drops it again
+            twin = os.path.join(tmp, "twin.jsonl")
+            with open(paths[0], encoding="utf-8") as f:
+                line = f.readline()
+            with open(twin, "w", encoding="utf-8") as f:
+                f.write(line)
+            index.add_file(twin)
+            name = json.loads(line)["document"]
+            assert index.stats()["documents"] == stats["documents"] + 1, "documents collided"
+            try:
+                index.adjoining(name)
+                raise AssertionError("a name indexed from two files was not ambiguous")
+            except ValueError:
+                pass
+            open(twin, "w").close()
+            os.utime(twin, ns=(0, 0))
+            index.add_file(twin)
+            assert index.stats()["documents"] == stats["documents"], "emptied file kept documents"
+            print("same name from another file: indexed separately")
+
+            near, missed = [], 0
+            for _ in range(args.queries):
+                r, c = rng.randint(1, side - 1), rng.randint(1, side - 1)
+                north, east = points[r][c]
+                hits, millis = timed(index.corners_near, north + rng.uniform(-0.5, 0.5),
+                                     east + rng.uniform(-0.5, 0.5), 1.0)
+                near.append(millis)
+                # an interior grid point is a corner of the four lots around it
+                missed += len({h.document for h in hits}) != 4
+            summary("corners within 1 ft", near)
+            print(f"  interior points without exactly 4 lots: {missed}")
+
+            for text in ("iron rod", "galvanized pipe", "aluminum disk"):
+                count = len(index.search(phrase(text), 10 ** 9))
+                for ranked in (False, True):
+                    timings = [timed(index.search, phrase(text), 100, ranked)[1] for _ in range(20)]
+                    summary(f"first 100 of {count} {text!r}{' ranked' if ranked else ''}", timings)
+
+            adjoin = []
+            for _ in range(args.queries // 5):
+                r, c = rng.randint(1, side - 2), rng.randint(1, side - 2)
+                hits, millis = timed(index.adjoining, f"lot-{r}-{c}.pdf", 0, 1.0)
+                adjoin.append(millis)
+                # edge and diagonal neighbours
+                assert len(hits) == 8, hits
+            summary("adjoining lots", adjoin)
+
+            box = [timed(index.parcels_near, *points[rng.randint(0, side)][rng.randint(0, side)], 50.0)[1]
+                   for _ in range(args.queries)]
+            summary("parcels within 50 ft", box)
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Offline end-to-end benchmark of the extraction pipeline.
+
+Every document goes through iter_document: render, OCR, lines, clean, page
+filter, chunking, fast-path parse, LLM and normalization, with the
+inventory clause extracted alongside.  fakes.FakeTextract and
+fakes.FakeOpenAI stand in for AWS and OpenAI, with the latency given on
+the command line; asynchronous Textract jobs read their uploads from
+fakes.FakeS3.  The corpus is the sample PDFs plus synthetic packets built
+by repeating their pages up to each --scale page count.
+
+Reported per corpus: docs/s, pages/s, peak RSS, and per-stage latency
+percentiles from the instrument hooks.  Everything is written as JSON
+(--out) so runs can be compared; --baseline prints the change against an
+earlier result file.  Caches are off unless --warm, which gives each
+corpus fresh caches and runs it twice: cold, then warm.
+
+    python benchmarks/bench_pipeline.py [--scale 30 --scale 120] [--ocr-latency 0.4]
+        [--llm-latency 1.0] [--out result.json] [--baseline previous.json]
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import FakeOpenAI, FakeS3, FakeTextract
+from cache import LlmCache, OcrCache
+from chunk_pdf import (ADAPTIVE_RENDER, FIXED_RENDER, OCR_MODES, iter_document, select_ocr,
+                       use_clients)
+from instrument import recording
+from ocr import TextractJobOCR, TextractOCR
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+PERCENTILES = (50, 90, 99)
+
+
+def sample_pdfs():
+    return sorted(glob.glob(os.path.join(ROOT, "*.pdf"))
+                  + glob.glob(os.path.join(ROOT, "*", "*.pdf")))
+
+
+def build_scaled(sources, pages, out_dir):
+    """A synthetic packet of `pages` pages, cycling through the pages of `sources`."""
+    path = os.path.join(out_dir, f"synthetic-{pages}.pdf")
+    with fitz.open() as packet:
+        while packet.page_count < pages:
+            for source in sources:
+                with fitz.open(source) as doc:
+                    take = min(doc.page_count, pages - packet.page_count)
+                    packet.insert_pdf(doc, to_page=take - 1)
+                if packet.page_count >= pages:
+                    break
+        packet.save(path)
+    return path
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return {"self": round(own / 2**20, 1), "children": round(children / 2**20, 1)}
+
+
+def percentile(ordered, p):
+    # nearest rank
+    return ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))]
+
+
+def stage_stats(spans):
+    by_stage = {}
+    for span in spans:
+        by_stage.setdefault(span.name, []).append(span.seconds)
+    stats = {}
+    for name, seconds in by_stage.items():
+        seconds.sort()
+        stats[name] = {"count": len(seconds), "total_s": round(sum(seconds), 4)}
+        for p in PERCENTILES:
+            stats[name][f"p{p}_ms"] = round(1000 * percentile(seconds, p), 3)
+        stats[name]["max_ms"] = round(1000 * seconds[-1], 3)
+    return stats
+
+
+def run_corpus(paths, args, textract, s3, ocr_cache=None, llm_cache=None):
+    policy = ADAPTIVE_RENDER if args.render == "adaptive" else FIXED_RENDER
+    sync = TextractOCR(textract, tps=args.ocr_tps or None)
+    job = TextractJobOCR(textract, s3, poll=args.job_poll, tps=args.ocr_tps or None)
+    documents = []
+    spans = []
+    pages_total = 0
+    start = time.perf_counter()
+    for path in paths:
+        page_reports = []
+        chunks = segments = 0
+        doc_start = time.perf_counter()
+        ocr = select_ocr(path, sync, job, args.ocr)
+        inventory = None if args.no_inventory else {}
+        with recording(os.path.basename(path)) as recorder:
+            for _, segs in iter_document(path, ocr_cache, llm_cache,
+                                         render_workers=args.render_workers,
+                                         policy=policy, page_reports=page_reports,
+                                         log=None, ocr=ocr, inventory=inventory):
+                chunks += 1
+                segments += len(segs)
+        seconds = time.perf_counter() - doc_start
+        spans.extend(recorder.spans)
+        pages_total += len(page_reports)
+        documents.append({"document": os.path.basename(path), "pages": len(page_reports),
+                          "chunks": chunks, "segments": segments,
+                          "seconds": round(seconds, 4)})
+        print(f"  {os.path.basename(path)[:48]:<48} {len(page_reports):>4} pages "
+              f"{chunks:>3} chunks {segments:>4} segments {seconds:7.2f}s")
+    elapsed = time.perf_counter() - start
+    return {
+        "docs": len(documents),
+        "pages": pages_total,
+        "seconds": round(elapsed, 4),
+        "docs_per_s": round(len(documents) / elapsed, 4),
+        "pages_per_s": round(pages_total / elapsed, 4),
+        "stages": stage_stats(spans),
+        "documents": documents,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline):
+    """Print headline metrics against an earlier result file."""
+    def line(label, now, before, higher_is_better):
+        if now is None or not before:
+            return
+        ratio = now / before
+        better = ratio > 1 if higher_is_better else ratio < 1
+        print(f"  {label:<32} {before:>10.3f} -> {now:>10.3f}  "
+              f"({ratio:.2f}x, {'better' if better else 'worse' if ratio != 1 else 'same'})")
+
+    print(f"against {baseline.get('commit') or 'baseline'}:")
+    for name, run in result["runs"].items():
+        base = baseline.get("runs", {}).get(name)
+        if not base:
+            continue
+        line(f"{name} docs/s", run["docs_per_s"], base["docs_per_s"], True)
+        line(f"{name} pages/s", run["pages_per_s"], base["pages_per_s"], True)
+        for stage, stats in run["stages"].items():
+            before = base["stages"].get(stage)
+            if before:
+                line(f"{name} {stage} p50 ms", stats["p50_ms"], before["p50_ms"], False)
+                line(f"{name} {stage} p99 ms", stats["p99_ms"], before["p99_ms"], False)
+    now_rss, base_rss = result["peak_rss_mb"], baseline.get("peak_rss_mb")
+    if now_rss and base_rss:
+        line("peak RSS MB", now_rss["self"], base_rss["self"], False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdfs", nargs="*", help="PDFs to run (default: the sample PDFs)")
+    parser.add_argument("--scale", type=int, action="append", default=[],
+                        help="also run a synthetic packet of this many pages (repeatable)")
+    parser.add_argument("--ocr-latency", type=float, default=0.0,
+                        help="seconds per Textract request")
+    parser.add_argument("--ocr-per-mb", type=float, default=0.0,
+                        help="extra Textract seconds per MB uploaded")
+    parser.add_argument("--ocr-tps", type=float, default=0.0,
+                        help="Textract rate limit; 0 (default) disables the token bucket")
+    parser.add_argument("--ocr", choices=OCR_MODES, default="auto",
+                        help="Textract backend: per-page synchronous calls, one asynchronous "
+                             "job per document, or chosen by page count and size (default)")
+    parser.add_argument("--job-polls", type=int, default=1,
+                        help="IN_PROGRESS answers before an asynchronous job succeeds")
+    parser.add_argument("--job-poll", type=float, default=0.0,
+                        help="seconds between asynchronous job polls")
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="seconds per LLM request")
+    parser.add_argument("--llm-per-token", type=float, default=0.0,
+                        help="extra LLM seconds per completion token")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="scale every injected latency by a random factor in [1-j, 1+j]")
+    parser.add_argument("--render", choices=("adaptive", "fixed"), default="adaptive")
+    parser.add_argument("--render-workers", type=int, default=2)
+    parser.add_argument("--no-inventory", action="store_true",
+                        help="leave out the concurrent inventory-clause branch")
+    parser.add_argument("--warm", action="store_true",
+                        help="run the corpus again against the caches the first pass filled")
+    parser.add_argument("--out", help="write the result JSON here")
+    parser.add_argument("--baseline", help="earlier result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    s3 = FakeS3()
+    textract = FakeTextract(latency=args.ocr_latency, per_mb=args.ocr_per_mb, jitter=args.jitter,
+                            s3=s3, job_polls=args.job_polls)
+    llm = FakeOpenAI(latency=args.llm_latency, per_token=args.llm_per_token, jitter=args.jitter)
+    use_clients(llm=llm, textract=textract, s3=s3)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = args.pdfs or sample_pdfs()
+        corpora = {"sample": paths}
+        for pages in args.scale:
+            corpora[f"scaled-{pages}"] = [build_scaled(paths, pages, tmp)]
+
+        runs = {}
+        for name, corpus in corpora.items():
+            print(f"{name}:")
+            if not args.warm:
+                runs[name] = run_corpus(corpus, args, textract, s3)
+                continue
+            # fresh caches per corpus, so the cold pass really is cold
+            ocr_cache = OcrCache(os.path.join(tmp, f"{name}-ocr.sqlite"))
+            llm_cache = LlmCache(os.path.join(tmp, f"{name}-llm.sqlite"))
+            try:
+                runs[name] = run_corpus(corpus, args, textract, s3, ocr_cache, llm_cache)
+                print(f"{name} (warm):")
+                runs[f"{name}-warm"] = run_corpus(corpus, args, textract, s3, ocr_cache, llm_cache)
+            finally:
+                ocr_cache.close()
+                llm_cache.close()
+
+    result = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "peak_rss_mb": peak_rss_mb(),
+        "textract_calls": textract.calls,
+        "llm_calls": llm.calls,
+        "runs": runs,
+    }
+
+    print()
+    for name, run in runs.items():
+        print(f"{name:<20} {run['docs']:>4} docs {run['pages']:>5} pages {run['seconds']:8.2f}s  "
+              f"{run['docs_per_s']:7.3f} docs/s {run['pages_per_s']:8.2f} pages/s")
+        for stage, stats in run["stages"].items():
+            print(f"    {stage:<10} n={stats['count']:<5} "
+                  + " ".join(f"p{p}={stats[f'p{p}_ms']:.1f}ms" for p in PERCENTILES))
+    print(f"peak RSS: {result['peak_rss_mb']} MB; Textract calls {result['textract_calls']}, "
+          f"LLM calls {result['llm_calls']}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
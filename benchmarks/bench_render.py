@@ -0,0 +1,59 @@
+"""
+Render cost of the fixed and adaptive rasterization policies.
+
+Every page of the sample PDFs is rendered the way each policy renders it
+for the first OCR pass (fixed: 300 dpi RGB PNG; adaptive: grayscale at the
+policy's lower DPI), and the encoded size and render time are reported per
+page and in total.  The retry pass depends on Textract's confidences, so it
+is not part of this offline comparison.
+
+    python benchmarks/bench_render.py [PDF ...]
+"""
+import argparse
+import glob
+import os
+import sys
+
+import fitz
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chunk_pdf import ADAPTIVE_RENDER, FIXED_RENDER, render_for_ocr
+
+
+def sample_pdfs():
+    return sorted(glob.glob(os.path.join(ROOT, "*.pdf"))
+                  + glob.glob(os.path.join(ROOT, "*", "*.pdf")))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdfs", nargs="*", help="PDFs to render (default: the sample PDFs)")
+    args = parser.parse_args(argv)
+
+    policies = (("fixed", FIXED_RENDER), ("adaptive", ADAPTIVE_RENDER))
+    totals = {name: [0, 0.0] for name, _ in policies}
+    print(f"{'page':<48} " + "  ".join(f"{name + ' KB':>12} {name + ' s':>11}" for name, _ in policies))
+    for path in args.pdfs or sample_pdfs():
+        with fitz.open(path) as doc:
+            for page in doc:
+                row = []
+                for name, policy in policies:
+                    image, dpi, seconds = render_for_ocr(page, policy)
+                    totals[name][0] += len(image)
+                    totals[name][1] += seconds
+                    row.append(f"{len(image) / 1024:>12.0f} {seconds:>11.3f}")
+                label = f"{os.path.basename(path)[:40]} p{page.number + 1}"
+                print(f"{label:<48} " + "  ".join(row))
+
+    (fixed_bytes, fixed_s), (adaptive_bytes, adaptive_s) = totals["fixed"], totals["adaptive"]
+    print()
+    print(f"fixed:    {fixed_bytes / 1e6:8.1f} MB  {fixed_s:7.2f} s")
+    print(f"adaptive: {adaptive_bytes / 1e6:8.1f} MB  {adaptive_s:7.2f} s")
+    print(f"bytes {fixed_bytes / max(adaptive_bytes, 1):.1f}x smaller, "
+          f"render {fixed_s / max(adaptive_s, 1e-9):.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Offline check of TextractOCR's rate limit, retries and ordering against a
+throttling FakeTextract.
+
+Runs on a fake clock (sleep advances it, nothing actually waits):
+
+  * TokenBucket at a rate whose interval isn't a binary fraction keeps to
+    the rate and sleeps exactly once per throttled acquire
+  * paced at the fake's quota, no call is throttled
+  * paced at twice the quota, or with a fraction of calls throttled at
+    random, every throttled call is retried and every page still comes
+    back with its own text
+  * at no point does any one-second window hold more accepted calls than
+    the quota
+
+then once more on the real clock with several pages in flight, paced at
+twice the quota, to check that concurrent pages still come back in input
+order.
+
+    python benchmarks/bench_textract_rate.py [--pages 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from bisect import bisect_right
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import RATE_SLACK, FakeClock, FakeTextract
+from ocr import TextractOCR, TokenBucket
+
+
+def busiest_second(times):
+    """The most calls in any window (t - 1, t] of the sorted `times`."""
+    return max((i - bisect_right(times, t - 1.0 + RATE_SLACK) + 1 for i, t in enumerate(times)
+                if i == len(times) - 1 or times[i + 1] != t), default=0)
+
+
+def images(count):
+    return [f"page {n}".encode() for n in range(count)]
+
+
+def check_order(fake, pages, results):
+    expected = [fake._page_text(image).split() for image in pages]
+    got = [[b["Text"] for b in blocks if b["BlockType"] == "WORD"] for blocks in results]
+    assert got == expected, "pages came back out of order or with the wrong text"
+
+
+def check_bucket(acquires):
+    clock = FakeClock()
+    bucket = TokenBucket(3.0, clock=clock, sleep=clock.sleep)
+    for _ in range(acquires):
+        bucket.acquire()
+    # one sleep per acquire after the first, none of them a rounding crumb
+    assert len(clock.sleeps) == acquires - 1, len(clock.sleeps)
+    assert min(clock.sleeps) > 0.3, min(clock.sleeps)
+    print(f"bucket at 3/s: {acquires} acquires in {clock.now:.2f} fake s, "
+          f"{len(clock.sleeps)} sleeps, shortest {min(clock.sleeps):.4f}s")
+
+
+def run_fake_clock(label, pages, tps, quota, throttle, seed):
+    clock = FakeClock()
+    fake = FakeTextract(max_tps=quota, throttle=throttle, seed=seed, clock=clock)
+    ocr = TextractOCR(fake, max_in_flight=1, tps=tps, max_attempts=20,
+                      clock=clock, sleep=clock.sleep, rng=random.Random(seed).random)
+    pages = images(pages)
+    results = list(ocr.map(pages))
+    check_order(fake, pages, results)
+    assert ocr.retries == fake.throttled, (ocr.retries, fake.throttled)
+    assert ocr.calls == fake.calls == len(pages) + fake.throttled
+    busiest = busiest_second(fake.accepted)
+    if quota is not None:
+        assert busiest <= quota, busiest
+    print(f"{label:<32} {fake.throttled:4} throttled, {ocr.retries:4} retries, "
+          f"busiest second {busiest}, {len(pages) / clock.now:5.2f} pages/fake s")
+    return fake
+
+
+def run_real_clock(pages, in_flight, tps, quota, seed):
+    fake = FakeTextract(latency=0.02, jitter=0.9, seed=seed, max_tps=quota)
+    ocr = TextractOCR(fake, max_in_flight=in_flight, tps=tps, base_delay=0.01,
+                      max_attempts=20, rng=random.Random(seed).random)
+    pages = images(pages)
+    start = time.perf_counter()
+    results = list(ocr.map(pages))
+    seconds = time.perf_counter() - start
+    check_order(fake, pages, results)
+    assert ocr.retries == fake.throttled
+    print(f"real clock, {in_flight} in flight at {tps:g}/s against {quota:g}/s: "
+          f"{len(pages)} pages in order in {seconds:.2f}s, {fake.throttled} throttled, "
+          f"busiest second {busiest_second(fake.accepted)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--quota", type=float, default=5.0, help="fake Textract TPS")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    check_bucket(args.pages)
+    clean = run_fake_clock("paced at the quota", args.pages, args.quota, args.quota, 0.0, args.seed)
+    assert clean.throttled == 0, "pacing at the quota was throttled"
+    run_fake_clock("paced at twice the quota", args.pages, 2 * args.quota, args.quota, 0.0,
+                   args.seed)
+    run_fake_clock("unpaced, 30% throttled", args.pages, None, None, 0.3, args.seed)
+    run_real_clock(args.pages, 4, 20 * args.quota, 10 * args.quota, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Throughput and memory check for training_corpus.build_corpus.
+
+Writes a synthetic corpus: prompts from the recorded examples with a
+varying lot/volume number so most are distinct, completions from the
+segment pool, a --duplicates fraction repeated with different whitespace
+and quoting, and a --invalid fraction with a broken field.  Half goes to
+batch-style JSONL and half to one JSON array of chat transcripts (the
+TrainingMaterials layout), so both readers stream.  Reports examples/s,
+the counts build_corpus returns against what was planted, and resident
+memory as the run progresses, which should stay flat.
+
+    python benchmarks/bench_training_corpus.py [--examples 1000000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import load_recordings, load_segment_pool
+from schema_function import SYSTEM_PROMPT_LINES
+from training_corpus import build_corpus, fill_defaults, validate_completion
+
+
+def rss_mb():
+    # current (not peak) resident set size; Linux only
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def valid(segment):
+    completion = {"segments": [dict(segment)]}
+    fill_defaults(completion)
+    return not validate_completion(completion)
+
+
+def synthetic_examples(rng, recordings, pool, count, duplicates, invalid):
+    """(prompt, completion text, kind) with kind "unique", "duplicate" or "invalid"."""
+    recent = []
+    for n in range(count):
+        roll = rng.random()
+        if roll < duplicates and recent:
+            prompt, completion = rng.choice(recent)
+            # same prompt once normalized
+            prompt = "  " + prompt.replace(" ", "  ", 3).replace('"', "”", 1).upper()
+            yield prompt, completion, "duplicate"
+            continue
+        base, _ = rng.choice(recordings)
+        prompt = f"Lot {n}, Block {rng.randint(1, 99)}, Volume {rng.randint(1, 3000)}: {base[:400]}"
+        segments = [dict(rng.choice(pool)) for _ in range(rng.randint(1, 8))]
+        kind = "unique"
+        if roll > 1 - invalid:
+            segments[0]["distance"] = "two hundred feet"
+            kind = "invalid"
+        completion = json.dumps({"segments": segments}, ensure_ascii=False)
+        if kind == "unique":
+            recent.append((prompt, completion))
+            if len(recent) > 1000:
+                recent.pop(rng.randrange(len(recent)))
+        yield prompt, completion, kind
+
+
+def write_inputs(directory, examples):
+    # alternate records between a batch JSONL and a JSON array of chat transcripts
+    planted = {"unique": 0, "duplicate": 0, "invalid": 0}
+    jsonl = os.path.join(directory, "run.jsonl")
+    array = os.path.join(directory, "chats.json")
+    with open(jsonl, "w", encoding="utf-8") as lines, open(array, "w", encoding="utf-8") as chats:
+        chats.write("[\n")
+        first = True
+        for n, (prompt, completion, kind) in enumerate(examples):
+            planted[kind] += 1
+            if n % 2:
+                lines.write(json.dumps({"document": "synthetic.pdf", "chunk": n, "prompt": prompt,
+                                        "completion": completion}, ensure_ascii=False) + "\n")
+            else:
+                chats.write(("" if first else ",\n") + json.dumps(
+                    [{"role": "system", "content": SYSTEM_PROMPT_LINES},
+                     {"role": "user", "content": prompt},
+                     {"role": "assistant", "content": completion}], ensure_ascii=False))
+                first = False
+        chats.write("\n]\n")
+    return [jsonl, array], planted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--examples", type=int, default=1_000_000)
+    parser.add_argument("--duplicates", type=float, default=0.1)
+    parser.add_argument("--invalid", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    recordings = load_recordings()
+    # segments that are valid on their own, so only planted examples fail
+    pool = [s for s in load_segment_pool(recordings) if valid(s)]
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        paths, planted = write_inputs(tmp, synthetic_examples(
+            rng, recordings, pool, args.examples, args.duplicates, args.invalid))
+        size = sum(os.path.getsize(p) for p in paths)
+        print(f"wrote {args.examples:,} examples ({size / 1e6:,.0f} MB) in "
+              f"{time.perf_counter() - start:.1f}s: {planted}")
+
+        memory = []
+        start = time.perf_counter()
+        counts, kinds = build_corpus(paths, os.path.join(tmp, "corpus"),
+                                     log=lambda message: memory.append((message, rss_mb())))
+        seconds = time.perf_counter() - start
+        print(f"built in {seconds:.1f}s ({counts['read'] / seconds:,.0f} examples/s): {dict(counts)}")
+        print(f"planted duplicates {planted['duplicate']:,}, found {counts['duplicate']:,}; "
+              f"planted invalid {planted['invalid']:,}, found {counts['invalid']:,}")
+        samples = memory[::max(1, len(memory) // 10)]
+        for message, rss in samples + [m for m in memory[-1:] if m is not samples[-1]]:
+            print(f"  {message:<32} RSS {rss:6.1f} MB" if rss else f"  {message}")
+        for kind, n in kinds.most_common(3):
+            print(f"  {n:6,}  {kind}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Throughput and correctness check for traverse.solve.
+
+Builds synthetic parcels: random convex polygons written out as segments
+the way the extractor returns them (quadrant bearings to the second, feet
+or chains, an occasional curve on a chord), with a few deliberately
+mis-typed distances.  Reports parcels/s for parse + solve, the worst area
+error against the exact polygon, and whether exactly the corrupted parcels
+were flagged.
+
+    python benchmarks/bench_traverse.py [--parcels 5000] [--courses 12]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from traverse import parse_parcel, solve_parcels
+
+
+def bearing_text(azimuth):
+    # azimuth in degrees -> "N 12°34'56\" E", rounded to the second
+    azimuth %= 360
+    if azimuth < 90:
+        ns, theta, ew = "N", azimuth, "E"
+    elif azimuth < 180:
+        ns, theta, ew = "S", 180 - azimuth, "E"
+    elif azimuth < 270:
+        ns, theta, ew = "S", azimuth - 180, "W"
+    else:
+        ns, theta, ew = "N", 360 - azimuth, "W"
+    total = round(theta * 3600)
+    return f"{ns} {total // 3600}°{total // 60 % 60:02d}'{total % 60:02d}\" {ew}"
+
+
+def synthetic_parcel(rng, courses, corrupt):
+    """(segments, exact area in sq ft) for a random convex polygon traversed clockwise."""
+    angles = sorted(rng.uniform(0, 2 * math.pi) for _ in range(courses))
+    radius = rng.uniform(200, 3000)
+    points = [(radius * math.cos(a), radius * math.sin(a)) for a in reversed(angles)]
+    area = 0.5 * abs(sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1)
+                         in zip(points, points[1:] + points[:1])))
+    chains = rng.random() < 0.2
+    segments = [{"callType": "point", "locationDescription": "BEGINNING", "bearing": None,
+                 "distance": None, "unit": None, "baseNorth": 10000.0, "baseEast": 5000.0}]
+    for i, ((x0, y0), (x1, y1)) in enumerate(zip(points, points[1:] + points[:1])):
+        de, dn = x1 - x0, y1 - y0
+        length = math.hypot(de, dn)
+        distance = round(length / 66, 4) if chains else round(length, 2)
+        if corrupt and i == 0:
+            distance *= 1.1
+        segment = {"callType": "line", "locationDescription": None,
+                   "bearing": bearing_text(math.degrees(math.atan2(de, dn))),
+                   "distance": distance, "unit": "chains" if chains else "feet"}
+        if i == courses - 1:
+            segment["locationDescription"] = "POINT OF BEGINNING"
+        elif not chains and rng.random() < 0.1:
+            # a shallow curve on this chord, bulging outward: the traverse
+            # runs clockwise, so that is a curve to the right
+            delta = rng.uniform(0.05, 0.5)
+            r = length / (2 * math.sin(delta / 2))
+            area += r * r / 2 * (delta - math.sin(delta))
+            segment.update(callType="curve", radius=f"{r:.4f} feet",
+                           angle=f"{math.degrees(delta):.8f}", direction="right")
+        segments.append(segment)
+    return segments, area
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--parcels", type=int, default=5000)
+    parser.add_argument("--courses", type=int, default=12)
+    parser.add_argument("--corrupt", type=float, default=0.05,
+                        help="fraction of parcels with one mis-typed distance")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    corrupted = np.array([rng.random() < args.corrupt for _ in range(args.parcels)])
+    data = [synthetic_parcel(rng, rng.randint(4, 2 * args.courses - 4), corrupt)
+            for corrupt in corrupted]
+    segment_lists = [segments for segments, _ in data]
+    exact = np.array([area for _, area in data])
+
+    start = time.perf_counter()
+    parcels = [parse_parcel(segments) for segments in segment_lists]
+    parsed = time.perf_counter()
+    result = solve_parcels(parcels)
+    solved = time.perf_counter()
+
+    flagged = np.array([bool(flags) for flags in result.flags])
+    good = ~flagged
+    error = np.abs(result.area[good] - exact[good]) / exact[good]
+    courses = sum(len(p.courses) for p in parcels)
+    print(f"{args.parcels} parcels, {courses} courses")
+    print(f"parse:  {parsed - start:7.3f}s")
+    print(f"solve:  {solved - parsed:7.3f}s (vectorized)")
+    print(f"total:  {args.parcels / (solved - start):,.0f} parcels/s")
+    print(f"flagged {flagged.sum()} parcels; {corrupted.sum()} were corrupted, "
+          f"{(flagged & corrupted).sum()} of them flagged")
+    print(f"worst relative area error on unflagged parcels: {error.max():.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Micro-benchmark and equivalence check for chunk_pdf.words_to_lines.
+
+Builds synthetic dense Textract pages (thousands of WORDs, hundreds of
+rows, with LINE blocks and polygons like detect_document_text returns) and
+compares the current implementation against the original linear-scan one
+for speed and identical output.  The text-layer pages of the sample PDFs
+and any responses already in the OCR cache are checked for equivalence
+as well.
+
+    python benchmarks/bench_words_to_lines.py [--ocr-cache .cache/ocr.sqlite]
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+import fitz
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cache import OcrCache
+from chunk_pdf import text_layer_blocks, words_to_lines
+
+
+def legacy_words_to_lines(blocks, y_tol=0.005):
+    # the original implementation: linear scan over row keys per word
+    rows = defaultdict(list)
+    for b in blocks:
+        if b["BlockType"]!="WORD": continue
+        top = b["Geometry"]["BoundingBox"]["Top"]
+        key = next((k for k in rows if abs(k - top) < y_tol), None)
+        rows[key or top].append(b)
+    lines = []
+    for top in sorted(rows):
+        words = sorted(rows[top], key=lambda w: w["Geometry"]["BoundingBox"]["Left"])
+        lines.append(" ".join(w["Text"] for w in words))
+    return lines
+
+
+def row_tolerance(n_rows):
+    # dense pages need a tolerance below the row pitch; a quarter of it
+    return 0.25 * 0.9 / n_rows
+
+
+def synthetic_page(n_rows, words_per_row, skew=0.0, seed=0):
+    """A Textract-shaped page with LINE and WORD blocks in reading order."""
+    rng = random.Random(seed)
+    blocks = [{"BlockType": "PAGE", "Id": "page"}]
+    words = []
+    jitter = row_tolerance(n_rows) / 4
+    row_height = 0.9 / n_rows
+    word_width = 0.9 / words_per_row
+    for r in range(n_rows):
+        base = 0.05 + r * row_height
+        ids = []
+        for c in range(words_per_row):
+            left = 0.05 + c * word_width
+            top = base + skew * left + rng.uniform(-jitter, jitter)
+            wid = f"w{r}-{c}"
+            ids.append(wid)
+            words.append({
+                "BlockType": "WORD", "Id": wid, "Text": f"r{r}c{c}", "Confidence": 99.0,
+                "Geometry": {
+                    "BoundingBox": {"Left": left, "Top": top,
+                                    "Width": word_width * 0.8, "Height": row_height * 0.5},
+                    "Polygon": [{"X": left, "Y": top},
+                                {"X": left + word_width * 0.8, "Y": top + skew * word_width * 0.8}],
+                },
+            })
+        blocks.append({
+            "BlockType": "LINE", "Id": f"l{r}", "Text": "",
+            "Geometry": {"BoundingBox": {"Left": 0.05, "Top": base + skew * 0.05,
+                                         "Width": 0.9, "Height": row_height * 0.5}},
+            "Relationships": [{"Type": "CHILD", "Ids": ids}],
+        })
+    return blocks + words
+
+
+def best_of(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def check_equivalence(ocr_cache_path):
+    pages = [synthetic_page(rows, per_row, seed=rows)
+             for rows, per_row in ((40, 12), (120, 15), (300, 20))]
+    mismatches = 0
+    for blocks in pages:
+        y_tol = row_tolerance(sum(b["BlockType"] == "LINE" for b in blocks))
+        expected = legacy_words_to_lines(blocks, y_tol)
+        mismatches += words_to_lines(blocks, y_tol) != expected
+        mismatches += words_to_lines(blocks, y_tol, use_lines=True) != expected
+    checked = len(pages)
+
+    # real layouts: the text-layer pages of the sample PDFs in the repo
+    for path in glob.glob(os.path.join(ROOT, "**", "*.pdf"), recursive=True):
+        with fitz.open(path) as doc:
+            for page in doc:
+                blocks = text_layer_blocks(page)
+                if blocks is not None:
+                    checked += 1
+                    mismatches += words_to_lines(blocks) != legacy_words_to_lines(blocks)
+
+    if ocr_cache_path and os.path.exists(ocr_cache_path):
+        cache = OcrCache(ocr_cache_path)
+        for blocks in cache.values():
+            checked += 1
+            mismatches += words_to_lines(blocks) != legacy_words_to_lines(blocks)
+    print(f"equivalence: {checked} pages checked, {mismatches} mismatches")
+    return mismatches == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--ocr-cache", default=os.path.join(ROOT, ".cache", "ocr.sqlite"))
+    args = parser.parse_args()
+
+    ok = check_equivalence(args.ocr_cache)
+
+    print(f"{'words':>7} {'rows':>5} {'legacy ms':>10} {'sweep ms':>9} {'speedup':>8}")
+    for rows, per_row in ((50, 10), (150, 20), (300, 25), (500, 30)):
+        blocks = synthetic_page(rows, per_row, seed=1)
+        y_tol = row_tolerance(rows)
+        old = best_of(lambda: legacy_words_to_lines(blocks, y_tol))
+        new = best_of(lambda: words_to_lines(blocks, y_tol))
+        print(f"{rows * per_row:>7} {rows:>5} {old * 1e3:>10.1f} {new * 1e3:>9.1f} {old / new:>7.1f}x")
+
+    skewed = synthetic_page(100, 20, skew=0.02, seed=2)
+    y_tol = row_tolerance(100)
+    plain = words_to_lines(skewed, y_tol)
+    deskewed = words_to_lines(skewed, y_tol, deskew=True)
+    print(f"skewed page (2% slope, 100 rows): {len(plain)} rows plain, "
+          f"{len(deskewed)} rows with deskew")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Fast-path hit rate and accuracy of call_parser against the labelled
+examples in TrainingMaterials/training_fixed.jsonl.
+
+Each example's user prompt goes through clean_deed_text (as pages do in the
+pipeline) and then parse_chunk.  Reported:
+
+  * hit rate: calls the grammar resolved / all calls, and how many examples
+    would need no LLM call at all;
+  * accuracy: every parsed segment is matched to the labelled segment with
+    the same callType and distance, then bearing, unit, monument,
+    locationDescription and pointOfReference are compared.  Parsed segments
+    with no labelled counterpart count against precision.
+
+    python benchmarks/call_parser_report.py [--verbose]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, ROOT)
+
+from call_parser import parse_bearing, parse_chunk
+from chunk_pdf import clean_deed_text
+
+TRAINING = os.path.join(ROOT, "TrainingMaterials", "training_fixed.jsonl")
+
+FIELDS = ("bearing", "unit", "monument", "locationDescription", "pointOfReference")
+
+
+def load_examples(path=TRAINING):
+    # one JSON array of [system, user, assistant] message triples
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    for messages in data:
+        prompt = messages[1]["content"]
+        try:
+            labels = json.loads(messages[2]["content"]).get("segments", [])
+        except (ValueError, AttributeError):
+            # a few labels are truncated; they still count towards the hit rate
+            labels = None
+        yield prompt, labels
+
+
+def _words(text):
+    text = re.sub(r"[^a-z0-9/\"]+", " ", (text or "").lower())
+    return re.sub(r"^(?:a|an|the)\s+", "", text.strip())
+
+
+def _same_bearing(a, b):
+    pa, pb = parse_bearing(a), parse_bearing(b)
+    return pa is not None and pa == pb
+
+
+def _same_monument(a, b):
+    if b is None:
+        # unlabelled terminus; the parser's default stands in for it
+        return a == "a point"
+    a, b = _words(a), _words(b)
+    return a == b or bool(a and b and (a in b or b in a))
+
+
+def _same_location(a, b):
+    norm = lambda v: (v or "").upper().replace("PLACE OF", "POINT OF")
+    return norm(a) == norm(b) or bool(norm(a) and norm(a) in norm(b))
+
+
+def _same_reference(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return (_same_bearing(a.get("bearing"), b.get("bearing"))
+            and abs((a.get("distance") or 0) - (b.get("distance") or 0)) < 1e-6)
+
+
+def compare(parsed, label):
+    """Per-field agreement between a parsed segment and its labelled counterpart."""
+    return {
+        "bearing": (parsed["bearing"] is None and not label.get("bearing"))
+                   or _same_bearing(parsed["bearing"], label.get("bearing")),
+        "unit": (parsed["unit"] or "").lower() == (label.get("unit") or "").lower(),
+        "monument": _same_monument(parsed["monument"], label.get("monument")),
+        "locationDescription": _same_location(parsed["locationDescription"],
+                                              label.get("locationDescription")),
+        "pointOfReference": _same_reference(parsed["pointOfReference"],
+                                            label.get("pointOfReference")),
+    }
+
+
+def match(parsed, labels, used):
+    for i, label in enumerate(labels):
+        if i in used or label.get("callType") != parsed["callType"]:
+            continue
+        if parsed["distance"] is None:
+            if label.get("distance") is None and label.get("locationDescription"):
+                return i
+        elif label.get("distance") is not None and abs(label["distance"] - parsed["distance"]) < 1e-6:
+            return i
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="print every disagreement")
+    args = parser.parse_args(argv)
+
+    calls = parsed_calls = narrative = examples = full = 0
+    segments = matched = 0
+    agree = dict.fromkeys(FIELDS, 0)
+
+    for n, (prompt, labels) in enumerate(load_examples()):
+        runs = parse_chunk(clean_deed_text(prompt))
+        examples += 1
+        calls += sum(r.calls for r in runs)
+        parsed_calls += sum(r.calls for r in runs if r.segments is not None)
+        narrative += sum(r.calls for r in runs if r.segments == [])
+        full += all(r.segments is not None for r in runs)
+        if labels is None:
+            continue
+
+        used = set()
+        for run in runs:
+            for seg in run.segments or []:
+                segments += 1
+                i = match(seg, labels, used)
+                if i is None:
+                    if args.verbose:
+                        print(f"[{n}] unmatched: {seg['callType']} {seg['bearing']} {seg['distance']}")
+                    continue
+                used.add(i)
+                matched += 1
+                for field, ok in compare(seg, labels[i]).items():
+                    agree[field] += ok
+                    if not ok and args.verbose:
+                        print(f"[{n}] {field}: parsed {seg[field]!r} label {labels[i].get(field)!r}")
+
+    print(f"examples:           {examples}")
+    print(f"calls:              {calls}")
+    print(f"parsed (fast path): {parsed_calls} ({parsed_calls / max(calls, 1):.1%}), "
+          f"of which {narrative} narrative with no segment")
+    measured = calls - narrative
+    print(f"measured calls:     {parsed_calls - narrative}/{measured} parsed "
+          f"({(parsed_calls - narrative) / max(measured, 1):.1%})")
+    print(f"examples w/o LLM:   {full} ({full / max(examples, 1):.1%})")
+    print(f"parsed segments:    {segments}, matched to a label: {matched} "
+          f"({matched / max(segments, 1):.1%})")
+    for field in FIELDS:
+        print(f"  {field:<20} {agree[field]}/{matched} ({agree[field] / max(matched, 1):.1%})")
+
+
+if __name__ == "__main__":
+    main()
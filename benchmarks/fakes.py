@@ -0,0 +1,331 @@
+"""
+Local stand-ins for Textract and OpenAI, replaying recorded fixtures so
+the pipeline can run end to end with no credentials or network.
+
+FakeTextract answers detect_document_text with WORD and LINE blocks laid
+out from recorded deed text: the prompts in output.json and
+TrainingMaterials/training_fixed.jsonl.  The text is chosen by a hash of
+the page image, so the same page always OCRs the same way.
+
+FakeTextract also runs asynchronous text-detection jobs against FakeS3:
+the uploaded PDF's pages each get recorded text the same way, and
+results come back paginated with a Page number on every block, after a
+configurable number of IN_PROGRESS polls, ending in `job_status`
+(SUCCEEDED, or FAILED to exercise failure).  It can also throttle like the
+real service: calls beyond `max_tps` in any second, and a random
+`throttle` fraction of the rest, raise ThrottlingException.
+
+FakeOpenAI answers the extract_metes_bounds function call (and
+extract_inventory, with what the inventory regexes find).  A prompt that
+was recorded gets its recorded completion; any other prompt gets one
+recorded segment (from segments.json, output.json and the training
+completions) per call it contains.
+
+Both fakes sleep for a configurable latency, with optional jitter, to
+stand in for the service round trip.  FakeClock is a clock for the rate
+limiter and FakeTextract that only moves when slept on, so rate and
+backoff checks run instantly.
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from bisect import bisect_right, insort
+from types import SimpleNamespace
+
+import fitz
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from call_parser import split_calls
+from chunk_packer import count_tokens
+from inventory import regex_inventory
+
+# seconds; a call this close to a second after an earlier one is past it,
+# so a client paced at exactly max_tps on a summed clock isn't throttled
+# for the rounding in its timestamps
+RATE_SLACK = 1e-9
+
+TRAINING = os.path.join(ROOT, "TrainingMaterials", "training_fixed.jsonl")
+OUTPUT = os.path.join(ROOT, "output.json")
+SEGMENTS = os.path.join(ROOT, "segments.json")
+
+
+def _segments(completion):
+    try:
+        return json.loads(completion).get("segments", [])
+    except (ValueError, AttributeError):
+        # a few recorded completions are truncated
+        return []
+
+
+def load_recordings():
+    """[(prompt, segments)] from output.json and the training examples."""
+    recordings = []
+    with open(OUTPUT, encoding="utf-8") as f:
+        output = json.load(f)
+    recordings.append((output["prompt"], _segments(output["completion"])))
+    with open(TRAINING, encoding="utf-8") as f:
+        for messages in json.load(f):
+            recordings.append((messages[1]["content"], _segments(messages[2]["content"])))
+    return recordings
+
+
+def load_segment_pool(recordings):
+    with open(SEGMENTS, encoding="utf-8") as f:
+        pool = list(json.load(f).get("segments", []))
+    for _, segments in recordings:
+        pool.extend(segments)
+    return pool
+
+
+class _Latency:
+    # `seconds` per request plus `per_unit` per unit of work, each scaled by
+    # a uniform factor in [1 - jitter, 1 + jitter]
+    def __init__(self, seconds, per_unit=0.0, jitter=0.0, seed=0):
+        self.seconds = seconds
+        self.per_unit = per_unit
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self, units=0):
+        delay = self.seconds + self.per_unit * units
+        if self.jitter:
+            with self._lock:
+                delay *= 1 + self._rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps on it."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+
+class FakeClientError(Exception):
+    """botocore ClientError look-alike: the service error code is in .response."""
+
+    def __init__(self, code, message=""):
+        super().__init__(f"{code}: {message}")
+        self.response = {"Error": {"Code": code, "Message": message}}
+
+
+class FakeS3:
+    """boto3-style S3 client keeping objects in memory."""
+
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        with self._lock:
+            self.objects[Bucket, Key] = bytes(Body)
+        return {}
+
+    def get_object(self, Bucket, Key):
+        with self._lock:
+            if (Bucket, Key) not in self.objects:
+                raise FakeClientError("NoSuchKey", Key)
+            return {"Body": io.BytesIO(self.objects[Bucket, Key])}
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+
+def text_blocks(text, words_per_line=12):
+    """Textract-style WORD and LINE blocks laying `text` out top to bottom."""
+    words = text.split()
+    rows = [words[i:i + words_per_line] for i in range(0, len(words), words_per_line)]
+    pitch = 0.9 / max(len(rows), 1)
+    blocks = []
+    for r, row in enumerate(rows):
+        top = 0.05 + r * pitch
+        ids = []
+        for c, word in enumerate(row):
+            ids.append(f"w{r}-{c}")
+            blocks.append({
+                "BlockType": "WORD", "Id": ids[-1], "Text": word, "Confidence": 99.0,
+                "Geometry": {"BoundingBox": {"Left": 0.05 + c * 0.075, "Top": top,
+                                             "Width": 0.07, "Height": pitch * 0.6}},
+            })
+        blocks.append({
+            "BlockType": "LINE", "Id": f"l{r}", "Text": " ".join(row), "Confidence": 99.0,
+            "Geometry": {"BoundingBox": {"Left": 0.05, "Top": top,
+                                         "Width": 0.075 * len(row), "Height": pitch * 0.6}},
+            "Relationships": [{"Type": "CHILD", "Ids": ids}],
+        })
+    return blocks
+
+
+class FakeTextract:
+    """
+    boto3-style client with detect_document_text and the asynchronous
+    start/get_document_text_detection pair, replaying recorded page text.
+    Jobs read their document from `s3`, report IN_PROGRESS for the first
+    `job_polls` polls and then `job_status`.  Calls over `max_tps` in the second up to
+    `clock()`, and a seeded `throttle` fraction of the others, raise
+    ThrottlingException; `accepted` holds the clock time of every call
+    that went through and `throttled` counts the others.
+    """
+
+    def __init__(self, pages=None, latency=0.0, per_mb=0.0, jitter=0.0, seed=0,
+                 s3=None, job_polls=1, job_status="SUCCEEDED", max_tps=None, throttle=0.0,
+                 clock=time.monotonic):
+        self.pages = pages or [prompt for prompt, _ in load_recordings()]
+        self.latency = _Latency(latency, per_mb, jitter, seed)
+        self.s3 = s3
+        self.job_polls = job_polls
+        self.job_status = job_status
+        self.max_tps = max_tps
+        self.throttle = throttle
+        self.clock = clock
+        self.calls = 0
+        self.accepted = []
+        self.throttled = 0
+        self.jobs = {}
+        self._tokens = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        # count the call, or turn it away as the service would
+        with self._lock:
+            self.calls += 1
+            now = self.clock()
+            recent = len(self.accepted) - bisect_right(self.accepted, now - 1.0 + RATE_SLACK)
+            if ((self.max_tps is not None and recent >= self.max_tps)
+                    or (self.throttle and self._rng.random() < self.throttle)):
+                self.throttled += 1
+                raise FakeClientError("ThrottlingException", "Rate exceeded")
+            insort(self.accepted, now)
+
+    def _page_text(self, data):
+        index = int(hashlib.sha256(data).hexdigest()[:8], 16) % len(self.pages)
+        return self.pages[index]
+
+    def detect_document_text(self, Document):
+        image = Document["Bytes"]
+        self._admit()
+        self.latency.wait(len(image) / 1e6)
+        return {"Blocks": text_blocks(self._page_text(image))}
+
+    def start_document_text_detection(self, DocumentLocation, ClientRequestToken=None, **kwargs):
+        location = DocumentLocation["S3Object"]
+        data = self.s3.get_object(Bucket=location["Bucket"], Key=location["Name"])["Body"].read()
+        self._admit()
+        with self._lock:
+            if ClientRequestToken in self._tokens:
+                return {"JobId": self._tokens[ClientRequestToken]}
+        self.latency.wait(len(data) / 1e6)
+        if data.startswith(b"%PDF"):
+            with fitz.open("pdf", data) as doc:
+                # each page's text follows from its images and text
+                texts = [self._page_text(b"".join(doc.xref_stream_raw(image[0]) or b""
+                                                  for image in page.get_images())
+                                         + page.get_text().encode("utf-8")) for page in doc]
+        else:
+            texts = [self._page_text(data)]
+        blocks = []
+        for number, text in enumerate(texts, 1):
+            blocks.append({"BlockType": "PAGE", "Id": f"p{number}", "Page": number,
+                           "Geometry": {"BoundingBox": {"Left": 0.0, "Top": 0.0,
+                                                        "Width": 1.0, "Height": 1.0}}})
+            for block in text_blocks(text):
+                block["Id"] = f"p{number}-{block['Id']}"
+                for rel in block.get("Relationships", ()):
+                    rel["Ids"] = [f"p{number}-{i}" for i in rel["Ids"]]
+                block["Page"] = number
+                blocks.append(block)
+        with self._lock:
+            job_id = f"job-{len(self.jobs) + 1}"
+            self.jobs[job_id] = {"blocks": blocks, "pages": len(texts), "polls": 0}
+            if ClientRequestToken:
+                self._tokens[ClientRequestToken] = job_id
+        return {"JobId": job_id}
+
+    def get_document_text_detection(self, JobId, MaxResults=1000, NextToken=None):
+        self._admit()
+        with self._lock:
+            job = self.jobs.get(JobId)
+            if job is None:
+                raise FakeClientError("InvalidJobIdException", JobId)
+            job["polls"] += 1
+            if job["polls"] <= self.job_polls:
+                return {"JobStatus": "IN_PROGRESS"}
+        if self.job_status != "SUCCEEDED":
+            return {"JobStatus": self.job_status, "StatusMessage": "Request has invalid parameters"}
+        start = int(NextToken or 0)
+        resp = {"JobStatus": "SUCCEEDED", "DocumentMetadata": {"Pages": job["pages"]},
+                "Blocks": job["blocks"][start:start + MaxResults]}
+        if start + MaxResults < len(job["blocks"]):
+            resp["NextToken"] = str(start + MaxResults)
+        return resp
+
+
+class FakeOpenAI:
+    """OpenAI-style client answering extract_metes_bounds calls from recordings."""
+
+    def __init__(self, recordings=None, latency=0.0, per_token=0.0, jitter=0.0, seed=0):
+        recordings = recordings or load_recordings()
+        self.recorded = {" ".join(prompt.split()): segments for prompt, segments in recordings}
+        self.pool = load_segment_pool(recordings)
+        self.latency = _Latency(latency, per_token, jitter, seed)
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _answer(self, text):
+        segments = self.recorded.get(" ".join(text.split()))
+        if segments is not None:
+            return segments
+        calls = len(split_calls(text))
+        start = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        return [dict(self.pool[(start + i) % len(self.pool)]) for i in range(calls)]
+
+    def create(self, model, messages, functions=None, function_call=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        text = messages[-1]["content"]
+        if function_call and function_call["name"] == "extract_inventory":
+            # what the regexes find, with the unit and state a deed would spell out
+            fields = regex_inventory(text)
+            fields["acreageUnit"] = fields["acreageUnit"] or "acre"
+            fields["state"] = fields["state"] or "Texas"
+            arguments = json.dumps(fields, ensure_ascii=False)
+        else:
+            arguments = json.dumps({"segments": self._answer(text)}, ensure_ascii=False)
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        if functions:
+            prompt_tokens += count_tokens(json.dumps(functions))
+        completion_tokens = count_tokens(arguments)
+        self.latency.wait(completion_tokens)
+        message = SimpleNamespace(role="assistant", content=None,
+                                  function_call=SimpleNamespace(name=function_call and function_call["name"],
+                                                                arguments=arguments))
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, message=message, finish_reason="function_call")],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens),
+        )
@@ -0,0 +1,71 @@
+"""
+Page filter decisions for the labelled prompts and the sample PDFs.
+
+Every prompt in TrainingMaterials/training_fixed.jsonl holds a legal
+description, so any prompt the filter would skip is a false negative.  For
+the sample PDFs, pages with a usable text layer are scored offline; scanned
+pages have no text until Textract runs and are listed as such.
+
+    python benchmarks/page_filter_report.py [PDF ...]
+"""
+import argparse
+import glob
+import os
+import sys
+
+import fitz
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.call_parser_report import load_examples
+from chunk_pdf import clean_deed_text
+from page_filter import MIN_PAGE_SCORE, classify_page
+
+
+def sample_pdfs():
+    return sorted(glob.glob(os.path.join(ROOT, "*.pdf"))
+                  + glob.glob(os.path.join(ROOT, "*", "*.pdf")))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdfs", nargs="*", help="PDFs to score (default: the sample PDFs)")
+    parser.add_argument("--min-score", type=float, default=MIN_PAGE_SCORE)
+    args = parser.parse_args(argv)
+
+    scores = []
+    missed = 0
+    for n, (prompt, _) in enumerate(load_examples()):
+        decision = classify_page(0, clean_deed_text(prompt), min_score=args.min_score)
+        scores.append(decision.score)
+        if not decision.keep:
+            missed += 1
+            print(f"prompt {n}: would be skipped ({decision.reason})")
+    print(f"labelled prompts: {len(scores) - missed}/{len(scores)} kept, "
+          f"scores {min(scores):.1f}..{max(scores):.1f}")
+    print()
+
+    kept = skipped = scanned = 0
+    for path in args.pdfs or sample_pdfs():
+        with fitz.open(path) as doc:
+            previous_kept = False
+            for page in doc:
+                label = f"{os.path.basename(path)[:40]} p{page.number + 1}"
+                text = clean_deed_text(page.get_text())
+                if not text.strip():
+                    scanned += 1
+                    print(f"{label:<48} scanned (no text layer)")
+                    continue
+                decision = classify_page(page.number, text, previous_kept, args.min_score)
+                previous_kept = decision.keep
+                kept += decision.keep
+                skipped += not decision.keep
+                print(f"{label:<48} {decision.score:6.1f}  "
+                      f"{'keep' if decision.keep else 'skip'}  {decision.reason}")
+    print()
+    print(f"text-layer pages: {kept} kept, {skipped} skipped; {scanned} scanned pages not scored")
+
+
+if __name__ == "__main__":
+    main()
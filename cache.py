@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+
+def digest(*parts):
+    """sha256 hex digest over `parts` (str or bytes), length-prefixed so that
+    ("ab", "c") and ("a", "bc") hash differently."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def file_digest(path, block=1 << 20):
+    """sha256 hex digest of the file at `path`, read `block` bytes at a time."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(block), b""):
+            h.update(data)
+    return h.hexdigest()
+
+
+# LRU bookkeeping.  The stored size is kept in a meta row by triggers, so
+# a put only reads one row to know whether to evict, and several processes
+# sharing a file all see the same total.  Eviction drops the least recently
+# used entries until EVICT_TO of max_bytes is left, so a full cache evicts
+# once per batch of puts rather than on every one.  Hits only note the
+# time a key was used; the notes are written to `used` in one transaction
+# every TOUCH_BATCH hits, before every put and on close.
+EVICT_TO = 0.9
+TOUCH_BATCH = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS entries_used ON entries(used);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (name, value) SELECT 'bytes', COALESCE(SUM(size), 0) FROM entries;
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE meta SET value = value + new.size WHERE name = 'bytes'; END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE meta SET value = value - old.size WHERE name = 'bytes'; END;
+CREATE TRIGGER IF NOT EXISTS entries_resize AFTER UPDATE OF size ON entries BEGIN
+    UPDATE meta SET value = value + new.size - old.size WHERE name = 'bytes'; END;
+"""
+
+
+class SqliteCache:
+    """
+    Persistent key -> JSON value store backed by SQLite.  Values are stored
+    zlib-compressed; once the stored size exceeds `max_bytes` the least
+    recently used entries are evicted.  One instance can be shared between
+    threads, and several processes can open the same file.  With `bypass`
+    set, reads always miss but fresh values are still written back.
+    """
+
+    def __init__(self, path, max_bytes=1 << 30, bypass=False):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # one transaction, so the size total starts from the entries it counts
+        try:
+            self._conn.executescript(f"BEGIN IMMEDIATE; {_SCHEMA} COMMIT;")
+        except BaseException:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            raise
+
+    def get(self, key):
+        if self.bypass:
+            self.misses += 1
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._touched[key] = time.time()
+            if len(self._touched) >= TOUCH_BATCH:
+                self._flush_touched()
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key, value):
+        blob = zlib.compress(
+            json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        )
+        with self._lock:
+            self._flush_touched()
+            # an upsert rather than INSERT OR REPLACE: REPLACE's implicit
+            # delete doesn't fire the size trigger
+            self._conn.execute(
+                "INSERT INTO entries (key, value, size, used) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value,"
+                " size = excluded.size, used = excluded.used",
+                (key, blob, len(blob), time.time()),
+            )
+            self._evict()
+
+    def _flush_touched(self):
+        if not self._touched:
+            return
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany("UPDATE entries SET used = ? WHERE key = ?",
+                                   [(used, key) for key, used in self._touched.items()])
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._touched.clear()
+
+    def _size(self):
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+
+    def _evict(self):
+        total = self._size()
+        if total <= self.max_bytes:
+            return
+        # walk the entries_used index from the oldest entry until enough is freed
+        excess = total - int(self.max_bytes * EVICT_TO)
+        keys = []
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY used")
+        for key, size in rows:
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        rows.close()
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", keys)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self.evictions += len(keys)
+
+    def __contains__(self, key):
+        # presence only: no LRU update, no hit counting
+        if self.bypass:
+            return False
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM entries WHERE key = ?", (key,)
+            ).fetchone() is not None
+
+    def values(self):
+        """Iterate over every stored value (no LRU update, no hit counting)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT value FROM entries").fetchall()
+        for (blob,) in rows:
+            yield json.loads(zlib.decompress(blob))
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            size = self._size()
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": entries, "bytes": size, "bypass": self.bypass}
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.close()
+
+
+class OcrCache(SqliteCache):
+    """
+    One page's Textract Blocks keyed by the page (rendered image, or a
+    one-page PDF for asynchronous jobs), DPI and OCR mode.  Every value is
+    a list of Blocks.
+    """
+
+    def __init__(self, path=os.path.join(CACHE_DIR, "ocr.sqlite"), max_bytes=1 << 30,
+                 bypass=False):
+        super().__init__(path, max_bytes, bypass)
+        with self._lock:
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+                self._drop_job_results()
+
+    def _drop_job_results(self):
+        # caches written before job pages were cached one by one hold whole
+        # job results (a list of per-page Blocks lists); drop those once
+        stale = [(key,) for key, blob in self._conn.execute("SELECT key, value FROM entries")
+                 if isinstance((json.loads(zlib.decompress(blob)) or [{}])[0], list)]
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+            self._conn.execute("PRAGMA user_version = 1")
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def key(image, dpi, mode):
+        return digest(mode, str(dpi), image)
+
+
+class LlmCache(SqliteCache):
+    """
+    Raw function-call arguments keyed by model, system prompt, function
+    schema and the exact chunk text.  Prompt and schema enter the key as
+    hashes of their current values, so editing either one invalidates the
+    old entries without any manual versioning.
+    """
+
+    def __init__(self, path=os.path.join(CACHE_DIR, "llm.sqlite"), max_bytes=256 << 20,
+                 bypass=False):
+        super().__init__(path, max_bytes, bypass)
+
+    @staticmethod
+    def key(model, system_prompt, schema, text):
+        return digest(model, digest(system_prompt),
+                      digest(json.dumps(schema, sort_keys=True)), text)
+
+
+class StageStore(SqliteCache):
+    """
+    Persisted outputs of the stages.py pipeline, keyed by stage name, the
+    stage's code fingerprint and its inputs (see stages.py).
+    """
+
+    def __init__(self, path=os.path.join(CACHE_DIR, "stages.sqlite"), max_bytes=4 << 30,
+                 bypass=False):
+        super().__init__(path, max_bytes, bypass)
+
+    @staticmethod
+    def key(stage, fingerprint, *inputs):
+        return digest(stage, fingerprint, *inputs)
@@ -0,0 +1,493 @@
+import re
+import threading
+from collections import namedtuple
+
+# Deterministic parser for the common metes-and-bounds call shapes.  A chunk
+# is split into calls (BEGINNING/COMMENCING heads and THENCE clauses); every
+# call the grammar resolves completely becomes a schema-shaped segment, and
+# only the calls it can't account for are left for the LLM.  The grammar is
+# deliberately strict: any bearing, distance, angle or "from which" it didn't
+# consume marks the call as unresolved rather than risk a wrong segment, and
+# seconds without minutes (usually an OCR drop) don't count as a bearing.
+
+_NUM = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?"
+_UNIT = r"(?:feet|foot|ft\.?|chains?|varas?|rods?|poles?)\b|'"
+_WORD_UNIT = r"(?:feet|foot|ft|chains?|varas?|rods?|poles?)\b"
+
+_BEARING = r"""
+    \b(?:north|south|[NS])\.?\s*
+    \d{1,3}\s*(?:°|º|degrees?|deg\.?)\s*
+    (?:\d{1,2}\s*(?:'|’|′|minutes?|min\.?)\s*
+       (?:\d{1,2}(?:\.\d+)?\s*(?:"|”|″|''|seconds?|sec\.?)\s*)?)?
+    (?:east|west|[EW])\b\.?
+"""
+
+_DMS = r"""
+    \d{1,3}\s*(?:°|º|degrees?)\s*
+    (?:\d{1,2}\s*(?:'|’|′|minutes?)\s*
+       (?:\d{1,2}(?:\.\d+)?\s*(?:"|”|″|''|seconds?))?)?
+"""
+
+_FLAGS = re.IGNORECASE | re.VERBOSE
+
+BEARING_RE = re.compile(_BEARING, _FLAGS)
+
+# bearing broken into its parts, for comparing bearings written differently
+_BEARING_PARTS_RE = re.compile(r"""
+    ^\s*(?P<ns>north|south|[NS])\.?\s*
+    (?P<deg>\d{1,3})\s*(?:°|º|degrees?|deg\.?)\s*
+    (?:(?P<min>\d{1,2})\s*(?:'|’|′|minutes?|min\.?)\s*
+       (?:(?P<sec>\d{1,2}(?:\.\d+)?)\s*(?:"|”|″|''|seconds?|sec\.?)\s*)?)?
+    (?P<ew>east|west|[EW])\.?\s*$
+""", _FLAGS)
+
+# a BEGINNING/COMMENCING "at" clause that opens a description (not "POINT OF
+# BEGINNING" or "BEGINNING OF A CURVE")
+_HEAD = r"\b(?:BEGINNING|COMMENCING)\b(?=\s*(?:\([^)]*\)\s*)?,?\s*(?:at|et)\b)"
+
+HEAD_RE = re.compile(_HEAD, _FLAGS)
+
+# where a call starts: THENCE, or a head
+CALL_START_RE = re.compile(rf"""
+    \bTHENCE\b
+  | {_HEAD}
+""", _FLAGS)
+
+_POINT_RE = re.compile(r"""
+    ^(?P<loc>BEGINNING|COMMENCING)\s*(?:\([^)]*\)\s*)?,?\s*(?:at|et)\s+(?P<monument>.+)$
+""", _FLAGS)
+
+_THENCE_HEAD_RE = re.compile(r"^THENCE\b[\s,:]*", re.IGNORECASE)
+
+# "from which <monument> bears <bearing>, <distance> <unit>", optionally in parentheses
+_REFERENCE_RE = re.compile(rf"""
+    ,?\s*\(?\s*from\s+wh(?:ich|ence)\s+(?P<monument>.+?)\s*,?\s*bears?\s+
+    (?P<bearing>{_BEARING})\s*,?\s*(?:(?:at|for)\s+)?(?:a\s+)?(?:distance\s+(?:of\s+)?)?
+    (?P<distance>{_NUM})\s*(?P<unit>{_UNIT})\s*\)?
+""", _FLAGS)
+
+# "at a distance of 254.09 feet passing <monument>", up to the next pass or the total
+_PASSING_RE = re.compile(rf"""
+    ,?\s*\bat\s+(?:a\s+)?distance\s+(?:of\s+)?(?P<distance>{_NUM})\s*(?P<unit>{_UNIT})\s*,?\s*
+    passing\s+(?P<monument>.+?)\s*,?\s*
+    (?=(?:and\s+)?(?:continuing|in\s+all|at\s+(?:a\s+)?distance)\b)
+""", _FLAGS)
+
+# "and continuing in all a total distance of 266.71 feet", anchored after the passes
+_TOTAL_RE = re.compile(rf"""
+    \s*,?\s*(?:and\s+)?(?:continuing\s+)?(?:in\s+all\s+)?(?:for\s+)?(?:a\s+)?(?:total\s+)?
+    (?:distance\s+)?(?:of\s+)?(?P<distance>{_NUM})\s*(?P<unit>{_UNIT})
+""", _FLAGS)
+
+_DISTANCE_RE = re.compile(rf"""
+    (?:(?:for|at)\s+)?(?:a\s+)?(?:total\s+)?distance\s*(?:of\s*)?,?\s*
+    (?P<distance>{_NUM})\s*(?P<unit>{_UNIT})
+""", _FLAGS)
+
+_BARE_DISTANCE_RE = re.compile(rf"(?P<distance>{_NUM})\s*(?P<unit>{_UNIT})", _FLAGS)
+
+_TO_MONUMENT_RE = re.compile(r"^[\s,.;:]*(?:to\s+(?P<monument>.*))?$", re.IGNORECASE | re.DOTALL)
+
+# curve parts
+_CURVE_RE = re.compile(r"\b(?:arc|radius|chord)\b", re.IGNORECASE)
+_ARC_RE = re.compile(rf"""
+    (?:an?\s+)?arc\s+(?:length|distance)\s+(?:of\s+)?(?P<distance>{_NUM})\s*(?P<unit>{_UNIT})
+""", _FLAGS)
+_RADIUS_RE = re.compile(rf"""
+    (?:an?\s+)?radius\s+(?:of\s+)?(?P<distance>{_NUM})\s*(?P<unit>{_UNIT})
+""", _FLAGS)
+_ANGLE_RE = re.compile(rf"""
+    (?:an?\s+)?(?:(?:central|delta)\s+angle|delta)\s+(?:of\s+)?(?P<angle>{_DMS})
+""", _FLAGS)
+_CHORD_RE = re.compile(rf"""
+    (?:and\s+)?(?:an?\s+)?(?:long\s+)?chord\s+(?:which\s+)?(?:bearing|bears)\s+(?:of\s+)?
+    (?P<bearing>{_BEARING})\s*,?\s*(?:and\s+)?(?:an?\s+)?(?:(?:chord\s+)?(?:length|distance)\s+(?:of\s+)?)?
+    (?P<distance>{_NUM})\s*(?P<unit>{_UNIT})
+""", _FLAGS)
+_TURN_RE = re.compile(r"\bto\s+the\s+(right|left)\b", re.IGNORECASE)
+
+# acreage trailing the closing call: "... to the place of beginning and containing 81.406 acres"
+_CONTAINING_RE = re.compile(r"[\s,]+(?:and\s+)?containing\b", re.IGNORECASE)
+
+# pipeline P.I. note after the station: "being a P.I. with a deflection of 45°07'06\" to the right"
+_DEFLECTION_RE = re.compile(rf"""
+    [\s,]+(?:being\s+)?an?\s+P\.\s?I\.\s+with\s+an?\s+deflection\s+of\s+{_DMS}\s*
+    to\s+the\s+(?:right|left)\s*$
+""", _FLAGS)
+
+_LOCATION_RE = re.compile(r"\b(?:point|place)\s+of\s+(beginning|termination|exit|re-?entry)\b",
+                          re.IGNORECASE)
+
+# grid coordinates: "N: 498,804.21, E: 601,040.91", "Northing = ...", "(X=..., Y=...)"
+_NORTH_EAST_RE = re.compile(rf"""
+    \bN(?:orthing)?\s*[:=]\s*(?P<north>{_NUM})\s*,?\s*E(?:asting)?\s*[:=]\s*(?P<east>{_NUM})
+""", _FLAGS)
+_X_Y_RE = re.compile(rf"\bX\s*=\s*(?P<east>{_NUM})\s*,?\s*Y\s*=\s*(?P<north>{_NUM})", _FLAGS)
+
+# anything that still looks like a measurement once a call has been parsed
+_MEASUREMENT_RE = re.compile(rf"""
+    {_BEARING}
+  | (?:{_NUM})\s*{_WORD_UNIT}
+  | \d\s*(?:°|º|degrees?\b)
+  | \bfrom\s+wh(?:ich|ence)\b
+  | \bbears\b
+""", _FLAGS)
+
+# a period that ends the call: ignore it after these
+_ABBREVIATIONS = {"no", "co", "vol", "pg", "blk", "sec", "st", "ave", "rd", "hwy", "inc",
+                  "ltd", "corp", "tr", "sur", "abst", "ry", "rr", "cr", "fm", "us", "sh"}
+_SENTENCE_END_RE = re.compile(r"(\w+)\.\s+(?=[A-Z])(?!(?:from|said|being)\b)", re.IGNORECASE)
+
+_UNIT_NAMES = {"'": "feet", "ft": "feet", "ft.": "feet"}
+
+# marks where a "from which" clause was cut out of a call
+_REF_MARK = "\x00"
+_REF_MARK_RE = re.compile("\x00(\\d+)\x00")
+
+Run = namedtuple("Run", "text segments calls")
+
+
+def _squash(text):
+    return " ".join(text.split())
+
+
+def _number(text):
+    return float(text.replace(",", ""))
+
+
+def _unit(text):
+    return _UNIT_NAMES.get(text.lower(), text)
+
+
+def _tidy(text):
+    # trim separators left over from cutting clauses out of a phrase
+    text = re.sub(r"\s+,", ",", text)
+    text = re.sub(r",(?:\s*,)+", ",", text)
+    return text.strip(" ,;:.")
+
+
+def _measured(text):
+    return bool(text) and _MEASUREMENT_RE.search(text) is not None
+
+
+def parse_bearing(text):
+    """
+    Split a bearing string into (ns, degrees, minutes, seconds, ew), e.g.
+    "North 74°57′16″ West" -> ("N", 74, 57, 16.0, "W").  Returns None when
+    `text` isn't a quadrant bearing.
+    """
+    m = _BEARING_PARTS_RE.match(text or "")
+    if not m:
+        return None
+    return (m.group("ns")[0].upper(), int(m.group("deg")), int(m.group("min") or 0),
+            float(m.group("sec") or 0), m.group("ew")[0].upper())
+
+
+def _segment(**fields):
+    segment = {
+        "locationDescription": None,
+        "callType": None,
+        "bearing": None,
+        "description": None,
+        "distance": None,
+        "unit": None,
+        "angle": None,
+        "direction": None,
+        "arcDistance": None,
+        "radius": None,
+        "baseNorth": None,
+        "baseEast": None,
+        "monument": None,
+        "pointOfReference": None,
+        "pointsOnLine": [],
+    }
+    segment.update(fields)
+    return segment
+
+
+def call_spans(text):
+    """(start, end) of each call in `text`; text before the first call is its own span."""
+    starts = [m.start() for m in CALL_START_RE.finditer(text)]
+    if not starts or starts[0] > 0:
+        starts.insert(0, 0)
+    ends = starts[1:] + [len(text)]
+    return [(s, e) for s, e in zip(starts, ends) if text[s:e].strip()]
+
+
+def split_calls(text):
+    """Split deed text into calls: the preamble, BEGINNING/COMMENCING heads and THENCE clauses."""
+    return [text[s:e].strip() for s, e in call_spans(text)]
+
+
+def _cut_tail(call):
+    # a call ends at a semicolon or at the end of its sentence; what follows
+    # is narrative (acreage, basis of bearings...) unless it holds a measurement
+    end = call.find(";")
+    body, tail = (call, "") if end == -1 else (call[:end], call[end + 1:])
+    for m in _SENTENCE_END_RE.finditer(body):
+        if m.group(1).lower() in _ABBREVIATIONS or len(m.group(1)) < 2:
+            continue
+        body, tail = body[:m.end(1)], body[m.end(1) + 1:] + tail
+        break
+    return body, tail
+
+
+def _cut_references(body):
+    # replace each "from which" clause with a numbered marker
+    refs = []
+
+    def mark(m):
+        refs.append({
+            "bearing":  _squash(m.group("bearing")),
+            "distance": _number(m.group("distance")),
+            "unit":     _unit(m.group("unit")),
+            "monument": _tidy(m.group("monument")),
+        })
+        return f"{_REF_MARK}{len(refs) - 1}{_REF_MARK}"
+
+    return _REFERENCE_RE.sub(mark, body), refs
+
+
+def _split_monument(text, refs):
+    """
+    Split the text following "to"/"at"/"passing" into the monument and the
+    reference attached to it.  Text after a reference is kept unless it
+    describes the reference itself ("said spike being ...").  Returns
+    (monument, reference, dropped_text).
+    """
+    dropped = []
+    m = _CONTAINING_RE.search(text)
+    if m:
+        text, dropped = text[:m.start()], [text[m.start():]]
+    m = _DEFLECTION_RE.search(text)
+    if m:
+        text = text[:m.start()]
+    parts = _REF_MARK_RE.split(text)
+    monument, reference = parts[0], None
+    for i in range(1, len(parts), 2):
+        ref, after = refs[int(parts[i])], parts[i + 1]
+        if reference is None:
+            reference = ref
+        else:
+            return None, None, None
+        if re.match(r"[\s,]*said\b", after, re.IGNORECASE):
+            dropped.append(after)
+        else:
+            monument += after
+    return _tidy(monument), reference, " ".join(dropped)
+
+
+def _location(monument):
+    m = _LOCATION_RE.search(monument or "")
+    if not m:
+        return None
+    return "POINT OF " + m.group(1).upper().replace("-", "")
+
+
+def _parse_point(body, refs):
+    m = _POINT_RE.match(body)
+    if not m:
+        return None
+    monument, reference, dropped = _split_monument(m.group("monument"), refs)
+    if monument is None or _measured(dropped):
+        return None
+    coords = _NORTH_EAST_RE.search(monument) or _X_Y_RE.search(monument)
+    rest = monument
+    if coords:
+        rest = monument[:coords.start()] + monument[coords.end():]
+    if _measured(rest):
+        return None
+    return _segment(
+        locationDescription=m.group("loc").upper(),
+        callType="point",
+        monument=monument,
+        pointOfReference=reference,
+        baseNorth=_number(coords.group("north")) if coords else None,
+        baseEast=_number(coords.group("east")) if coords else None,
+    )
+
+
+def _parse_curve(body, refs):
+    parts = {}
+    for name, pattern in (("arc", _ARC_RE), ("radius", _RADIUS_RE),
+                          ("angle", _ANGLE_RE), ("chord", _CHORD_RE)):
+        m = pattern.search(body)
+        if m:
+            parts[name] = m
+    chord = parts.get("chord")
+    if chord is None:
+        return None
+
+    first = min(m.start() for m in parts.values())
+    last = max(m.end() for m in parts.values())
+    after = _TO_MONUMENT_RE.match(body[last:])
+    if not after:
+        return None
+    monument, reference, dropped = _split_monument(after.group("monument") or "", refs)
+    if monument is None:
+        return None
+
+    # everything between the parts must be connective narrative
+    spans = sorted((m.start(), m.end()) for m in parts.values())
+    between = [body[a_end:b_start] for (_, a_end), (b_start, _) in zip(spans, spans[1:])]
+    description = _tidy(body[:first])
+    if any(_measured(t) for t in between + [description, monument, dropped]):
+        return None
+    if _REF_MARK in description or any(_REF_MARK in t for t in between):
+        return None
+
+    turn = _TURN_RE.search(body[:last])
+    arc, radius, angle = parts.get("arc"), parts.get("radius"), parts.get("angle")
+    return _segment(
+        locationDescription=_location(monument),
+        callType="curve",
+        bearing=_squash(chord.group("bearing")),
+        description=description or None,
+        distance=_number(chord.group("distance")),
+        unit=_unit(chord.group("unit")),
+        angle=_squash(angle.group("angle")) if angle else None,
+        direction=turn.group(1).lower() if turn else None,
+        arcDistance=f"{arc.group('distance')} {_unit(arc.group('unit'))}" if arc else None,
+        radius=f"{radius.group('distance')} {_unit(radius.group('unit'))}" if radius else None,
+        monument=monument or "a point",
+        pointOfReference=reference,
+    )
+
+
+def _parse_line(body, refs):
+    bearing_m = BEARING_RE.search(body)
+    if bearing_m is None:
+        return None
+    bearing = _squash(bearing_m.group())
+    pre = _tidy(body[:bearing_m.start()])
+    rest = body[bearing_m.end():]
+
+    points = []
+    passes = list(_PASSING_RE.finditer(rest))
+    if passes:
+        # passes must follow one another directly, then the total distance
+        for a, b in zip(passes, passes[1:]):
+            if rest[a.end():b.start()].strip(" ,"):
+                return None
+        for p in passes:
+            monument, reference, dropped = _split_monument(p.group("monument"), refs)
+            if monument is None or _measured(monument) or _measured(dropped):
+                return None
+            points.append({
+                "bearing":  bearing,
+                "distance": _number(p.group("distance")),
+                "unit":     _unit(p.group("unit")),
+                "monument": monument,
+                "pointOfReference": reference,
+            })
+        dist = _TOTAL_RE.match(rest, passes[-1].end())
+        lead = rest[:passes[0].start()]
+    else:
+        dist = _DISTANCE_RE.search(rest) or _BARE_DISTANCE_RE.search(rest)
+        lead = rest[:dist.start()] if dist else ""
+    if dist is None:
+        return None
+
+    after = _TO_MONUMENT_RE.match(rest[dist.end():])
+    if not after:
+        return None
+    monument, reference, dropped = _split_monument(after.group("monument") or "", refs)
+    if monument is None:
+        return None
+
+    description = " ".join(t for t in (pre, _tidy(lead)) if t)
+    if _measured(description) or _measured(monument) or _measured(dropped):
+        return None
+    if _REF_MARK in description:
+        return None
+
+    return _segment(
+        locationDescription=_location(monument),
+        callType="line",
+        bearing=bearing,
+        description=description or None,
+        distance=_number(dist.group("distance")),
+        unit=_unit(dist.group("unit")),
+        monument=monument or "a point",
+        pointOfReference=reference,
+        pointsOnLine=points,
+    )
+
+
+def parse_call(call):
+    """
+    Parse one call (as returned by split_calls) into a list of segments:
+    one segment for a resolved call, none for narrative that holds no
+    measurement at all.  Returns None when the call needs the LLM.
+    """
+    body, tail = _cut_tail(_squash(call))
+    if _measured(tail):
+        return None
+
+    head = _THENCE_HEAD_RE.match(body)
+    if head:
+        body = body[head.end():]
+    body, refs = _cut_references(body)
+
+    if head is None and _POINT_RE.match(body):
+        segment = _parse_point(body, refs)
+    elif head is not None and _CURVE_RE.search(body):
+        segment = _parse_curve(body, refs)
+    elif head is not None and BEARING_RE.search(body):
+        segment = _parse_line(body, refs)
+    elif refs or _measured(body) or _LOCATION_RE.search(body):
+        segment = None
+    else:
+        # preamble or "THENCE along said line the following courses:"
+        return []
+    return None if segment is None else [segment]
+
+
+def parse_chunk(text):
+    """
+    Split `text` into calls and parse each one.  Returns a list of Runs in
+    text order: a resolved call carries its segments, and consecutive
+    calls the grammar couldn't resolve are merged into one run (segments
+    None) whose text is the matching slice of `text`, ready for the LLM.
+    A chunk with no resolved calls comes back as a single run of the
+    whole text.
+    """
+    runs = []
+    pending = None
+    for start, end in call_spans(text):
+        segments = parse_call(text[start:end])
+        if segments is None:
+            pending = (pending[0] if pending else start, end, (pending[2] if pending else 0) + 1)
+            continue
+        if pending:
+            runs.append(Run(text[pending[0]:pending[1]].strip(), None, pending[2]))
+            pending = None
+        runs.append(Run(text[start:end].strip(), segments, 1))
+    if pending:
+        runs.append(Run(text[pending[0]:pending[1]].strip(), None, pending[2]))
+    return runs
+
+
+class ParserStats:
+    """Thread-safe tally of how many calls the grammar resolved vs. sent to the LLM."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.parsed = 0
+        self.llm_runs = 0
+
+    def record(self, runs):
+        with self._lock:
+            for run in runs:
+                self.calls += run.calls
+                if run.segments is None:
+                    self.llm_runs += 1
+                else:
+                    self.parsed += run.calls
+
+    def stats(self):
+        with self._lock:
+            rate = self.parsed / self.calls if self.calls else 0.0
+            return {"calls": self.calls, "parsed": self.parsed,
+                    "llm_runs": self.llm_runs, "hit_rate": round(rate, 3)}
@@ -0,0 +1,166 @@
+import re
+from bisect import bisect_right
+from collections import namedtuple
+from functools import lru_cache
+
+from call_parser import BEARING_RE, call_spans
+from instrument import stage
+
+try:
+    import tiktoken
+except ImportError:  # optional; count_tokens falls back to an estimate
+    tiktoken = None
+
+# Token-budget chunk packer.  The cleaned pages are read as one stream of
+# calls (call_parser.call_spans) and consecutive complete calls are packed
+# into chunks of at most CHUNK_TOKEN_BUDGET tokens.  A call still open at
+# the end of a page is carried onto the next one; a call too big for the
+# budget on its own is cut between courses.  Chunks tile the document text
+# exactly (pages joined by one space), so no text is repeated or dropped;
+# a chunk that opens partway through a cut call is marked `continued`, and
+# chunk_pdf.join_cut_calls merges the segments either side of the cut.
+
+# deed text per LLM request.  gpt-4-0613 has an 8k context; the system
+# prompt and function schema take ~2.2k of it and the segments JSON comes
+# back at ~1.5x the size of the text it was read from.
+CHUNK_TOKEN_BUDGET = 1500
+
+# `start`/`end` are offsets into the document text, `calls` the calls that
+# begin in the chunk, and `continued` is set when the chunk opens partway
+# through a call that was cut to fit the budget
+Chunk = namedtuple("Chunk", "text start end tokens calls continued")
+
+_Piece = namedtuple("_Piece", "text start end tokens continued")
+
+# estimate: letters runs, digit groups of up to three (as cl100k splits
+# them) and every other non-space character
+_TOKEN_RE = re.compile(r"[A-Za-z]+|\d{1,3}|\S")
+
+# bearings inside a "from which ... bears" tie belong to the call before them
+_TIE_RE = re.compile(r"\b(?:bears?|bearing|which|whence)\b[^;]{0,20}$", re.IGNORECASE)
+_CLAUSE_END_RE = re.compile(r"(?<=[;,])\s")
+_SPACE_RE = re.compile(r"\s")
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text):
+    """Tokens in `text` under GPT-4's encoding; a slight overestimate without tiktoken."""
+    if tiktoken is not None:
+        return len(_encoding().encode(text))
+    return sum(1 + len(t) // 8 if t.isalpha() else 1 for t in _TOKEN_RE.findall(text))
+
+
+def _course_starts(text):
+    # before each bearing that opens a course, i.e. not the first one of
+    # the text and not one inside a tie to a witness monument
+    first = True
+    for m in BEARING_RE.finditer(text):
+        if first:
+            first = False
+        elif not _TIE_RE.search(text, max(m.start() - 60, 0), m.start()):
+            yield m.start()
+
+
+def _cut_points(text, budget):
+    """Offsets that cut `text` into pieces of at most `budget` tokens, between courses if possible."""
+    candidates = (list(_course_starts(text)),
+                  [m.start() for m in _CLAUSE_END_RE.finditer(text)],
+                  [m.start() for m in _SPACE_RE.finditer(text)])
+    cuts = []
+    start = 0
+    while count_tokens(text[start:]) > budget:
+        for offsets in candidates:
+            # the furthest candidate whose piece still fits
+            offsets = offsets[bisect_right(offsets, start):]
+            lo, hi = 0, len(offsets)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if count_tokens(text[start:offsets[mid]]) <= budget:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo:
+                cuts.append(offsets[lo - 1])
+                break
+        else:
+            # one unbroken word longer than the budget; leave it whole
+            break
+        start = cuts[-1]
+    return cuts
+
+
+def _pieces(text, start, continued, budget):
+    bounds = [0] + _cut_points(text, budget) + [len(text)]
+    for i, (a, b) in enumerate(zip(bounds, bounds[1:])):
+        yield _Piece(text[a:b], start + a, start + b, count_tokens(text[a:b]), continued or i > 0)
+
+
+def _iter_pieces(pages, budget):
+    # complete calls (or budget-sized pieces of them) in document order
+    buffer = ""        # document text from offset `base` on, not yet yielded
+    base = 0
+    length = 0         # document length so far
+    continued = False  # buffer opens with the rest of a cut call
+    for text in pages:
+        text = text.strip()
+        if not text:
+            continue
+        with stage("stitch") as span:
+            sep = " " if length else ""
+            buffer += sep + text
+            length += len(sep) + len(text)
+
+            # every call but the last is complete; the last may run onto the next page
+            done = []
+            cursor = 0
+            for _, end in call_spans(buffer)[:-1]:
+                done.extend(_pieces(buffer[cursor:end], base + cursor, continued, budget))
+                cursor, continued = end, False
+            buffer, base = buffer[cursor:], base + cursor
+
+            # an open call already over budget goes out in pieces now,
+            # keeping only the last one open
+            if count_tokens(buffer) > budget:
+                *cut, rest = _pieces(buffer, base, continued, budget)
+                done.extend(cut)
+                buffer, base, continued = rest.text, rest.start, rest.continued
+            span.add(bytes_in=len(text), pieces=len(done))
+        yield from done
+
+    with stage("stitch") as span:
+        done = []
+        cursor = 0
+        for _, end in call_spans(buffer):
+            done.extend(_pieces(buffer[cursor:end], base + cursor, continued, budget))
+            cursor, continued = end, False
+        span.add(pieces=len(done))
+    yield from done
+
+
+def _chunk(pieces):
+    return Chunk("".join(p.text for p in pieces).strip(), pieces[0].start, pieces[-1].end,
+                 sum(p.tokens for p in pieces), sum(not p.continued for p in pieces),
+                 pieces[0].continued)
+
+
+def iter_chunks(pages, budget=CHUNK_TOKEN_BUDGET):
+    """
+    Pack an iterable of cleaned page texts into Chunks of whole calls, each
+    at most `budget` tokens.  Chunks are yielded as soon as the next call
+    would overflow them, so the first LLM call can go out while later pages
+    are still in OCR.
+    """
+    group = []
+    tokens = 0
+    for piece in _iter_pieces(pages, budget):
+        if group and tokens + piece.tokens > budget:
+            yield _chunk(group)
+            group, tokens = [], 0
+        group.append(piece)
+        tokens += piece.tokens
+    if group:
+        yield _chunk(group)
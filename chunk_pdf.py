@@ -1,34 +1,50 @@
 import os
 import re
 import json
-from collections import defaultdict
+import time
+import argparse
+import threading
+from contextlib import nullcontext
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import fitz
-import boto3
-from openai import OpenAI
 
-from schema_function import EXTRACT_METES_BOUNDS_SCHEMA, SYSTEM_PROMPT_LINES
+from cache import LlmCache, OcrCache
+from call_parser import ParserStats, Run, parse_chunk
+from chunk_packer import CHUNK_TOKEN_BUDGET, iter_chunks
+from concurrency import fitz_lock, ordered_map, prefetch
+from instrument import record, recording, stage
+from ocr import TEXTRACT_JOB_BUCKET, TEXTRACT_MAX_BYTES, TextractJobOCR, TextractOCR
+from page_filter import MIN_PAGE_SCORE, filter_pages
+from inventory import (INVENTORY_FIELDS, INVENTORY_SCAN_CHARS, find_clause, merge_inventory,
+                       missing_fields, regex_inventory)
+from schema_function import (EXTRACT_METES_BOUNDS_SCHEMA, INVENTORY_SCHEMA_FUNCTION,
+                             SYSTEM_PROMPT_INVENTORY, SYSTEM_PROMPT_LINES)
+
+# case-insensitive regex to grab dir1, deg, min, sec, dir2
+_BEARING_WORDS_RE = re.compile(
+    r"^\s*"
+    r"(?P<dir1>north|south)\s+"              # N or S word
+    r"(?P<deg>\d+)\s*(?:°|degrees?)\s+"
+    r"(?P<min>\d+)\s*(?:'|minutes?)\s+"
+    r"(?P<sec>\d+)\s*(?:\"|seconds?)\s+"
+    r"(?P<dir2>east|west)\s*"
+    r"$",
+    flags=re.IGNORECASE
+)
+
+# map any case-variant to its initial
+_DIRECTION_ABBREV = {"north": "N", "south": "S", "east": "E", "west": "W"}
+
 
 def format_bearing(bearing_str):
-    # case-insensitive regex to grab dir1, deg, min, sec, dir2
-    pattern = re.compile(
-        r"^\s*"
-        r"(?P<dir1>north|south)\s+"              # N or S word
-        r"(?P<deg>\d+)\s*(?:°|degrees?)\s+"
-        r"(?P<min>\d+)\s*(?:'|minutes?)\s+"
-        r"(?P<sec>\d+)\s*(?:\"|seconds?)\s+"
-        r"(?P<dir2>east|west)\s*"
-        r"$",
-        flags=re.IGNORECASE
-    )
-    m = pattern.match(bearing_str)
+    m = _BEARING_WORDS_RE.match(bearing_str)
     if not m:
         # fallback: if it doesn’t match, just return the original
         return bearing_str
 
-    # map any case-variant to its initial
-    abbrev = {"north": "N", "south": "S", "east": "E", "west": "W"}
-    d1 = abbrev[m.group("dir1").lower()]
-    d2 = abbrev[m.group("dir2").lower()]
+    d1 = _DIRECTION_ABBREV[m.group("dir1").lower()]
+    d2 = _DIRECTION_ABBREV[m.group("dir2").lower()]
 
     deg = m.group("deg")
     minute = m.group("min")
@@ -37,33 +53,28 @@ def format_bearing(bearing_str):
     return f"{d1} {deg}°{minute}'{sec}\" {d2}"
 
 
-def clean_deed_text(text):
-    # 1) Remove repeated headers/footers
-    text = re.sub(
-        r"Texas Department of Transportation.*?Page\s*\d+\s*of\s*\d+",
-        "",
-        text,
-        flags=re.IGNORECASE
-    )
+# clean_deed_text passes, compiled once.  Each pass is gated on a cheap
+# substring check so pages that can't match skip the regex scan entirely.
 
-    # 2) Drop standalone “EXHIBIT” markers
-    text = re.sub(r"\bEXHIBIT\b", "", text, flags=re.IGNORECASE)
+# 1) repeated headers/footers
+_HEADER_RE = re.compile(
+    r"Texas Department of Transportation.*?Page\s*\d+\s*of\s*\d+",
+    flags=re.IGNORECASE
+)
 
-    # 3) Remove Windows‑style file paths
-    text = re.sub(
-        r"[A-Za-z]:\\(?:[^\s\\]+\\)*[^\s\\]+",
-        "",
-        text
-    )
+# 2) standalone “EXHIBIT” markers
+_EXHIBIT_RE = re.compile(r"\bEXHIBIT\b", flags=re.IGNORECASE)
 
-    # 4) Strip stray asterisks
-    text = re.sub(r"\*+", "", text)
+# 3) Windows‑style file paths
+_PATH_RE = re.compile(r"[A-Za-z]:\\(?:[^\s\\]+\\)*[^\s\\]+")
 
-    # 5) Newline before each “THENCE”
-    text = re.sub(r"(?i)\bTHENCE\b", r"\nTHENCE", text)
+# 5) newline before each “THENCE”; the case-sensitive pattern is much faster
+#    and gives the same result when every occurrence is already upper case
+_THENCE_RE = re.compile(r"\bTHENCE\b", flags=re.IGNORECASE)
+_THENCE_UPPER_RE = re.compile(r"\bTHENCE\b")
 
-    # 5.1) Break out each bearing‑distance clause onto its own line
-    pattern = re.compile(r"""
+# 5.1) break out each bearing‑distance clause onto its own line
+_CLAUSE_RE = re.compile(r"""
         [\:\.,]\s*                                  # leading colon, comma or period + spaces
         (                                           # capture the bearing+distance clause
           (?:N|S|E|W|North|South|East|West)
@@ -81,171 +92,1017 @@ def clean_deed_text(text):
           | [\:\.,]
         )
         """,
-        flags=re.IGNORECASE | re.VERBOSE
-    )
-    text = pattern.sub(lambda m: f", {m.group(1)},\n", text)
-
-    # 6) Replace any leading punctuation+space at start‐of‐line with “THENCE ”,
-    #    but skip if it's a coordinate that starts “N:” or “E:” etc.
-    text = re.sub(
-        r'(?m)^[\:\.,]\s*(?!(?:[NSEW]:))',   # NEGATIVE lookahead for N: / E: coordinate
-        'THENCE ',
-        text
-    )
+    flags=re.IGNORECASE | re.VERBOSE
+)
+
+# 6) leading punctuation+space at start‐of‐line, unless it's a coordinate
+#    that starts “N:” or “E:” etc.
+_LEADING_PUNCT_RE = re.compile(r'(?m)^[\:\.,]\s*(?!(?:[NSEW]:))')
+
+# 7) runs of whitespace
+_SPACES_RE = re.compile(r"\s{2,}")
+
+# 8) newline before any comma/colon/period that precedes a bearing, but not
+#    when that bearing is actually a coordinate (N:123,…)
+_BREAK_BEFORE_BEARING_RE = re.compile(
+    r'([,.:])\s*'
+    r'(?=(?:N(?!:)|S(?!:)|E(?!:)|W(?!:)|North(?!:)|South(?!:)|East(?!:)|West(?!:))\b)',
+    flags=re.IGNORECASE
+)
+
+# 9) “THENCE ” before any line starting with a compass direction, again
+#    skipping coordinate pairs
+_LINE_STARTS_WITH_BEARING_RE = re.compile(
+    r'(?m)^(?=\s*(?:N(?!:)|S(?!:)|E(?!:)|W(?!:)|North(?!:)|South(?!:)|East(?!:)|West(?!:))\b)'
+)
+
+# characters IGNORECASE matches against ASCII letters that str.lower()
+# doesn't map onto them
+_CASE_SPECIALS = {0x130: "i", 0x131: "i", 0x17F: "s"}
+_CASE_SPECIALS_RE = re.compile("[İıſ]")
+
+
+def _fold(text):
+    # lower-cased copy for the substring checks that gate IGNORECASE passes
+    if not text.isascii() and _CASE_SPECIALS_RE.search(text):
+        text = text.translate(_CASE_SPECIALS)
+    return text.lower()
+
+
+def clean_deed_text(text):
+    folded = _fold(text)
+
+    # 1) Remove repeated headers/footers
+    if "texas department of transportation" in folded:
+        text = _HEADER_RE.sub("", text)
+        folded = _fold(text)
+
+    # 2) Drop standalone “EXHIBIT” markers
+    if "exhibit" in folded:
+        text = _EXHIBIT_RE.sub("", text)
+        folded = _fold(text)
+
+    # 3) Remove Windows‑style file paths
+    if ":\\" in text:
+        text = _PATH_RE.sub("", text)
+        folded = _fold(text)
+
+    # 4) Strip stray asterisks
+    if "*" in text:
+        text = text.replace("*", "")
+        folded = _fold(text)
+
+    # 5) Newline before each “THENCE”
+    thence = folded.count("thence")
+    if thence:
+        pattern = _THENCE_UPPER_RE if thence == text.count("THENCE") else _THENCE_RE
+        text = pattern.sub("\nTHENCE", text)
+
+    # 5.1) Break out each bearing‑distance clause onto its own line
+    if "°" in text or "degree" in folded:
+        text = _CLAUSE_RE.sub(lambda m: f", {m.group(1)},\n", text)
+
+    # 6) Replace any leading punctuation+space at start‐of‐line with “THENCE ”
+    if text[:1] in (":", ".", ",") or "\n:" in text or "\n." in text or "\n," in text:
+        text = _LEADING_PUNCT_RE.sub("THENCE ", text)
 
     # 7) Collapse multiple spaces
-    text = re.sub(r"\s{2,}", " ", text).strip()
-
-    # 8) Insert newline before any comma/colon/period that precedes a bearing,
-    #    but skip when that bearing is actually a coordinate (N:123,…)
-    text = re.sub(
-        r'([,.:])\s*'                                     
-        r'(?=(?:N(?!:)|S(?!:)|E(?!:)|W(?!:)|North(?!:)|South(?!:)|East(?!:)|West(?!:))\b)',
-        r'\1\n',
-        text,
-        flags=re.IGNORECASE
-    )
+    text = _SPACES_RE.sub(" ", text).strip()
 
-    # 9) Prefix any line now starting with a compass direction with “THENCE ”,
-    #    again skipping coordinate pairs
-    text = re.sub(
-        r'(?m)^(?=\s*(?:N(?!:)|S(?!:)|E(?!:)|W(?!:)|North(?!:)|South(?!:)|East(?!:)|West(?!:))\b)',
-        'THENCE ',
-        text
-    )
+    # 8) Insert newline before any comma/colon/period that precedes a bearing
+    text = _BREAK_BEFORE_BEARING_RE.sub(r"\1\n", text)
+
+    # 9) Prefix any line now starting with a compass direction with “THENCE ”
+    text = _LINE_STARTS_WITH_BEARING_RE.sub("THENCE ", text)
 
-    text = re.sub(r"\s{2,}", " ", text).strip()
+    # the original ran the whitespace collapse again here; after 7) nothing
+    # above can produce a run of whitespace or leading/trailing space
 
     return text
 
 
-def words_to_lines(blocks, y_tol=0.005):
-    rows = defaultdict(list)
-    # group words whose Top coordinate is within y_tol of each other
-    for b in blocks:
-        if b["BlockType"]!="WORD": continue
-        top = b["Geometry"]["BoundingBox"]["Top"]
-        # find an existing row within tolerance, or start a new one
-        key = next((k for k in rows if abs(k - top) < y_tol), None)
-        rows[key or top].append(b)
-    # sort rows top→bottom, then words left→right
-    lines = []
-    for top in sorted(rows):
-        words = sorted(rows[top], key=lambda w: w["Geometry"]["BoundingBox"]["Left"])
-        lines.append(" ".join(w["Text"] for w in words))
-    return lines
-
-
-# 1) Rasterize PDF to images
-def pdf_to_images(path, dpi=300):
-    doc = fitz.open(path)
+def clean_deed_pages(pages):
+    """Clean a batch of page texts, e.g. when re-cleaning cached OCR output."""
+    return [clean_deed_text(page) for page in pages]
+
+
+def estimate_skew(words):
+    """Median slope (dY/dX, page-normalized) of the top edges of word polygons."""
+    slopes = []
+    for w in words:
+        poly = w["Geometry"].get("Polygon")
+        if poly and len(poly) >= 2:
+            dx = poly[1]["X"] - poly[0]["X"]
+            if dx > 0:
+                slopes.append((poly[1]["Y"] - poly[0]["Y"]) / dx)
+    if not slopes:
+        return 0.0
+    slopes.sort()
+    return slopes[len(slopes) // 2]
+
+
+def _line_units(blocks, words):
+    # use Textract's own LINE -> WORD grouping when the response has it;
+    # words no LINE claims are kept as units of their own
+    lines = [b for b in blocks if b["BlockType"] == "LINE"]
+    if not lines:
+        return None
+    by_id = {w["Id"]: w for w in words if "Id" in w}
+    claimed = set()
+    units = []
+    for line in lines:
+        ids = [i for rel in line.get("Relationships", ()) if rel["Type"] == "CHILD"
+               for i in rel["Ids"] if i in by_id]
+        if not ids:
+            continue
+        claimed.update(ids)
+        text = " ".join(by_id[i]["Text"] for i in ids)
+        units.append((line["Geometry"]["BoundingBox"], text))
+    units.extend((w["Geometry"]["BoundingBox"], w["Text"])
+                 for w in words if w.get("Id") not in claimed)
+    return units
+
+
+def words_to_lines(blocks, y_tol=0.005, deskew=False, use_lines=False):
+    """
+    Group a Textract response into text lines, top to bottom.  Words (or
+    Textract LINE blocks, when present and `use_lines` is set) are sorted by
+    Top and swept once: each joins the current row while it is within y_tol
+    of the row's running mean Top, otherwise it starts a new row, so the
+    whole page is O(n log n) and rows don't drift with their first word.
+    With `deskew`, Top is measured along the page skew estimated from the
+    word polygons, which keeps slightly rotated scans from splitting rows.
+    LINE grouping stays opt-in until tests/test_words_to_lines.py shows it
+    agrees with word clustering on recorded responses.
+    """
+    words = [b for b in blocks if b["BlockType"] == "WORD"]
+    units = _line_units(blocks, words) if use_lines else None
+    if units is None:
+        units = [(w["Geometry"]["BoundingBox"], w["Text"]) for w in words]
+    slope = estimate_skew(words) if deskew else 0.0
+
+    keyed = sorted(
+        ((box["Top"] - slope * box["Left"], box["Left"], text) for box, text in units),
+        key=lambda u: u[0],
+    )
+    rows = []
+    row, mean = [], 0.0
+    for top, left, text in keyed:
+        if row and abs(top - mean) >= y_tol:
+            rows.append(row)
+            row = []
+        row.append((left, text))
+        mean += (top - mean) / len(row)
+
+    if row:
+        rows.append(row)
+    # rows are already top->bottom; order words left->right
+    return [" ".join(text for _, text in sorted(r, key=lambda u: u[0])) for r in rows]
+
+
+def render_page(page, dpi=300, gray=False, fmt="png", quality=None, clip=None):
     zoom = dpi / 72
-    mat = fitz.Matrix(zoom, zoom)
-    images = []
-    for page in doc:
-        pix = page.get_pixmap(matrix=mat, alpha=False)
-        images.append(pix.tobytes("png"))
-    return images
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False, clip=clip,
+                          colorspace=fitz.csGRAY if gray else fitz.csRGB)
+    if fmt == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=quality or 75)
+    return pix.tobytes(fmt)
+
+
+# How pages are rasterized for OCR.  The adaptive policy renders 8-bit
+# grayscale at a lower DPI (format may be "png" or "jpeg"), then re-renders
+# at retry_dpi only when more than max_low_fraction of the words come back
+# below min_confidence: just the region around those words, or the whole
+# page when that region covers more than max_region_fraction of it.  Any
+# render over max_bytes is redone at a lower DPI so it stays within
+# Textract's synchronous request limit.
+RenderPolicy = namedtuple(
+    "RenderPolicy",
+    "dpi gray format quality max_bytes retry_dpi min_confidence max_low_fraction max_region_fraction",
+)
+FIXED_RENDER = RenderPolicy(300, False, "png", None, TEXTRACT_MAX_BYTES, None, 0.0, 1.0, 1.0)
+ADAPTIVE_RENDER = RenderPolicy(150, True, "png", None, TEXTRACT_MAX_BYTES, 300, 80.0, 0.05, 0.5)
+DEFAULT_RENDER = ADAPTIVE_RENDER
+
+MIN_RENDER_DPI = 72
+# padding around a low-confidence region, as a fraction of the page
+REGION_MARGIN = 0.02
+
+
+def render_for_ocr(page, policy, dpi=None, region=None):
+    """
+    Render `page` (or the normalized `region` (x0, y0, x1, y1) of it) as
+    `policy` says, stepping the DPI down until the image fits in
+    policy.max_bytes.  Returns (image bytes, dpi used, seconds spent).
+    """
+    start = time.perf_counter()
+    dpi = dpi or policy.dpi
+    clip = None
+    if region is not None:
+        r = page.rect
+        x0, y0, x1, y1 = region
+        clip = fitz.Rect(r.x0 + x0 * r.width, r.y0 + y0 * r.height,
+                         r.x0 + x1 * r.width, r.y0 + y1 * r.height)
+    while True:
+        image = render_page(page, dpi, policy.gray, policy.format, policy.quality, clip)
+        if len(image) <= policy.max_bytes or dpi <= MIN_RENDER_DPI:
+            return image, dpi, time.perf_counter() - start
+        dpi = max(MIN_RENDER_DPI, int(dpi * 0.8))
+
+
+# a text layer needs at least this many words, mostly letters/digits and
+# almost no undecodable glyphs, before we trust it over OCR
+MIN_TEXT_LAYER_WORDS = 25
+MIN_TEXT_LAYER_ALNUM = 0.6
+MAX_TEXT_LAYER_JUNK  = 0.01
+
+
+def text_layer_usable(words):
+    if len(words) < MIN_TEXT_LAYER_WORDS:
+        return False
+    chars = "".join(w[4] for w in words)
+    if not chars:
+        return False
+    alnum = sum(ch.isalnum() for ch in chars)
+    junk  = sum(ch == "\ufffd" or not ch.isprintable() for ch in chars)
+    return (alnum / len(chars) >= MIN_TEXT_LAYER_ALNUM
+            and junk / len(chars) <= MAX_TEXT_LAYER_JUNK)
+
+
+def text_layer_blocks(page):
+    """
+    Return the page's embedded text as Textract-style WORD blocks (normalized
+    BoundingBox, like detect_document_text) so it can go straight through
+    words_to_lines, or None when the page has no usable text layer and has
+    to be rasterized and OCR'd instead.
+    """
+    words = page.get_text("words")
+    if not text_layer_usable(words):
+        return None
+    width, height = page.rect.width, page.rect.height
+    return [
+        {
+            "BlockType": "WORD",
+            "Text": text,
+            "Confidence": 100.0,
+            "Geometry": {"BoundingBox": {
+                "Left":   x0 / width,
+                "Top":    y0 / height,
+                "Width":  (x1 - x0) / width,
+                "Height": (y1 - y0) / height,
+            }},
+        }
+        for x0, y0, x1, y1, text, *_ in words
+    ]
+
+
+# One rendered page: `blocks` holds text-layer WORD blocks when the fast path
+# applied, otherwise `image` holds the raster (encoded per the render
+# policy) to send to OCR.
+RenderedPage = namedtuple("RenderedPage", "index dpi image blocks render_seconds")
+
+
+def prepare_page(page, policy=DEFAULT_RENDER, text_layer=True):
+    start = time.perf_counter()
+    blocks = text_layer_blocks(page) if text_layer else None
+    if blocks is not None:
+        return RenderedPage(page.number, None, None, blocks, time.perf_counter() - start)
+    image, dpi, seconds = render_for_ocr(page, policy)
+    return RenderedPage(page.number, dpi, image, None, time.perf_counter() - start)
+
+
+# each render worker opens the document once and keeps it for its lifetime
+_worker_doc = None
+
+def _open_worker_doc(path):
+    global _worker_doc
+    _worker_doc = fitz.open(path)
+
+
+def _prepare_worker_page(index, policy, text_layer):
+    return prepare_page(_worker_doc[index], policy, text_layer)
+
+
+def iter_rendered_pages(path, policy=DEFAULT_RENDER, workers=2, prefetch=4, text_layer=True,
+                        indices=None):
+    """
+    Yield a RenderedPage for each page of `path` (or just the pages in
+    `indices`), in page order, while a small process pool renders ahead.  At
+    most `prefetch` pages are rendered but not yet consumed, so memory stays
+    flat however long the document is.  workers=0 renders in-process (useful
+    when already inside a worker).
+    """
+    if workers <= 0:
+        with fitz_lock:
+            doc = fitz.open(path)
+        try:
+            for index in range(doc.page_count) if indices is None else indices:
+                with fitz_lock:
+                    page = prepare_page(doc[index], policy, text_layer)
+                yield page
+        finally:
+            with fitz_lock:
+                doc.close()
+        return
+
+    if indices is None:
+        with fitz_lock, fitz.open(path) as doc:
+            indices = range(doc.page_count)
+    if not indices:
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_open_worker_doc,
+        initargs=(path,),
+    ) as pool:
+        pending = deque()
+        try:
+            for i in indices:
+                pending.append(pool.submit(_prepare_worker_page, i, policy, text_layer))
+                if len(pending) >= prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
 
 metes = os.path.join(os.path.dirname(__file__), "1194_995_TrucksAndStuffs/NM-ED-00022.00081 .pdf")
 
-open_client = OpenAI(api_key="")
+# API clients are built on first use, so importing this module (or running
+# it against stand-ins, see use_clients) needs no credentials or network
+_clients = {}
+_clients_lock = threading.Lock()
 
-# Initialize AWS Textract client
-textract = boto3.client(
-    "textract",
-    aws_access_key_id="",
-    aws_secret_access_key="",
-    region_name="us-east-2"
-)
 
-def process_page(cleaned_pages, start_idx):
-    """
-    Stitch together cleaned_pages[start_idx] plus as many subsequent pages
-    as needed up through the first semicolon.  Return a tuple:
-      (stitched_text, segments, last_idx_consumed)
-    If we find a semicolon on a later page, we only mark start_idx as consumed,
-    leaving the remainder of that later page in cleaned_pages for the next pass.
-    """
-    combined = cleaned_pages[start_idx].strip()
-    idx = start_idx
-    partial = False  # did we cut in the middle of a page?
-
-    # Keep pulling until we see a semicolon or run out of pages
-    while not combined.endswith(";") and idx + 1 < len(cleaned_pages):
-        idx += 1
-        next_txt = cleaned_pages[idx]
-        if ";" in next_txt:
-            # consume up through that semicolon
-            pos = next_txt.find(";")
-            combined += " " + next_txt[: pos + 1].strip()
-            # leave the remainder for next time
-            cleaned_pages[idx] = next_txt[pos + 1 :].strip()
-            partial = True
-            break
-        else:
-            # no semicolon here, consume the whole page
-            combined += " " + next_txt.strip()
-
-    # if we exhausted pages without finding a semicolon, idx will be last page
-    # if combined now ends in ';' but partial==True, we've only consumed start_idx
-    # otherwise we consumed through idx
-    last_consumed = start_idx if partial else idx
-
-    # call the LLM on our stitched chunk
-    response = open_client.chat.completions.create(
-        model="gpt-4-0613",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT_LINES},
-            {"role":   "user", "content": combined}
-        ],
-        functions     = [EXTRACT_METES_BOUNDS_SCHEMA],
-        function_call = {"name": "extract_metes_bounds"},
-        temperature   = 0
-    )
+def llm_client():
+    with _clients_lock:
+        if "llm" not in _clients:
+            from openai import OpenAI
+            _clients["llm"] = OpenAI(api_key="")
+        return _clients["llm"]
+
+
+def textract_client():
+    with _clients_lock:
+        if "textract" not in _clients:
+            import boto3
+            # Initialize AWS Textract client
+            _clients["textract"] = boto3.client(
+                "textract",
+                aws_access_key_id="",
+                aws_secret_access_key="",
+                region_name="us-east-2"
+            )
+        return _clients["textract"]
+
+
+def s3_client():
+    with _clients_lock:
+        if "s3" not in _clients:
+            import boto3
+            # uploads for asynchronous Textract jobs
+            _clients["s3"] = boto3.client(
+                "s3",
+                aws_access_key_id="",
+                aws_secret_access_key="",
+                region_name="us-east-2"
+            )
+        return _clients["s3"]
+
 
-    args = json.loads(response.choices[0].message.function_call.arguments)
-    segments = args.get("segments", [])
+def use_clients(llm=None, textract=None, s3=None):
+    """Use `llm` (OpenAI-style), `textract` and/or `s3` (boto3-style) in place of the real clients."""
+    with _clients_lock:
+        if llm is not None:
+            _clients["llm"] = llm
+        if textract is not None:
+            _clients["textract"] = textract
+        if s3 is not None:
+            _clients["s3"] = s3
 
-    # normalize bearings
-    for s in segments:
-        if s.get("bearing"):
-            s["bearing"] = format_bearing(s["bearing"])
 
-    return combined, segments, last_consumed
+def detect_cached(image, dpi, ocr, cache=None):
+    """Blocks for one page image and the bytes actually sent to Textract (0 on a cache hit)."""
+    if cache is None:
+        return ocr.detect(image), len(image)
+    key = cache.key(image, dpi, ocr.mode)
+    blocks = cache.get(key)
+    if blocks is not None:
+        return blocks, 0
+    blocks = ocr.detect(image)
+    cache.put(key, blocks)
+    return blocks, len(image)
 
 
-def main():
-    # rasterize / OCR / clean all pages first
-    pages = pdf_to_images(metes)
+def _ocr_page(image, dpi, ocr, cache, **labels):
+    with stage("ocr", dpi=dpi, **labels) as span:
+        blocks, sent = detect_cached(image, dpi, ocr, cache)
+        span.add(bytes_in=len(image), bytes_sent=sent,
+                 cache_hits=int(not sent), cache_misses=int(bool(sent)),
+                 words=sum(b["BlockType"] == "WORD" for b in blocks))
+    return blocks, sent
+
+
+def low_confidence_region(blocks, policy):
+    """
+    Normalized (x0, y0, x1, y1) region worth re-rendering at policy.retry_dpi,
+    or None when few enough words fall below policy.min_confidence.
+    """
+    if not policy.retry_dpi:
+        return None
+    words = [b for b in blocks if b["BlockType"] == "WORD"]
+    low = [w["Geometry"]["BoundingBox"] for w in words
+           if w.get("Confidence", 100.0) < policy.min_confidence]
+    if not words or len(low) <= policy.max_low_fraction * len(words):
+        return None
+    x0 = max(0.0, min(b["Left"] for b in low) - REGION_MARGIN)
+    y0 = max(0.0, min(b["Top"] for b in low) - REGION_MARGIN)
+    x1 = min(1.0, max(b["Left"] + b["Width"] for b in low) + REGION_MARGIN)
+    y1 = min(1.0, max(b["Top"] + b["Height"] for b in low) + REGION_MARGIN)
+    if (x1 - x0) * (y1 - y0) > policy.max_region_fraction:
+        return (0.0, 0.0, 1.0, 1.0)
+    return (x0, y0, x1, y1)
+
+
+def _to_page(geometry, region):
+    # map a Geometry from region-relative to page-relative coordinates
+    x0, y0, x1, y1 = region
+    w, h = x1 - x0, y1 - y0
+    box = geometry["BoundingBox"]
+    mapped = {"BoundingBox": {"Left": x0 + box["Left"] * w, "Top": y0 + box["Top"] * h,
+                              "Width": box["Width"] * w, "Height": box["Height"] * h}}
+    if "Polygon" in geometry:
+        mapped["Polygon"] = [{"X": x0 + p["X"] * w, "Y": y0 + p["Y"] * h}
+                             for p in geometry["Polygon"]]
+    return mapped
+
+
+def merge_region(blocks, region_blocks, region):
+    """Replace the WORD/LINE blocks centred inside `region` with a re-render's blocks."""
+    if region == (0.0, 0.0, 1.0, 1.0):
+        return region_blocks
+    x0, y0, x1, y1 = region
+
+    def inside(block):
+        box = block["Geometry"]["BoundingBox"]
+        cx, cy = box["Left"] + box["Width"] / 2, box["Top"] + box["Height"] / 2
+        return x0 <= cx <= x1 and y0 <= cy <= y1
+
+    merged = [b for b in blocks if b["BlockType"] not in ("WORD", "LINE") or not inside(b)]
+    for b in region_blocks:
+        if b["BlockType"] not in ("WORD", "LINE"):
+            continue
+        # prefix Ids so they can't collide with the first pass
+        b = dict(b, Geometry=_to_page(b["Geometry"], region))
+        if "Id" in b:
+            b["Id"] = f"r-{b['Id']}"
+        if "Relationships" in b:
+            b["Relationships"] = [dict(rel, Ids=[f"r-{i}" for i in rel["Ids"]])
+                                  for rel in b["Relationships"]]
+        merged.append(b)
+    return merged
+
+
+def page_blocks(path, page, ocr, policy=DEFAULT_RENDER, cache=None):
+    """
+    OCR one RenderedPage and return (blocks, report).  Text-layer pages
+    already carry their words.  Scans get a second, higher-DPI pass over the
+    low-confidence region when the policy asks for one.  `report` records
+    the DPI, bytes uploaded and render time for the page.
+    """
+    report = {"page": page.index, "source": "text", "dpi": page.dpi, "bytes": 0,
+              "render_s": round(page.render_seconds, 4), "retry_dpi": None,
+              "retry_region": None, "retry_bytes": 0, "retry_render_s": 0.0}
+    if page.blocks is not None:
+        record("rasterize", page.render_seconds, {"words": len(page.blocks)},
+               page=page.index, source="text")
+        return page.blocks, report
+    report["source"] = "ocr"
+    # rendering may have happened in a worker process; report it from here
+    record("rasterize", page.render_seconds, {"bytes_out": len(page.image)},
+           page=page.index, source="ocr", dpi=page.dpi)
+    blocks, report["bytes"] = _ocr_page(page.image, page.dpi, ocr, cache, page=page.index)
+
+    region = low_confidence_region(blocks, policy)
+    if region is None:
+        return blocks, report
+    with fitz_lock, fitz.open(path) as doc:
+        pdf_page = doc[page.index]
+        if pdf_page.rotation:
+            # region coordinates follow the rotated raster; redo the whole page
+            region = (0.0, 0.0, 1.0, 1.0)
+        image, dpi, seconds = render_for_ocr(
+            pdf_page, policy, policy.retry_dpi,
+            None if region == (0.0, 0.0, 1.0, 1.0) else region)
+    record("rasterize", seconds, {"bytes_out": len(image)},
+           page=page.index, source="retry", dpi=dpi)
+    retry_blocks, report["retry_bytes"] = _ocr_page(image, dpi, ocr, cache,
+                                                    page=page.index, retry=True)
+    report["retry_dpi"] = dpi
+    report["retry_region"] = round((region[2] - region[0]) * (region[3] - region[1]), 3)
+    report["retry_render_s"] = round(seconds, 4)
+    return merge_region(blocks, retry_blocks, region), report
+
+
+# Packets at least this long, or with a page bigger than ASYNC_MIN_PAGE_AREA
+# (square points; 11x17 in), go to Textract as one asynchronous job: per-page
+# synchronous calls dominate on long scans, and large-format pages need
+# their DPI cut to fit the synchronous size limit.
+ASYNC_MIN_PAGES = 20
+ASYNC_MIN_PAGE_AREA = 11 * 17 * 72 * 72
+# --ocr: choose per document as above, or always use one backend
+OCR_MODES = ("auto", "sync", "job")
+
+
+def select_ocr(path, sync=None, job=None, mode="auto", bucket=TEXTRACT_JOB_BUCKET,
+               min_pages=ASYNC_MIN_PAGES, min_page_area=ASYNC_MIN_PAGE_AREA):
+    """
+    The OCR backend for `path`: `job` (by default a TextractJobOCR uploading
+    to `bucket`) for long or large-format packets, otherwise `sync` (by
+    default a TextractOCR).  `mode` "sync" or "job" (see OCR_MODES) takes
+    that backend whatever the document.
+    """
+    if mode == "auto":
+        with fitz_lock, fitz.open(path) as doc:
+            large = doc.page_count >= min_pages or any(
+                page.rect.width * page.rect.height > min_page_area for page in doc)
+    else:
+        large = mode == "job"
+    if large:
+        return job or TextractJobOCR(textract_client(), s3_client(), bucket=bucket)
+    return sync or TextractOCR(textract_client())
+
+
+def _pdf_bytes(doc, pages):
+    # `pages` of `doc` as a PDF of their own; no fresh /ID, so the same pages
+    # always come out as the same bytes (cache key and job request token)
+    with fitz.open() as out:
+        for i in pages:
+            out.insert_pdf(doc, from_page=i, to_page=i)
+        return out.tobytes(garbage=3, deflate=True, no_new_id=True)
+
+
+def job_page_blocks(path, ocr, text_layer=True, cache=None):
+    """
+    OCR `path` with one multi-page job and yield (blocks, report) per page,
+    in page order.  Pages with a usable text layer keep their own words;
+    only the others are copied into the PDF that is uploaded, and the
+    job's pages are mapped back onto their page numbers.  With `cache`,
+    each page's Blocks are cached on their own, keyed by that page as a
+    one-page PDF, so the cache holds the same per-page shape as the
+    synchronous path and only pages it misses go into the job.
+    """
+    start = time.perf_counter()
+    with fitz_lock, fitz.open(path) as doc:
+        layers = [text_layer_blocks(page) if text_layer else None for page in doc]
+        scans = [i for i, blocks in enumerate(layers) if blocks is None]
+        keys = {i: cache.key(_pdf_bytes(doc, [i]), None, ocr.mode) for i in scans} \
+            if cache is not None else {}
+    job_blocks = {}
+    for i, key in keys.items():
+        blocks = cache.get(key)
+        if blocks is not None:
+            job_blocks[i] = blocks
+    missing = [i for i in scans if i not in job_blocks]
+    document = None
+    if missing:
+        with fitz_lock, fitz.open(path) as doc:
+            document = _pdf_bytes(doc, missing)
+    seconds = time.perf_counter() - start
+
+    sent = 0
+    if scans:
+        record("rasterize", seconds, {"bytes_out": len(document or b"")}, source="job",
+               pages=len(missing))
+        with stage("ocr", mode="job", pages=len(scans)) as span:
+            if document is not None:
+                job_pages = ocr.detect_document(document)
+                if len(job_pages) != len(missing):
+                    raise ValueError(f"{path}: Textract job returned {len(job_pages)} pages "
+                                     f"for {len(missing)} uploaded")
+                sent = len(document)
+                for i, blocks in zip(missing, job_pages):
+                    job_blocks[i] = blocks
+                    if cache is not None:
+                        cache.put(keys[i], blocks)
+            span.add(bytes_in=len(document or b""), bytes_sent=sent,
+                     cache_hits=len(scans) - len(missing), cache_misses=len(missing),
+                     words=sum(b["BlockType"] == "WORD" for i in scans for b in job_blocks[i]))
+
+    for index, blocks in enumerate(layers):
+        report = {"page": index, "source": "text", "dpi": None, "bytes": 0,
+                  "render_s": 0.0, "retry_dpi": None, "retry_region": None,
+                  "retry_bytes": 0, "retry_render_s": 0.0}
+        if blocks is None:
+            blocks = job_blocks[index]
+            report["source"] = "job"
+            # the upload is reported once, against the first page it covered
+            if index == scans[0]:
+                report["bytes"], report["render_s"] = sent, round(seconds, 4)
+        yield blocks, report
+
+
+def iter_page_blocks(path, ocr, policy=DEFAULT_RENDER, render_workers=2, prefetch_pages=4,
+                     text_layer=True, ocr_cache=None):
+    """
+    (blocks, report) for every page of `path`, in page order, whichever
+    backend `ocr` is: page images rendered ahead and OCR'd concurrently for
+    TextractOCR, one job for the whole document for TextractJobOCR.
+    """
+    if ocr.multi_page:
+        return job_page_blocks(path, ocr, text_layer, ocr_cache)
+    pages = iter_rendered_pages(path, policy, render_workers, prefetch_pages, text_layer)
+    ocr_results = ordered_map(lambda page: page_blocks(path, page, ocr, policy, ocr_cache),
+                              pages, ocr.max_in_flight)
+    return prefetch(ocr_results, prefetch_pages)
+
+
+def iter_cleaned_pages(path, policy=DEFAULT_RENDER, render_workers=2, prefetch_pages=4,
+                       text_layer=True, ocr=None, ocr_cache=None, page_reports=None):
+    """
+    Stream cleaned page text for `path`: render -> OCR -> words_to_lines ->
+    clean_deed_text, one page at a time.  Rendering runs in a process pool
+    and OCR requests run concurrently (rate-limited by `ocr`) in the
+    background, so both overlap with whatever the caller does with each
+    page (stitching, LLM calls).  Pages with a usable embedded text layer
+    skip rasterization and OCR entirely, and pages already in `ocr_cache`
+    are never sent to Textract again.  Without `ocr`, select_ocr picks the
+    backend.  Per-page render/upload reports are appended to
+    `page_reports` when given.
+    """
+    ocr = ocr or select_ocr(path)
+    for blocks, report in iter_page_blocks(path, ocr, policy, render_workers, prefetch_pages,
+                                           text_layer, ocr_cache):
+        if page_reports is not None:
+            page_reports.append(report)
+        with stage("lines", page=report["page"]) as span:
+            lines = words_to_lines(blocks)
+            raw   = " ".join(lines)
+            span.add(lines=len(lines), bytes_out=len(raw))
+        with stage("clean", page=report["page"]) as span:
+            text = clean_deed_text(raw)
+            span.add(bytes_in=len(raw), bytes_out=len(text))
+        yield text
+
+
+def normalize_segments(segments):
+    with stage("normalize") as span:
+        for s in segments:
+            if s.get("bearing"):
+                s["bearing"] = format_bearing(s["bearing"])
+        span.add(segments=len(segments))
+    return segments
+
+
+LLM_MODEL = "gpt-4-0613"
+# chunks are independent once planned, so several LLM calls can be in flight
+LLM_MAX_IN_FLIGHT = 8
+
+
+def _llm_arguments(system_prompt, schema, text, llm_cache, span):
+    # function-call arguments for `text`, from llm_cache or a fresh call
+    args = None
+    if llm_cache is not None:
+        key = llm_cache.key(LLM_MODEL, system_prompt, schema, text)
+        args = llm_cache.get(key)
+
+    if args is None:
+        response = llm_client().chat.completions.create(
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role":   "user", "content": text}
+            ],
+            functions     = [schema],
+            function_call = {"name": schema["name"]},
+            temperature   = 0
+        )
+        args = json.loads(response.choices[0].message.function_call.arguments)
+        if llm_cache is not None:
+            # cache the raw arguments; normalization is re-applied on read
+            llm_cache.put(key, args)
+        usage = getattr(response, "usage", None)
+        span.add(cache_misses=1,
+                 prompt_tokens=getattr(usage, "prompt_tokens", None) or 0,
+                 completion_tokens=getattr(usage, "completion_tokens", None) or 0)
+    else:
+        span.add(cache_hits=1)
+    return args
+
+
+def llm_segments(text, llm_cache=None):
+    """Raw LLM segments for `text` (function-call arguments, before normalization)."""
+    with stage("llm") as span:
+        # call the LLM on our stitched chunk
+        args = _llm_arguments(SYSTEM_PROMPT_LINES, EXTRACT_METES_BOUNDS_SCHEMA, text,
+                              llm_cache, span)
+        segments = args.get("segments", [])
+        span.add(bytes_in=len(text), segments=len(segments))
+    return segments
+
+
+def extract_inventory(clause, llm_cache=None, wanted=INVENTORY_FIELDS):
+    """
+    Inventory fields for one inventory clause: the regexes first, then one
+    extract_inventory call whenever they leave a field of `wanted` empty;
+    regex values win over the LLM's.  Only a `wanted` the regexes cover
+    (inventory.REGEX_FIELDS) can be answered without a call.  No clause
+    (None or "") gives a record of nulls without a call.
+    """
+    if not clause:
+        return merge_inventory({})
+    found = regex_inventory(clause)
+    if not missing_fields(found, wanted):
+        return merge_inventory(found)
+    with stage("inventory") as span:
+        args = _llm_arguments(SYSTEM_PROMPT_INVENTORY, INVENTORY_SCHEMA_FUNCTION, clause,
+                              llm_cache, span)
+        span.add(bytes_in=len(clause))
+    return merge_inventory(found, args)
+
+
+def chunk_runs(chunk, fast_path=True, parser_stats=None):
+    """
+    Split one Chunk into call_parser Runs.  With `fast_path`, calls the
+    grammar resolves carry their segments and only the runs of calls it
+    can't resolve (segments None) need the LLM.  Without it, or when the
+    grammar can't parse anything, the chunk is one run sent whole.
+    """
+    if not fast_path:
+        return [Run(chunk.text, None, chunk.calls)]
+    with stage("parse") as span:
+        runs = parse_chunk(chunk.text)
+        span.add(calls=sum(r.calls for r in runs),
+                 parsed=sum(r.calls for r in runs if r.segments is not None))
+    if parser_stats is not None:
+        parser_stats.record(runs)
+    return runs
+
+
+def iter_raw_extractions(chunks, llm_cache=None, max_in_flight=LLM_MAX_IN_FLIGHT,
+                         fast_path=True, parser_stats=None):
+    """
+    Extract `chunks` with up to `max_in_flight` LLM calls outstanding,
+    yielding (chunk, raw segments) in chunk order, before normalization.
+    The LLM runs of every chunk share one window, so a chunk the fast path
+    split into several runs doesn't send them one after another.  `chunks`
+    may be a planned list or a lazy iter_chunks stream; a stream is only
+    consumed as fast as calls complete.
+    """
+    def runs():
+        for chunk in chunks:
+            planned = chunk_runs(chunk, fast_path, parser_stats)
+            for i, run in enumerate(planned):
+                yield chunk, i == len(planned) - 1, run
+
+    def resolve(item):
+        chunk, last, run = item
+        if run.segments is None:
+            return chunk, last, llm_segments(run.text, llm_cache)
+        return chunk, last, run.segments
+
+    segments = []
+    for chunk, last, segs in ordered_map(resolve, runs(), max_in_flight):
+        segments.extend(segs)
+        if last:
+            yield chunk, segments
+            segments = []
+
+
+def _empty(value):
+    return value is None or value == "" or value == []
+
+
+def _whole_course(segment):
+    return (segment.get("callType") in ("line", "curve") and not _empty(segment.get("bearing"))
+            and not _empty(segment.get("distance")))
+
+
+def _join_halves(first, second):
+    """
+    One segment from the segments either side of a cut, or None when they
+    are separate calls: two whole courses that differ, or a point followed
+    by a whole course.  Otherwise `first` keeps its fields and takes the
+    ones it lacks from `second`, which also covers the LLM returning the
+    same course from both halves.
+    """
+    if _whole_course(second) and (first.get("callType") == "point" or _whole_course(first) and (
+            first.get("bearing"), first.get("distance")) != (second.get("bearing"),
+                                                           second.get("distance"))):
+        return None
+    joined = dict(first)
+    for key, value in second.items():
+        if _empty(joined.get(key)) and not _empty(value):
+            joined[key] = value
+    if joined.get("callType") == "point" and second.get("callType") in ("line", "curve"):
+        joined["callType"] = second["callType"]
+    points = (first.get("pointsOnLine") or []) + [
+        p for p in second.get("pointsOnLine") or [] if p not in (first.get("pointsOnLine") or [])]
+    if points:
+        joined["pointsOnLine"] = points
+    return joined
+
+
+def join_cut_calls(extractions):
+    """
+    Put calls the packer cut across chunks back together in a (chunk,
+    segments) stream.  A `continued` chunk opens with the rest of the
+    previous chunk's last call, which the LLM saw in two halves; when the
+    segments either side of the cut are one call (see _join_halves) they
+    become one segment at the end of the earlier chunk.  Each chunk is
+    held back until the next one shows whether it continues it.
+    """
+    pending = None
+    for chunk, segments in extractions:
+        if pending is not None:
+            if chunk.continued and pending[1] and segments:
+                joined = _join_halves(pending[1][-1], segments[0])
+                if joined is not None:
+                    pending[1][-1] = joined
+                    segments = segments[1:]
+            yield pending
+        pending = (chunk, segments)
+    if pending is not None:
+        yield pending
+
+
+def iter_extractions(chunks, llm_cache=None, max_in_flight=LLM_MAX_IN_FLIGHT,
+                     fast_path=True, parser_stats=None):
+    """iter_raw_extractions with cut calls joined and each chunk's segments normalized."""
+    for chunk, segments in join_cut_calls(iter_raw_extractions(chunks, llm_cache, max_in_flight,
+                                                               fast_path, parser_stats)):
+        yield chunk, normalize_segments(segments)
+
+
+def iter_with_inventory(pages, extract, inventory, llm_cache=None):
+    """
+    Run `extract` (cleaned pages -> (chunk, segments) stream) over `pages`
+    and, alongside it, the inventory branch: as soon as the pages seen so
+    far hold the inventory clause, extract_inventory goes to a thread of
+    its own, so its LLM call overlaps the metes-and-bounds calls.  The
+    fields are put into the `inventory` dict once the stream is exhausted.
+    """
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = None
+
+        def tap():
+            nonlocal future
+            seen, size = [], 0
+            for text in pages:
+                if future is None:
+                    seen.append(text)
+                    size += len(text) + 1
+                    clause = find_clause(" ".join(seen))
+                    if clause is not None or size >= INVENTORY_SCAN_CHARS:
+                        future = pool.submit(extract_inventory, clause, llm_cache)
+                yield text
+            if future is None:
+                future = pool.submit(extract_inventory, None, llm_cache)
+
+        yield from extract(tap())
+        inventory.update(future.result())
+
+
+def iter_document(path, ocr_cache=None, llm_cache=None, render_workers=2,
+                  fast_path=True, parser_stats=None, policy=DEFAULT_RENDER, page_reports=None,
+                  min_page_score=MIN_PAGE_SCORE, page_decisions=None, log=print,
+                  chunk_tokens=CHUNK_TOKEN_BUDGET, ocr=None, inventory=None):
+    """
+    Stream (chunk, segments) for one PDF, from rendering through extraction.
+    With an `inventory` dict, the inventory clause is extracted from the
+    same cleaned pages concurrently and its fields put into the dict when
+    the stream ends.
+    """
+    def extract(pages):
+        pages = filter_pages(pages, min_page_score, page_decisions, log)
+        return iter_extractions(iter_chunks(pages, chunk_tokens), llm_cache,
+                                fast_path=fast_path, parser_stats=parser_stats)
+
+    pages = iter_cleaned_pages(path, policy, render_workers, ocr=ocr, ocr_cache=ocr_cache,
+                               page_reports=page_reports)
+    if inventory is None:
+        return extract(pages)
+    return iter_with_inventory(pages, extract, inventory, llm_cache)
+
+
+def add_render_args(parser):
+    parser.add_argument("--render", choices=("adaptive", "fixed"), default="adaptive",
+                        help="adaptive: 150 dpi grayscale, low-confidence regions "
+                             "re-rendered at 300 dpi; fixed: 300 dpi RGB PNG")
+    parser.add_argument("--dpi", type=int, help="first-pass render DPI")
+    parser.add_argument("--retry-dpi", type=int, help="DPI for low-confidence re-renders")
+    parser.add_argument("--min-confidence", type=float,
+                        help="Textract word confidence below which a word counts as low")
+
+
+def add_ocr_args(parser):
+    parser.add_argument("--ocr", choices=OCR_MODES, default="auto",
+                        help="Textract backend: per-page synchronous calls (sync), one "
+                             "asynchronous job per document through S3 (job), or a job only for "
+                             f"packets of {ASYNC_MIN_PAGES}+ pages or large-format sheets "
+                             "(auto, the default)")
+    parser.add_argument("--bucket", default=TEXTRACT_JOB_BUCKET,
+                        help=f"S3 bucket documents are uploaded to for Textract jobs "
+                             f"(default {TEXTRACT_JOB_BUCKET})")
+
+
+def render_policy(args):
+    policy = ADAPTIVE_RENDER if args.render == "adaptive" else FIXED_RENDER
+    overrides = {"dpi": args.dpi, "retry_dpi": args.retry_dpi,
+                 "min_confidence": args.min_confidence}
+    return policy._replace(**{k: v for k, v in overrides.items() if v is not None})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract metes-and-bounds calls from a deed PDF.")
+    parser.add_argument("--refresh-llm-cache", action="store_true",
+                        help="ignore cached LLM responses (fresh ones are still stored)")
+    parser.add_argument("--no-fast-path", action="store_true",
+                        help="send every chunk to the LLM instead of parsing plain calls locally")
+    parser.add_argument("--min-page-score", type=float, default=MIN_PAGE_SCORE,
+                        help="pages scoring below this skip LLM extraction; 0 keeps every page "
+                             f"(default {MIN_PAGE_SCORE})")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKEN_BUDGET,
+                        help=f"deed-text tokens packed into one LLM request (default {CHUNK_TOKEN_BUDGET})")
+    parser.add_argument("--no-inventory", action="store_true",
+                        help="skip extracting the inventory clause (acreage, county, volume/page, ...)")
+    parser.add_argument("--summary", metavar="PATH",
+                        help="write a per-stage timing/bytes/tokens summary (JSON) to PATH")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="write a Chrome trace (chrome://tracing, Perfetto) to PATH")
+    add_render_args(parser)
+    add_ocr_args(parser)
+    args = parser.parse_args(argv)
+
+    ocr_cache = OcrCache()
+    llm_cache = LlmCache(bypass=args.refresh_llm_cache)
+    parser_stats = ParserStats()
+    page_reports = []
+    page_decisions = []
     cleaned_pages = []
-    for png in pages:
-        resp  = textract.detect_document_text(Document={"Bytes": png})
-        lines = words_to_lines(resp["Blocks"])
-        raw   = " ".join(lines)
-        cleaned_pages.append(clean_deed_text(raw))
+
+    def pages():
+        for text in iter_cleaned_pages(metes, render_policy(args),
+                                       ocr=select_ocr(metes, mode=args.ocr, bucket=args.bucket),
+                                       ocr_cache=ocr_cache, page_reports=page_reports):
+            cleaned_pages.append(text)
+            yield text
+
+    def extract(cleaned):
+        kept = filter_pages(cleaned, args.min_page_score, page_decisions)
+        return iter_extractions(iter_chunks(kept, args.chunk_tokens), llm_cache,
+                                fast_path=not args.no_fast_path, parser_stats=parser_stats)
 
     all_segments = []
-    i = 0
-    while i < len(cleaned_pages):
-        stitched_text, segs, consumed = process_page(cleaned_pages, i)
-        all_segments.extend(segs)
-        # if we only consumed the start page, move one ahead;
-        # if we consumed through a full page-run, skip those
-        i = consumed + 1
+    inventory = None if args.no_inventory else {}
+    instrumented = args.summary or args.trace
+    with recording(os.path.basename(metes)) if instrumented else nullcontext() as recorder:
+        if inventory is None:
+            extractions = extract(pages())
+        else:
+            extractions = iter_with_inventory(pages(), extract, inventory, llm_cache)
+        for _, segs in extractions:
+            all_segments.extend(segs)
+    if args.summary:
+        recorder.write_summary(args.summary)
+    if args.trace:
+        recorder.write_trace(args.trace)
 
-    # now build the prompt from whatever remains
-    full_prompt = "\n".join(cleaned_pages).strip()
+    # the prompt covers the same pages the segments were extracted from
+    full_prompt = "\n".join(cleaned_pages[d.index] for d in page_decisions if d.keep).strip()
 
     # write out JSON
     output = {
         "prompt":     full_prompt,
         "completion": json.dumps({"segments": all_segments}, ensure_ascii=False)
     }
+    if inventory is not None:
+        output["inventory"] = inventory
     with open("output.json", "w", encoding="utf-8") as f:
         json.dump(output, f, ensure_ascii=False, indent=2)
 
-    print(f"Extracted {len(all_segments)} segments across {len(pages)} pages.")
+    print(f"Extracted {len(all_segments)} segments across {len(cleaned_pages)} pages.")
+    print(f"OCR cache: {ocr_cache.stats()}")
+    print(f"LLM cache: {llm_cache.stats()}")
+    print(f"Call parser: {parser_stats.stats()}")
+    if inventory is not None:
+        print(f"Inventory: {json.dumps(inventory, ensure_ascii=False)}")
+    skipped = [d for d in page_decisions if not d.keep]
+    print(f"Page filter: {len(page_decisions) - len(skipped)} pages kept, {len(skipped)} skipped "
+          f"({sum(len(cleaned_pages[d.index].split()) for d in skipped)} words not sent).")
+    for report in page_reports:
+        print(f"Page {report}")
+    uploaded = sum(r["bytes"] + r["retry_bytes"] for r in page_reports)
+    rendered = sum(r["render_s"] + r["retry_render_s"] for r in page_reports)
+    retried = sum(r["retry_dpi"] is not None for r in page_reports)
+    print(f"Uploaded {uploaded} bytes to Textract, {rendered:.2f}s rendering, "
+          f"{retried} pages re-rendered.")
+    if recorder is not None:
+        for name, totals in recorder.summary()["stages"].items():
+            print(f"Stage {name}: {totals}")
 
 
     for seg in all_segments:
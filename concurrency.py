@@ -0,0 +1,75 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# PyMuPDF isn't thread-safe; every module that opens or renders documents
+# in-process (rendering, OCR re-renders on the OCR threads, stages) takes
+# this one lock around its fitz calls
+fitz_lock = threading.Lock()
+
+
+def ordered_map(fn, iterable, max_in_flight=4):
+    """
+    Apply `fn` to each item of `iterable` on a thread pool, with at most
+    `max_in_flight` calls outstanding, and yield the results in input order.
+    The input is consumed lazily, only as fast as results are taken.
+    """
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        pending = deque()
+        try:
+            for item in iterable:
+                pending.append(pool.submit(fn, item))
+                if len(pending) >= max_in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def prefetch(iterable, maxsize=2):
+    """
+    Drive `iterable` from a background thread, handing items over through a
+    bounded queue so that stage can work up to `maxsize` items ahead of the
+    consumer.  Exceptions raised by the producer are re-raised here.
+    """
+    q = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        it = iter(iterable)
+        try:
+            for item in it:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except BaseException as exc:
+            put((False, exc))
+        finally:
+            close = getattr(it, "close", None)
+            if close:
+                close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            ok, item = q.get()
+            if ok:
+                yield item
+            elif item is None:
+                return
+            else:
+                raise item
+    finally:
+        stop.set()
@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Optional per-stage instrumentation.  Pipeline code wraps each stage in
+#
+#     with stage("ocr", page=3) as span:
+#         ...
+#         span.add(bytes_in=len(image), words=n)
+#
+# and every finished span is handed to the installed hooks.  Keyword
+# arguments to stage() label the span; counts passed to add() are summed
+# per stage in the summary.  With no hook installed stage() returns a
+# shared no-op span, so instrumentation that is off costs one list check
+# per stage.
+
+_hooks = []
+
+
+class Span:
+    __slots__ = ("name", "labels", "counts", "start", "seconds", "thread")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.counts = {}
+        self.start = None
+        self.seconds = None
+        self.thread = threading.current_thread()
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        _emit(self)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def add(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _emit(span):
+    for hook in tuple(_hooks):
+        hook(span)
+
+
+def stage(name, **labels):
+    """Context manager timing one run of stage `name`; a no-op unless a hook is installed."""
+    if not _hooks:
+        return _NULL_SPAN
+    return Span(name, labels)
+
+
+def record(name, seconds, counts=None, **labels):
+    """
+    Report a stage that was timed elsewhere (e.g. in a render worker
+    process) as having taken `seconds` and ending now.
+    """
+    if not _hooks:
+        return
+    span = Span(name, labels)
+    span.seconds = seconds
+    span.start = time.perf_counter() - seconds
+    if counts:
+        span.add(**counts)
+    _emit(span)
+
+
+def add_hook(hook):
+    """Call `hook(span)` for every finished span, from whichever thread finished it."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Recorder:
+    """Hook that keeps every span, for a JSON summary and a Chrome trace."""
+
+    def __init__(self, document=None):
+        self.document = document
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def __call__(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self):
+        """Per-stage count, total and percentile wall time, and summed counts."""
+        with self._lock:
+            spans = list(self.spans)
+        stages = {}
+        for span in spans:
+            stages.setdefault(span.name, []).append(span)
+        summary = {
+            "document": self.document,
+            "wall_s": round(max(s.start + s.seconds for s in spans)
+                            - min(s.start for s in spans), 4) if spans else 0.0,
+            "stages": {},
+        }
+        for name, group in stages.items():
+            ordered = sorted(s.seconds for s in group)
+            totals = {}
+            for span in group:
+                for key, value in span.counts.items():
+                    totals[key] = totals.get(key, 0) + value
+            summary["stages"][name] = dict({
+                "count":     len(group),
+                "seconds":   round(sum(ordered), 4),
+                "p50_ms":    round(1000 * _percentile(ordered, 0.50), 3),
+                "p95_ms":    round(1000 * _percentile(ordered, 0.95), 3),
+                "max_ms":    round(1000 * ordered[-1], 3),
+            }, **totals)
+        return summary
+
+    def chrome_trace(self):
+        """The spans as Chrome trace events (chrome://tracing, ui.perfetto.dev)."""
+        with self._lock:
+            spans = list(self.spans)
+        pid = os.getpid()
+        origin = min((s.start for s in spans), default=0.0)
+        events = []
+        threads = {}
+        for span in spans:
+            tid = threads.setdefault(span.thread.ident, (len(threads), span.thread.name))[0]
+            events.append({
+                "name": span.name, "cat": "pipeline", "ph": "X", "pid": pid, "tid": tid,
+                "ts": round((span.start - origin) * 1e6, 1),
+                "dur": round(span.seconds * 1e6, 1),
+                "args": dict(span.labels, **span.counts),
+            })
+        for tid, name in threads.values():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"document": self.document}}
+
+    def write_summary(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+    def write_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+
+
+@contextmanager
+def recording(document=None):
+    """Install a Recorder for the duration of the block and hand it out."""
+    recorder = Recorder(document)
+    add_hook(recorder)
+    try:
+        yield recorder
+    finally:
+        remove_hook(recorder)
@@ -0,0 +1,114 @@
+import re
+
+from call_parser import HEAD_RE
+from schema_function import INVENTORY_SCHEMA_FUNCTION
+
+# Local half of inventory extraction.  The inventory clause is the text
+# before a description's first BEGINNING/COMMENCING head ("A 50-foot wide
+# strip ... situated in Section 21, Block 39, ... Upton County, Texas, ...
+# in Volume 1051, Page 153 of Official Public Records of Upton County").
+# The fields that are written the same way in every deed (volume/page,
+# county and state, acreage, abstract, records) are read with regexes; the
+# LLM is needed for everything they leave out, which always includes the
+# parties, the original survey and the date.
+
+INVENTORY_FIELDS = tuple(INVENTORY_SCHEMA_FUNCTION["parameters"]["properties"])
+# the fields regex_inventory can fill
+REGEX_FIELDS = ("volume", "page", "county", "state", "acreage", "acreageUnit", "abstract",
+                "sourceOfRecords")
+
+# at most this much text before the head is the clause; if no head turns up
+# within INVENTORY_SCAN_CHARS of the start of a document it has no clause
+INVENTORY_MAX_CHARS = 3000
+INVENTORY_SCAN_CHARS = 20000
+# a shorter "clause" is a page header or a caption, not an inventory
+INVENTORY_MIN_CHARS = 40
+
+_STATES = ("Texas", "New Mexico", "Oklahoma", "Louisiana", "Colorado")
+
+_VOLUME_PAGE_RE = re.compile(
+    r"\b(?:Volume|Vol\.?|Book|Bk\.?)\s*(\d+)\s*,?\s*(?:at\s+)?(?:Pages?|Pgs?\.?|P\.)\s*(\d+)",
+    re.IGNORECASE,
+)
+_COUNTY_RE = re.compile(
+    rf"((?:[A-Za-z][A-Za-z'-]*\s+){{1,3}})County\b\s*,?\s*({'|'.join(_STATES)})\b", re.IGNORECASE
+)
+_ACREAGE_RE = re.compile(r"\b(\d{1,3}(?:,\d{3})*(?:\.\d+)?|\d+(?:\.\d+)?)\s*(acres?|ac\.)(?!\w)",
+                         re.IGNORECASE)
+_ABSTRACT_RE = re.compile(r"\bAbstract\s*(?:No\.?|Number)?\s*:?\s*([A-Z]?-?\d+)\b", re.IGNORECASE)
+_RECORDS_RE = re.compile(
+    r"\b((?:Official\s+Public|Official|Deed|Real\s+Property|Public)\s+Records\s+of\s+"
+    rf"(?:[A-Za-z][A-Za-z'-]*\s+){{1,3}}?County(?:\s*,\s*(?:{'|'.join(_STATES)}))?)",
+    re.IGNORECASE,
+)
+# words that can come just before a county name but aren't part of it
+_NOT_COUNTY = {"of", "in", "the", "said", "and", "records", "public", "official", "deed",
+               "real", "property", "situated", "located", "being", "lying", "within", "a"}
+
+
+def find_clause(text, max_chars=INVENTORY_MAX_CHARS):
+    """
+    The inventory clause of `text`: up to `max_chars` ending at the first
+    BEGINNING/COMMENCING head, "" when what precedes the head is too short
+    to be one, or None when `text` has no head.
+    """
+    m = HEAD_RE.search(text)
+    if m is None:
+        return None
+    clause = text[:m.start()]
+    if len(clause) > max_chars:
+        clause = clause[-max_chars:]
+        clause = clause[clause.find(" ") + 1:]
+    clause = " ".join(clause.split())
+    return clause if len(clause) >= INVENTORY_MIN_CHARS else ""
+
+
+def _title(text):
+    return " ".join(word.capitalize() for word in text.split())
+
+
+def regex_inventory(clause):
+    """The inventory fields the regexes can read from `clause`; the rest are None."""
+    fields = dict.fromkeys(INVENTORY_FIELDS)
+    m = _VOLUME_PAGE_RE.search(clause)
+    if m:
+        fields["volume"], fields["page"] = int(m.group(1)), int(m.group(2))
+    for m in _COUNTY_RE.finditer(clause):
+        words = m.group(1).split()
+        # the name is what follows the last word that can't be part of it
+        for i in range(len(words) - 1, -1, -1):
+            if words[i].lower() in _NOT_COUNTY:
+                words = words[i + 1:]
+                break
+        if words:
+            fields["county"], fields["state"] = _title(" ".join(words)), _title(m.group(2))
+            break
+    m = _ACREAGE_RE.search(clause)
+    if m:
+        fields["acreage"], fields["acreageUnit"] = float(m.group(1).replace(",", "")), "acre"
+    m = _ABSTRACT_RE.search(clause)
+    if m:
+        fields["abstract"] = m.group(1).upper()
+    m = _RECORDS_RE.search(clause)
+    if m:
+        fields["sourceOfRecords"] = _title(" ".join(m.group(1).split())).replace(" Of ", " of ")
+    return fields
+
+
+def missing_fields(fields, wanted=INVENTORY_FIELDS):
+    """The fields of `wanted` that `fields` has no value for."""
+    return [name for name in wanted if fields.get(name) is None]
+
+
+def merge_inventory(found, llm=None):
+    """
+    One record of every schema field: the regex values in `found` where
+    there are any, otherwise the LLM's answer.
+    """
+    merged = dict.fromkeys(INVENTORY_FIELDS)
+    for name in INVENTORY_FIELDS:
+        if found.get(name) is not None:
+            merged[name] = found[name]
+        elif llm and llm.get(name) is not None:
+            merged[name] = llm[name]
+    return merged
@@ -0,0 +1,213 @@
+import hashlib
+import random
+import threading
+import time
+
+from concurrency import ordered_map
+
+# Synchronous DetectDocumentText quota for our account; requests beyond it
+# come back as ThrottlingException, so pace ourselves instead.
+TEXTRACT_TPS = 5.0
+TEXTRACT_MAX_IN_FLIGHT = 4
+# largest document the synchronous API accepts as raw bytes
+TEXTRACT_MAX_BYTES = 10 * 1024 * 1024
+
+# Asynchronous StartDocumentTextDetection: the document is uploaded to
+# this bucket, and the job polled from TEXTRACT_JOB_POLL seconds, backing
+# off to TEXTRACT_JOB_MAX_POLL, for at most TEXTRACT_JOB_TIMEOUT.
+TEXTRACT_JOB_BUCKET = "deed-reader-textract"
+TEXTRACT_JOB_PREFIX = "ocr-jobs/"
+TEXTRACT_JOB_POLL = 1.0
+TEXTRACT_JOB_MAX_POLL = 15.0
+TEXTRACT_JOB_TIMEOUT = 30 * 60
+# blocks per GetDocumentTextDetection page (the API maximum)
+TEXTRACT_JOB_MAX_RESULTS = 1000
+
+# error codes worth retrying with backoff rather than failing the page
+RETRYABLE_ERRORS = {
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+    "InternalServerError",
+}
+
+
+def error_code(exc):
+    # botocore ClientError carries the service error code in .response
+    return (getattr(exc, "response", None) or {}).get("Error", {}).get("Code")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing `rate` acquisitions per second with
+    bursts of up to `burst`.  `clock` and `sleep` are injectable so tests can
+    run against a fake clock.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        # when the bucket would next be full if nothing else were taken; a
+        # token is free once that is at most burst - 1 intervals away
+        self.full_at = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # each caller reserves the next free slot under the lock and sleeps
+        # once until it comes round, so waiters go in arrival order and no
+        # rounding in the refill can leave one spinning on a tiny deficit
+        with self.lock:
+            now = self.clock()
+            start = max(self.full_at, now)
+            wait = start - (self.burst - 1) / self.rate - now
+            self.full_at = start + 1 / self.rate
+        if wait > 0:
+            self.sleep(wait)
+
+
+class TextractOCR:
+    """
+    Textract detect_document_text with bounded concurrency, a token-bucket
+    rate limit and jittered exponential backoff on throttling.  `client` is
+    anything with a boto3-style detect_document_text method, so a local stub
+    can stand in for AWS.  Backends that share a quota share a `limiter`
+    (a TokenBucket), which then takes the place of one of their own at `tps`.
+    """
+
+    mode = "detect_document_text"
+
+    def __init__(self, client, max_in_flight=TEXTRACT_MAX_IN_FLIGHT, tps=TEXTRACT_TPS,
+                 max_attempts=6, base_delay=0.25, max_delay=20.0, limiter=None,
+                 clock=time.monotonic, sleep=time.sleep, rng=random.random):
+        self.client = client
+        self.max_in_flight = max_in_flight
+        if limiter is None and tps:
+            limiter = TokenBucket(tps, clock=clock, sleep=sleep)
+        self.bucket = limiter
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.rng = rng
+        self.calls = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    # whether OCR takes a whole document (detect_document) rather than page images
+    multi_page = False
+
+    def _call(self, method, **kwargs):
+        # one rate-limited API call, retried with backoff while it's throttled
+        for attempt in range(self.max_attempts):
+            if self.bucket:
+                self.bucket.acquire()
+            with self._lock:
+                self.calls += 1
+            try:
+                return method(**kwargs)
+            except Exception as exc:
+                if error_code(exc) not in RETRYABLE_ERRORS or attempt + 1 == self.max_attempts:
+                    raise
+            with self._lock:
+                self.retries += 1
+            # "full jitter": sleep a random fraction of the capped exponential step
+            self.sleep(self.rng() * min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def detect(self, image):
+        """OCR one page image and return its Textract Blocks."""
+        return self._call(self.client.detect_document_text, Document={"Bytes": image})["Blocks"]
+
+    def map(self, images):
+        """OCR many page images concurrently, yielding Blocks in input order."""
+        return ordered_map(self.detect, images, self.max_in_flight)
+
+
+class TextractJobError(RuntimeError):
+    """An asynchronous text-detection job that failed or never finished."""
+
+
+class TextractJobOCR(TextractOCR):
+    """
+    Textract StartDocumentTextDetection for multi-page documents: the PDF
+    is put in S3, one job OCRs every page, and the results are paged
+    through with GetDocumentTextDetection.  Same rate limit and backoff as
+    TextractOCR, applied to each Textract call; the S3 upload and delete
+    aren't Textract transactions, so they go straight to `s3` (anything
+    with boto3-style put_object/delete_object, so a local fake can stand
+    in) and are left to its own retries.
+    """
+
+    mode = "start_document_text_detection"
+    multi_page = True
+
+    def __init__(self, client, s3, bucket=TEXTRACT_JOB_BUCKET, prefix=TEXTRACT_JOB_PREFIX,
+                 poll=TEXTRACT_JOB_POLL, max_poll=TEXTRACT_JOB_MAX_POLL,
+                 timeout=TEXTRACT_JOB_TIMEOUT, max_results=TEXTRACT_JOB_MAX_RESULTS, **kwargs):
+        super().__init__(client, **kwargs)
+        self.s3 = s3
+        self.s3_bucket = bucket
+        self.prefix = prefix
+        self.poll = poll
+        self.max_poll = max_poll
+        self.timeout = timeout
+        self.max_results = max_results
+        self.clock = kwargs.get("clock", time.monotonic)
+        self.polls = 0
+
+    def detect(self, image):
+        """OCR one page image (as a one-page job) and return its Textract Blocks."""
+        pages = self.detect_document(image)
+        return pages[0] if pages else []
+
+    def detect_document(self, document):
+        """
+        OCR every page of `document` (PDF, TIFF, PNG or JPEG bytes) in one
+        job and return a list of Blocks per page, in page order.
+        """
+        token = hashlib.sha256(document).hexdigest()
+        key = f"{self.prefix}{token}"
+        self.s3.put_object(Bucket=self.s3_bucket, Key=key, Body=document)
+        try:
+            # the request token makes a retried start return the same job
+            job = self._call(self.client.start_document_text_detection,
+                             DocumentLocation={"S3Object": {"Bucket": self.s3_bucket, "Name": key}},
+                             ClientRequestToken=token)
+            pages, blocks = self._results(job["JobId"])
+        finally:
+            self.s3.delete_object(Bucket=self.s3_bucket, Key=key)
+        by_page = [[] for _ in range(pages)]
+        for block in blocks:
+            page = block.get("Page", 1)
+            if page > len(by_page):
+                by_page.extend([] for _ in range(page - len(by_page)))
+            by_page[page - 1].append(block)
+        return by_page
+
+    def _results(self, job_id):
+        # poll until the job leaves IN_PROGRESS, then page through every block
+        deadline = self.clock() + self.timeout
+        delay = self.poll
+        while True:
+            resp = self._call(self.client.get_document_text_detection, JobId=job_id,
+                              MaxResults=self.max_results)
+            with self._lock:
+                self.polls += 1
+            status = resp["JobStatus"]
+            if status != "IN_PROGRESS":
+                break
+            if self.clock() + delay > deadline:
+                raise TextractJobError(f"job {job_id} still running after {self.timeout}s")
+            self.sleep(delay)
+            delay = min(self.max_poll, delay * 2)
+        if status not in ("SUCCEEDED", "PARTIAL_SUCCESS"):
+            raise TextractJobError(f"job {job_id} {status}: {resp.get('StatusMessage', '')}")
+
+        pages = resp.get("DocumentMetadata", {}).get("Pages", 0)
+        blocks = list(resp.get("Blocks", ()))
+        while resp.get("NextToken"):
+            resp = self._call(self.client.get_document_text_detection, JobId=job_id,
+                              MaxResults=self.max_results, NextToken=resp["NextToken"])
+            blocks.extend(resp.get("Blocks", ()))
+        return pages, blocks
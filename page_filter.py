@@ -0,0 +1,80 @@
+import re
+from collections import namedtuple
+
+from call_parser import BEARING_RE, CALL_START_RE, HEAD_RE
+
+# Cheap local pre-filter: score each cleaned page for metes-and-bounds
+# content and keep only the pages worth an LLM call.  Plats, signature
+# blocks, notary pages and exhibits score near zero because the score is
+# driven by call narrative (THENCE, BEGINNING at, "a distance of"), not by
+# bare bearings; a plat full of bearing labels alone never passes.
+
+_PHRASE_RE = re.compile(
+    r"\b(?:(?:point|place)\s+of\s+(?:beginning|commencement|termination)"
+    r"|a\s+distance\s+of|(?:feet|chains|varas)\s+to\b|described\s+as\s+follows"
+    r"|metes\s+and\s+bounds|courses\s+and\s+distances)\b",
+    re.IGNORECASE,
+)
+_DISTANCE_RE = re.compile(r"\d(?:[\d,]*\d)?(?:\.\d+)?\s*(?:feet|foot|ft|chains?|varas?|rods?)\b",
+                          re.IGNORECASE)
+
+# pages scoring below this (weighted hits per 100 words) skip the LLM
+MIN_PAGE_SCORE = 3.0
+# short pages are scored as if they had this many words, so a stray
+# keyword on an otherwise blank page doesn't look dense
+MIN_SCORED_WORDS = 100
+
+PageDecision = namedtuple("PageDecision", "index score keep reason")
+
+
+def score_page(text):
+    """
+    Weighted metes-and-bounds hits per 100 words.  Call keywords and stock
+    phrases count double; bearings and distances count once, but no more
+    than twice the keyword hits, so measurements only add weight to pages
+    that also read like a description.
+    """
+    keywords = len(CALL_START_RE.findall(text)) + len(_PHRASE_RE.findall(text))
+    if not keywords:
+        return 0.0
+    measures = len(BEARING_RE.findall(text)) + len(_DISTANCE_RE.findall(text))
+    hits = 2 * keywords + min(measures, 2 * keywords)
+    return 100.0 * hits / max(len(text.split()), MIN_SCORED_WORDS)
+
+
+def classify_page(index, text, previous_kept=False, min_score=MIN_PAGE_SCORE):
+    """
+    Decide whether page `index` goes to the LLM.  A page is kept when it
+    scores at least `min_score`, when it opens a description (BEGINNING or
+    COMMENCING at ...), or when it follows a kept page and still holds a
+    call, so a description that runs onto a sparse page isn't cut short.
+    """
+    score = score_page(text)
+    if score >= min_score:
+        return PageDecision(index, score, True, "score")
+    if HEAD_RE.search(text):
+        return PageDecision(index, score, True, "opens a description")
+    if previous_kept and CALL_START_RE.search(text):
+        return PageDecision(index, score, True, "continues the previous page")
+    return PageDecision(index, score, False, f"score {score:.1f} < {min_score}")
+
+
+def filter_pages(pages, min_score=MIN_PAGE_SCORE, decisions=None, log=print):
+    """
+    Yield only the cleaned pages worth extracting from.  Every decision is
+    appended to `decisions` when given, and skipped pages are reported
+    through `log`.  min_score <= 0 keeps every page.
+    """
+    previous_kept = False
+    for index, text in enumerate(pages):
+        if min_score <= 0:
+            decision = PageDecision(index, score_page(text), True, "filter off")
+        else:
+            decision = classify_page(index, text, previous_kept, min_score)
+        if decisions is not None:
+            decisions.append(decision)
+        previous_kept = decision.keep
+        if decision.keep:
+            yield text
+        elif log is not None:
+            log(f"Skipping page {index + 1}: {decision.reason} ({len(text.split())} words)")
@@ -0,0 +1,474 @@
+import argparse
+import glob
+import json
+import math
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+from traverse import iter_documents, parse_parcel, solve_parcels, split_parcels
+
+# Cross-document index over extracted segments, in one SQLite file:
+#
+#   documents / parcels / segments / corners   plain tables
+#   segment_text    FTS5 over each segment's monument, description and
+#                   reference monuments (porter stemming, so "rods" finds
+#                   "rod")
+#   parcel_boxes    R-tree over each parcel's traverse bounding box
+#   corner_points   R-tree over every boundary corner
+#
+# Coordinates come from traverse.solve_parcels, so only parcels with grid
+# coordinates (a baseNorth/baseEast somewhere in their segments) go into
+# the R-trees; parcels in a local frame can't share corners with anything.
+# SQLite R-trees store 32-bit floats, rounded outwards, which at state
+# plane magnitudes is about a foot: the trees find candidates and the
+# exact distance is checked against the double-precision corners table.
+#
+# Output files are indexed incrementally: a file whose size and mtime are
+# unchanged is skipped, and a changed file replaces all of its documents.
+# A document is identified by the file it was read from (`source`) and its
+# name there, so two PDFs that share a basename stay separate.
+
+# bumped whenever the tables change; the index is rebuilt from the output
+# files anyway, so an index of another version is dropped, not migrated
+_SCHEMA_VERSION = 2
+_TABLES = ("files", "documents", "parcels", "segments", "corners", "segment_text",
+           "parcel_boxes", "corner_points")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,
+    indexed REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY, source TEXT NOT NULL, name TEXT NOT NULL, inventory TEXT,
+    UNIQUE (source, name));
+CREATE INDEX IF NOT EXISTS documents_name ON documents(name);
+CREATE TABLE IF NOT EXISTS parcels (
+    id INTEGER PRIMARY KEY, document_id INTEGER NOT NULL, number INTEGER NOT NULL,
+    kind TEXT, closed INTEGER, courses INTEGER, perimeter REAL, misclosure REAL,
+    precision REAL, acres REAL, flags TEXT,
+    min_north REAL, max_north REAL, min_east REAL, max_east REAL);
+CREATE INDEX IF NOT EXISTS parcels_document ON parcels(document_id);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY, document_id INTEGER NOT NULL, parcel_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL, call_type TEXT, location TEXT, bearing TEXT, distance REAL,
+    unit TEXT, monument TEXT, description TEXT, north REAL, east REAL, data TEXT);
+CREATE INDEX IF NOT EXISTS segments_document ON segments(document_id);
+CREATE TABLE IF NOT EXISTS corners (
+    id INTEGER PRIMARY KEY, document_id INTEGER NOT NULL, parcel_id INTEGER NOT NULL,
+    seq INTEGER, north REAL NOT NULL, east REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS corners_parcel ON corners(parcel_id);
+CREATE INDEX IF NOT EXISTS corners_document ON corners(document_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS segment_text USING fts5(
+    monument, description, refs, tokenize = 'porter unicode61');
+CREATE VIRTUAL TABLE IF NOT EXISTS parcel_boxes USING rtree(
+    id, min_east, max_east, min_north, max_north);
+CREATE VIRTUAL TABLE IF NOT EXISTS corner_points USING rtree(
+    id, min_east, max_east, min_north, max_north);
+"""
+
+# feet; a closing course ending this near the point of beginning is on it
+# (the rest is misclosure, which closure QA reports separately)
+_SAME_CORNER = 0.5
+
+# query results; `document` is the document's name and `source` the file it
+# was indexed from, `segment` is the segment's position in its document
+Corner = namedtuple("Corner", "document source parcel segment north east distance")
+TextHit = namedtuple("TextHit", "document source parcel segment monument description rank")
+ParcelHit = namedtuple("ParcelHit",
+                       "document source parcel kind acres min_north max_north min_east max_east")
+Adjoiner = namedtuple("Adjoiner", "document source parcel shared")
+
+
+def _text(value):
+    return value if isinstance(value, str) else None
+
+
+def _refs(segment):
+    # monuments of the "from which" reference, the points passed on line and
+    # their own references
+    parts = []
+    ref = segment.get("pointOfReference")
+    if isinstance(ref, dict):
+        parts.append(_text(ref.get("monument")))
+    for point in segment.get("pointsOnLine") or ():
+        if isinstance(point, dict):
+            parts.append(_text(point.get("monument")))
+            ref = point.get("pointOfReference")
+            if isinstance(ref, dict):
+                parts.append(_text(ref.get("monument")))
+    return " ".join(p for p in parts if p) or None
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def phrase(text):
+    """`text` as one FTS5 phrase, e.g. phrase('1/2" iron rod') for search()."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+class ParcelIndex:
+    """
+    The index file at `path`.  Only one process should write to it at a
+    time (batch feeds it from the parent process); readers can share it.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+            for table in _TABLES:
+                self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        self._conn.executescript(_SCHEMA)
+
+    # -- feeding ------------------------------------------------------------
+
+    def add_file(self, path, force=False):
+        """
+        Index every document in a pipeline output file (batch JSONL or
+        output.json) unless the file is unchanged since it was last
+        indexed.  The file's documents from an earlier add are replaced,
+        including any it no longer has.  Returns the number of documents
+        indexed.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        row = self._conn.execute("SELECT size, mtime_ns FROM files WHERE path = ?",
+                                 (path,)).fetchone()
+        if not force and row == (st.st_size, st.st_mtime_ns):
+            return 0
+        inventories = _inventories(path)
+        documents = list(iter_documents([path]))
+        self._conn.execute("BEGIN")
+        try:
+            for (document_id,) in self._conn.execute("SELECT id FROM documents WHERE source = ?",
+                                                     (path,)).fetchall():
+                self._remove(document_id)
+                self._conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+            for name, segments in documents:
+                self._add(name, segments, path, inventories.get(name))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, indexed) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, time.time()))
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return len(documents)
+
+    def add_document(self, name, segments, source=None, inventory=None):
+        """Index (or re-index) the segments of document `name` from file `source`."""
+        self._conn.execute("BEGIN")
+        try:
+            self._add(name, segments, source and os.path.abspath(source), inventory)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _remove(self, document_id):
+        c = self._conn
+        c.execute("DELETE FROM segment_text WHERE rowid IN"
+                  " (SELECT id FROM segments WHERE document_id = ?)", (document_id,))
+        c.execute("DELETE FROM corner_points WHERE id IN"
+                  " (SELECT id FROM corners WHERE document_id = ?)", (document_id,))
+        c.execute("DELETE FROM parcel_boxes WHERE id IN"
+                  " (SELECT id FROM parcels WHERE document_id = ?)", (document_id,))
+        for table in ("corners", "segments", "parcels"):
+            c.execute(f"DELETE FROM {table} WHERE document_id = ?", (document_id,))
+
+    def _add(self, name, segments, source, inventory):
+        c = self._conn
+        source = source or ""
+        inventory = inventory and json.dumps(inventory, ensure_ascii=False)
+        row = c.execute("SELECT id FROM documents WHERE source = ? AND name = ?",
+                        (source, name)).fetchone()
+        if row is not None:
+            document_id = row[0]
+            self._remove(document_id)
+            c.execute("UPDATE documents SET inventory = ? WHERE id = ?", (inventory, document_id))
+        else:
+            document_id = c.execute(
+                "INSERT INTO documents (source, name, inventory) VALUES (?, ?, ?)",
+                (source, name, inventory),
+            ).lastrowid
+
+        groups = split_parcels(segments)
+        parcels = [parse_parcel(group) for group in groups]
+        result = solve_parcels(parcels)
+        # where each parcel's courses start in the flattened result
+        starts = [0]
+        for p in parcels:
+            starts.append(starts[-1] + len(p.courses))
+
+        seq = 0
+        for n, (group, p) in enumerate(zip(groups, parcels)):
+            georeferenced = any(s.get("baseNorth") is not None for s in group)
+            ends = {}
+            corners = []
+            if georeferenced:
+                first = True
+                for k in range(starts[n], starts[n + 1]):
+                    course = p.courses[k - starts[n]]
+                    north, east = float(result.north[k]), float(result.east[k])
+                    ends[course.segment] = (north, east)
+                    if course.tie:
+                        continue
+                    if first:
+                        # the point of beginning, where the first boundary course starts
+                        length = course.length
+                        corners.append((None, north - course.cos_n * length,
+                                        east - course.sin_e * length))
+                        first = False
+                    corners.append((seq + course.segment, north, east))
+                # a closed traverse ends back on its point of beginning
+                if len(corners) > 2 and math.hypot(corners[0][1] - corners[-1][1],
+                                                   corners[0][2] - corners[-1][2]) < _SAME_CORNER:
+                    corners.pop(0)
+            box = (min(n_ for _, n_, _ in corners), max(n_ for _, n_, _ in corners),
+                   min(e for _, _, e in corners), max(e for _, _, e in corners)) \
+                if corners else (None, None, None, None)
+            precision = float(result.precision[n])
+            parcel_id = c.execute(
+                "INSERT INTO parcels (document_id, number, kind, closed, courses, perimeter,"
+                " misclosure, precision, acres, flags, min_north, max_north, min_east, max_east)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (document_id, n, p.kind, int(result.closed[n]), len(p.courses),
+                 float(result.perimeter[n]), float(result.misclosure[n]),
+                 None if math.isinf(precision) else precision, float(result.acres[n]),
+                 json.dumps(result.flags[n]), *box),
+            ).lastrowid
+            if corners:
+                c.execute("INSERT INTO parcel_boxes VALUES (?, ?, ?, ?, ?)",
+                          (parcel_id, box[2], box[3], box[0], box[1]))
+
+            rows = []
+            text_rows = []
+            for i, segment in enumerate(group):
+                north, east = ends.get(i, (None, None))
+                rows.append((document_id, parcel_id, seq + i, _text(segment.get("callType")),
+                             _text(segment.get("locationDescription")),
+                             _text(segment.get("bearing")), _float(segment.get("distance")),
+                             _text(segment.get("unit")), _text(segment.get("monument")),
+                             _text(segment.get("description")), north, east,
+                             json.dumps(segment, ensure_ascii=False)))
+            for i, row in enumerate(rows):
+                segment_id = c.execute(
+                    "INSERT INTO segments (document_id, parcel_id, seq, call_type, location,"
+                    " bearing, distance, unit, monument, description, north, east, data)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row).lastrowid
+                refs = _refs(group[i])
+                if row[8] or row[9] or refs:
+                    text_rows.append((segment_id, row[8], row[9], refs))
+            c.executemany("INSERT INTO segment_text (rowid, monument, description, refs)"
+                          " VALUES (?, ?, ?, ?)", text_rows)
+
+            for corner_seq, north, east in corners:
+                corner_id = c.execute(
+                    "INSERT INTO corners (document_id, parcel_id, seq, north, east)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (document_id, parcel_id, corner_seq, north, east)).lastrowid
+                c.execute("INSERT INTO corner_points VALUES (?, ?, ?, ?, ?)",
+                          (corner_id, east, east, north, north))
+            seq += len(group)
+
+    # -- queries ------------------------------------------------------------
+
+    def corners_near(self, north, east, tolerance=1.0, limit=1000):
+        """Boundary corners within `tolerance` feet of (north, east), nearest first."""
+        rows = self._conn.execute(
+            "SELECT d.name, NULLIF(d.source, ''), p.number, c.seq, c.north, c.east,"
+            "       (c.north - ?1) * (c.north - ?1) + (c.east - ?2) * (c.east - ?2) AS d2"
+            " FROM corner_points t"
+            " JOIN corners c ON c.id = t.id"
+            " JOIN parcels p ON p.id = c.parcel_id"
+            " JOIN documents d ON d.id = c.document_id"
+            " WHERE t.min_east <= ?2 + ?3 AND t.max_east >= ?2 - ?3"
+            "   AND t.min_north <= ?1 + ?3 AND t.max_north >= ?1 - ?3"
+            "   AND d2 <= ?3 * ?3"
+            " ORDER BY d2 LIMIT ?4",
+            (north, east, tolerance, limit),
+        ).fetchall()
+        return [Corner(*row[:6], math.sqrt(row[6])) for row in rows]
+
+    def parcels_near(self, north, east, margin=0.0, limit=1000):
+        """Parcels whose bounding box comes within `margin` feet of (north, east)."""
+        return self.parcels_in(north - margin, north + margin, east - margin, east + margin, limit)
+
+    def parcels_in(self, min_north, max_north, min_east, max_east, limit=1000):
+        """Parcels whose bounding box intersects the given box."""
+        rows = self._conn.execute(
+            "SELECT d.name, NULLIF(d.source, ''), p.number, p.kind, p.acres,"
+            "       p.min_north, p.max_north, p.min_east, p.max_east"
+            " FROM parcel_boxes b"
+            " JOIN parcels p ON p.id = b.id"
+            " JOIN documents d ON d.id = p.document_id"
+            " WHERE b.min_east <= ? AND b.max_east >= ? AND b.min_north <= ? AND b.max_north >= ?"
+            "   AND p.min_east <= ? AND p.max_east >= ? AND p.min_north <= ? AND p.max_north >= ?"
+            " LIMIT ?",
+            (max_east, min_east, max_north, min_north,
+             max_east, min_east, max_north, min_north, limit),
+        ).fetchall()
+        return [ParcelHit(*row) for row in rows]
+
+    def search(self, query, limit=100, ranked=False):
+        """
+        Segments whose monument, description or reference monuments match
+        the FTS5 `query` (see phrase()), in index order, or best match first
+        when `ranked` (which has to score every match before the first
+        result, so it slows down on common phrases).
+        """
+        rows = self._conn.execute(
+            "SELECT d.name, NULLIF(d.source, ''), p.number, s.seq, s.monument, s.description,"
+            "       bm25(segment_text)"
+            " FROM segment_text"
+            " JOIN segments s ON s.id = segment_text.rowid"
+            " JOIN parcels p ON p.id = s.parcel_id"
+            " JOIN documents d ON d.id = s.document_id"
+            " WHERE segment_text MATCH ?"
+            f" ORDER BY {'bm25(segment_text)' if ranked else 'segment_text.rowid'} LIMIT ?",
+            (query, limit),
+        ).fetchall()
+        return [TextHit(*row) for row in rows]
+
+    def document_id(self, document, source=None):
+        """
+        The id of document `document` from file `source`, or None if it
+        isn't indexed.  Without `source` the name has to be unique in the
+        index; a name indexed from several files raises ValueError.
+        """
+        if source is not None:
+            row = self._conn.execute("SELECT id FROM documents WHERE source = ? AND name = ?",
+                                     (os.path.abspath(source), document)).fetchone()
+            return row and row[0]
+        rows = self._conn.execute("SELECT id, source FROM documents WHERE name = ?",
+                                  (document,)).fetchall()
+        if len(rows) > 1:
+            raise ValueError(f"{document} is indexed from {len(rows)} files; give its source: "
+                             + ", ".join(sorted(path for _, path in rows)))
+        return rows[0][0] if rows else None
+
+    def adjoining(self, document, parcel=0, tolerance=1.0, source=None):
+        """
+        Other parcels sharing at least one corner (within `tolerance` feet)
+        with parcel number `parcel` of `document` (from file `source`, see
+        document_id), most shared corners first.
+        """
+        document_id = self.document_id(document, source)
+        if document_id is None:
+            return []
+        rows = self._conn.execute(
+            "SELECT d.name, NULLIF(d.source, ''), p.number, COUNT(DISTINCT a.id)"
+            # CROSS JOIN keeps this parcel's corners as the outer loop, so
+            # the R-tree is probed once per corner instead of scanned
+            " FROM parcels ap"
+            " CROSS JOIN corners a ON a.parcel_id = ap.id"
+            " CROSS JOIN corner_points t"
+            "   ON t.min_east <= a.east + ?3 AND t.max_east >= a.east - ?3"
+            "  AND t.min_north <= a.north + ?3 AND t.max_north >= a.north - ?3"
+            " JOIN corners b ON b.id = t.id AND b.parcel_id != ap.id"
+            " JOIN parcels p ON p.id = b.parcel_id"
+            " JOIN documents d ON d.id = p.document_id"
+            " WHERE ap.document_id = ?1 AND ap.number = ?2"
+            "   AND (b.north - a.north) * (b.north - a.north)"
+            "     + (b.east - a.east) * (b.east - a.east) <= ?3 * ?3"
+            " GROUP BY b.parcel_id ORDER BY 4 DESC",
+            (document_id, parcel, tolerance),
+        ).fetchall()
+        return [Adjoiner(*row) for row in rows]
+
+    def stats(self):
+        counts = {}
+        for table in ("files", "documents", "parcels", "segments", "corners"):
+            counts[table] = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        counts["georeferenced_parcels"] = self._conn.execute(
+            "SELECT COUNT(*) FROM parcel_boxes").fetchone()[0]
+        return counts
+
+    def close(self):
+        self._conn.close()
+
+
+def _inventories(path):
+    # document -> inventory fields, for output that carries them (batch
+    # JSONL has them on a document's first record)
+    inventories = {}
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            record = json.load(f)
+            if record.get("inventory"):
+                inventories[path] = record["inventory"]
+            return inventories
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("inventory"):
+                    inventories.setdefault(record.get("document", path), record["inventory"])
+    return inventories
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index extracted parcels and query them.")
+    parser.add_argument("--index", default="parcels.sqlite", help="index file (default parcels.sqlite)")
+    parser.add_argument("--add", nargs="+", metavar="PATH", default=[],
+                        help="batch output directories, JSONL or output.json files to index")
+    parser.add_argument("--force", action="store_true", help="re-index files even if unchanged")
+    parser.add_argument("--near", nargs=2, type=float, metavar=("NORTH", "EAST"),
+                        help="corners near this grid point")
+    parser.add_argument("--tolerance", type=float, default=1.0,
+                        help="feet, for --near and --adjoining (default 1.0)")
+    parser.add_argument("--text", help="calls whose monument or description mention this phrase")
+    parser.add_argument("--adjoining", metavar="DOCUMENT", help="parcels sharing corners with "
+                                                                "this document's first parcel")
+    parser.add_argument("--source", metavar="PATH",
+                        help="output file the --adjoining document was indexed from, when "
+                             "documents from several files share its name")
+    parser.add_argument("--ranked", action="store_true", help="order --text matches by relevance")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    index = ParcelIndex(args.index)
+    try:
+        for item in args.add:
+            paths = (sorted(glob.glob(os.path.join(glob.escape(item), "*.jsonl")))
+                     if os.path.isdir(item) else [item])
+            for path in paths:
+                start = time.perf_counter()
+                n = index.add_file(path, args.force)
+                if n:
+                    print(f"indexed {n} documents from {path} in {time.perf_counter() - start:.2f}s")
+        if args.near:
+            start = time.perf_counter()
+            hits = index.corners_near(*args.near, args.tolerance, args.limit)
+            print(f"{len(hits)} corners within {args.tolerance} ft "
+                  f"({1000 * (time.perf_counter() - start):.1f} ms)")
+            for hit in hits:
+                print(f"  {hit.document} #{hit.parcel} segment {hit.segment}: "
+                      f"N {hit.north:.3f} E {hit.east:.3f} ({hit.distance:.3f} ft)")
+        if args.text:
+            start = time.perf_counter()
+            hits = index.search(phrase(args.text), args.limit, args.ranked)
+            print(f"{len(hits)} calls mentioning {args.text!r} "
+                  f"({1000 * (time.perf_counter() - start):.1f} ms)")
+            for hit in hits:
+                print(f"  {hit.document} #{hit.parcel} segment {hit.segment}: "
+                      f"{hit.monument or ''} {hit.description or ''}".rstrip())
+        if args.adjoining:
+            for hit in index.adjoining(args.adjoining, 0, args.tolerance, args.source):
+                print(f"  {hit.document} #{hit.parcel} ({hit.source}): {hit.shared} shared corners")
+        print(f"Index: {index.stats()}")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+import argparse
+import base64
+import inspect
+import json
+import os
+import re
+import sys
+import threading
+import time
+import types
+from collections import namedtuple
+
+import fitz
+
+from cache import LlmCache, OcrCache, StageStore, file_digest
+from chunk_packer import CHUNK_TOKEN_BUDGET, Chunk, iter_chunks
+from chunk_pdf import (DEFAULT_RENDER, LLM_MAX_IN_FLIGHT, RenderedPage, add_render_args,
+                       clean_deed_text, iter_raw_extractions, iter_rendered_pages,
+                       join_cut_calls, normalize_segments, page_blocks, prepare_page,
+                       render_policy, textract_client, words_to_lines)
+from concurrency import fitz_lock, ordered_map
+from ocr import TEXTRACT_MAX_IN_FLIGHT, TextractOCR
+from page_filter import MIN_PAGE_SCORE, PageDecision, filter_pages
+
+# The pipeline as a DAG of persisted stages:
+#
+#     render -> ocr -> lines -> clean -> plan -> extract -> normalize
+#      (page)   (page) (page)   (page)   (doc)   (chunk)     (chunk)
+#
+# Every output is stored in a StageStore under a key made of the stage name,
+# the stage's fingerprint and its inputs.  A fingerprint hashes the source
+# of the stage's entry function and, transitively, of every function,
+# class and CONSTANT_CASE value of this repo that it refers to by global
+# name, so editing format_bearing changes only the normalize fingerprint,
+# editing SYSTEM_PROMPT_LINES only extract's, and so on.  Plumbing modules
+# that can't change a result (caching, thread pools, instrumentation) are
+# left out.
+#
+# render, ocr and lines are keyed by their upstream key, so a document whose
+# lines are stored is neither rendered nor OCR'd.  From clean on, keys hash
+# the input text itself, so a change upstream that leaves the text as it
+# was stops there instead of reaching the LLM.
+#
+# This is a separate tool for iterating on the pipeline's code against a
+# fixed set of documents, not the production path: pages are OCR'd one by
+# one with synchronous Textract (no asynchronous job backend) and the
+# inventory clause isn't extracted.  chunk_pdf and batch run the full
+# pipeline.
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+_UNTRACKED_MODULES = {"cache", "concurrency", "instrument"}
+_CONSTANT_RE = re.compile(r"_?[A-Z][A-Z0-9_]*")
+
+
+def plan_pages(pages, min_score=MIN_PAGE_SCORE, budget=CHUNK_TOKEN_BUDGET):
+    """Page-filter decisions and packed chunks for a document's cleaned pages."""
+    decisions = []
+    chunks = list(iter_chunks(filter_pages(pages, min_score, decisions, log=None), budget))
+    return decisions, chunks
+
+
+# stage name -> the function whose code (with everything it calls) is the stage
+STAGES = {
+    "render":    prepare_page,
+    "ocr":       page_blocks,
+    "lines":     words_to_lines,
+    "clean":     clean_deed_text,
+    "plan":      plan_pages,
+    "extract":   iter_raw_extractions,
+    "normalize": normalize_segments,
+}
+
+
+def _tracked(obj):
+    module = sys.modules.get(getattr(obj, "__module__", None))
+    path = getattr(module, "__file__", None)
+    return (path is not None and os.path.abspath(path).startswith(_ROOT + os.sep)
+            and module.__name__ not in _UNTRACKED_MODULES)
+
+
+def _names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _names(const)
+    return names
+
+
+def _source(obj):
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        code = getattr(obj, "__code__", None)
+        return code.co_code.hex() if code else repr(obj)
+
+
+def _describe(name, obj, parts, seen):
+    if isinstance(obj, (types.FunctionType, type)):
+        if id(obj) in seen or not _tracked(obj):
+            return
+        seen.add(id(obj))
+        parts.append(f"{obj.__qualname__}\n{_source(obj)}")
+        functions = [obj] if isinstance(obj, types.FunctionType) else [
+            f for f in vars(obj).values() if isinstance(f, types.FunctionType)]
+        for f in functions:
+            for ref in sorted(_names(f.__code__)):
+                if ref in f.__globals__:
+                    _describe(ref, f.__globals__[ref], parts, seen)
+    elif isinstance(obj, re.Pattern):
+        parts.append(f"{name} = re({obj.pattern!r}, {obj.flags})")
+    elif _CONSTANT_RE.fullmatch(name) and not isinstance(obj, types.ModuleType):
+        # module-level constants only; lower-case globals are runtime state
+        try:
+            parts.append(f"{name} = {json.dumps(obj, sort_keys=True, default=_stable)}")
+        except (TypeError, ValueError):
+            parts.append(f"{name} = {obj!r}")
+
+
+def _stable(obj):
+    # sets iterate in hash order, which changes from one process to the next
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=repr)
+    return repr(obj)
+
+
+def fingerprint(function):
+    """Hash of `function`'s source and of the repo code and constants it depends on."""
+    parts = []
+    _describe(function.__name__, function, parts, set())
+    return StageStore.key("fingerprint", *parts)
+
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def fingerprints():
+    """{stage: fingerprint} for the code as loaded, computed once per process."""
+    with _fingerprints_lock:
+        if not _fingerprints:
+            _fingerprints.update((name, fingerprint(f)) for name, f in STAGES.items())
+        return dict(_fingerprints)
+
+
+class StageCounts:
+    """Per-stage tally of outputs computed versus reused from the store."""
+
+    def __init__(self):
+        self.counts = {name: {"computed": 0, "reused": 0} for name in STAGES}
+        self._lock = threading.Lock()
+
+    def add(self, stage, reused, n=1):
+        with self._lock:
+            self.counts[stage]["reused" if reused else "computed"] += n
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(c) for name, c in self.counts.items()}
+
+
+PageKeys = namedtuple("PageKeys", "render ocr lines")
+
+
+def _dump_rendered(page):
+    return {"index": page.index, "dpi": page.dpi, "blocks": page.blocks,
+            "render_seconds": page.render_seconds,
+            "image": None if page.image is None else base64.b64encode(page.image).decode("ascii")}
+
+
+def _load_rendered(value):
+    image = value["image"]
+    return RenderedPage(value["index"], value["dpi"],
+                        None if image is None else base64.b64decode(image),
+                        value["blocks"], value["render_seconds"])
+
+
+def iter_staged_document(path, store, ocr=None, ocr_cache=None, llm_cache=None, policy=DEFAULT_RENDER,
+                         render_workers=2, text_layer=True, min_page_score=MIN_PAGE_SCORE,
+                         chunk_tokens=CHUNK_TOKEN_BUDGET, fast_path=True,
+                         max_in_flight=LLM_MAX_IN_FLIGHT, counts=None, decisions=None,
+                         log=print):
+    """
+    Stream (chunk, segments) for one PDF, reusing every stage output in
+    `store` whose fingerprint and inputs are unchanged and persisting the
+    rest.  Only pages with nothing stored are rendered; OCR, the LLM and
+    the Textract client are touched only on a miss.  `ocr` has to be a
+    per-page backend (TextractOCR), and no inventory is extracted.
+    Per-stage computed/reused tallies go to `counts` (StageCounts),
+    page-filter decisions to `decisions`.
+    """
+    if ocr is not None and ocr.multi_page:
+        raise ValueError("stages OCR pages one at a time; use chunk_pdf for Textract jobs")
+    fp = fingerprints()
+    counts = counts if counts is not None else StageCounts()
+    sha = file_digest(path)
+    with fitz_lock, fitz.open(path) as doc:
+        page_count = doc.page_count
+    mode = ocr.mode if ocr is not None else TextractOCR.mode
+
+    keys = []
+    for index in range(page_count):
+        render = store.key("render", fp["render"], sha, str(index), repr(tuple(policy)),
+                           str(text_layer))
+        ocr_key = store.key("ocr", fp["ocr"], render, mode)
+        keys.append(PageKeys(render, ocr_key, store.key("lines", fp["lines"], ocr_key)))
+    missing = [i for i, k in enumerate(keys)
+               if k.lines not in store and k.ocr not in store and k.render not in store]
+    ocr_lock = threading.Lock()
+
+    def get_ocr():
+        nonlocal ocr
+        with ocr_lock:
+            if ocr is None:
+                ocr = TextractOCR(textract_client())
+            return ocr
+
+    def rendered_pages():
+        fresh = iter_rendered_pages(path, policy, render_workers, text_layer=text_layer,
+                                    indices=missing)
+        wanted = set(missing)
+        for index, k in enumerate(keys):
+            page = None
+            if index in wanted:
+                page = next(fresh)
+                store.put(k.render, _dump_rendered(page))
+                counts.add("render", False)
+            yield index, k, page
+
+    def page_text(item):
+        index, k, page = item
+        lines = store.get(k.lines)
+        counts.add("lines", lines is not None)
+        if lines is None:
+            blocks = store.get(k.ocr)
+            counts.add("ocr", blocks is not None)
+            if blocks is None:
+                if page is None:
+                    stored = store.get(k.render)
+                    counts.add("render", stored is not None)
+                    if stored is not None:
+                        page = _load_rendered(stored)
+                    else:
+                        # evicted since the missing pages were listed
+                        with fitz_lock, fitz.open(path) as doc:
+                            page = prepare_page(doc[index], policy, text_layer)
+                        store.put(k.render, _dump_rendered(page))
+                blocks, _ = page_blocks(path, page, get_ocr(), policy, ocr_cache)
+                store.put(k.ocr, blocks)
+            lines = words_to_lines(blocks)
+            store.put(k.lines, lines)
+        raw = " ".join(lines)
+        key = store.key("clean", fp["clean"], raw)
+        text = store.get(key)
+        counts.add("clean", text is not None)
+        if text is None:
+            text = clean_deed_text(raw)
+            store.put(key, text)
+        return text
+
+    in_flight = ocr.max_in_flight if ocr is not None else TEXTRACT_MAX_IN_FLIGHT
+    pages = list(ordered_map(page_text, rendered_pages(), in_flight))
+
+    plan_key = store.key("plan", fp["plan"], str(min_page_score), str(chunk_tokens), *pages)
+    plan = store.get(plan_key)
+    counts.add("plan", plan is not None)
+    if plan is None:
+        page_decisions, chunks = plan_pages(pages, min_page_score, chunk_tokens)
+        store.put(plan_key, {"decisions": page_decisions, "chunks": chunks})
+    else:
+        page_decisions = [PageDecision(*d) for d in plan["decisions"]]
+        chunks = [Chunk(*c) for c in plan["chunks"]]
+    if decisions is not None:
+        decisions.extend(page_decisions)
+    if log is not None:
+        for d in page_decisions:
+            if not d.keep:
+                log(f"Skipping page {d.index + 1}: {d.reason} ({len(pages[d.index].split())} words)")
+
+    chunk_keys = []
+    for chunk in chunks:
+        extract = store.key("extract", fp["extract"], chunk.text, str(fast_path))
+        chunk_keys.append((extract, store.key("normalize", fp["normalize"], extract)))
+    todo = {i for i, (extract, normalize) in enumerate(chunk_keys)
+            if normalize not in store and extract not in store}
+    fresh = iter_raw_extractions([chunks[i] for i in sorted(todo)], llm_cache, max_in_flight,
+                                 fast_path)
+    # stored per chunk as extracted; calls cut across chunks are joined on the way out
+    yield from join_cut_calls(_stored_extractions(store, chunks, chunk_keys, todo, fresh, counts,
+                                                  llm_cache, fast_path))
+
+
+def _stored_extractions(store, chunks, chunk_keys, todo, fresh, counts, llm_cache, fast_path):
+    for i, (chunk, (extract, normalize)) in enumerate(zip(chunks, chunk_keys)):
+        segments = store.get(normalize) if i not in todo else None
+        if segments is not None:
+            counts.add("normalize", True)
+            yield chunk, segments
+            continue
+        raw = store.get(extract) if i not in todo else None
+        counts.add("extract", raw is not None)
+        if raw is None:
+            if i in todo:
+                _, raw = next(fresh)
+            else:
+                # evicted since the work was listed
+                _, raw = next(iter_raw_extractions([chunk], llm_cache, fast_path=fast_path))
+            store.put(extract, raw)
+        segments = normalize_segments(raw)
+        store.put(normalize, segments)
+        counts.add("normalize", False)
+        yield chunk, segments
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extract metes-and-bounds calls from PDFs, recomputing only the pipeline "
+                    "stages whose code or inputs changed since the last run.")
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--store", default=os.path.join(_ROOT, ".cache", "stages.sqlite"),
+                        help="stage output store (default .cache/stages.sqlite)")
+    parser.add_argument("--out", help="write one prompt/completion JSONL record per chunk here")
+    parser.add_argument("--no-fast-path", action="store_true",
+                        help="send every chunk to the LLM instead of parsing plain calls locally")
+    parser.add_argument("--min-page-score", type=float, default=MIN_PAGE_SCORE,
+                        help=f"pages scoring below this skip LLM extraction (default {MIN_PAGE_SCORE})")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKEN_BUDGET,
+                        help=f"deed-text tokens packed into one LLM request (default {CHUNK_TOKEN_BUDGET})")
+    parser.add_argument("--render-workers", type=int, default=2)
+    add_render_args(parser)
+    args = parser.parse_args(argv)
+
+    store = StageStore(args.store)
+    ocr_cache = OcrCache()
+    llm_cache = LlmCache()
+    out = open(args.out, "w", encoding="utf-8") if args.out else None
+    try:
+        for stage, fp in fingerprints().items():
+            print(f"{stage:<10} {fp[:12]}")
+        for path in args.pdfs:
+            document = os.path.basename(path)
+            counts = StageCounts()
+            start = time.perf_counter()
+            extractions = iter_staged_document(path, store, ocr_cache=ocr_cache,
+                                               llm_cache=llm_cache, policy=render_policy(args),
+                                               render_workers=args.render_workers,
+                                               min_page_score=args.min_page_score,
+                                               chunk_tokens=args.chunk_tokens,
+                                               fast_path=not args.no_fast_path, counts=counts,
+                                               log=lambda msg: print(f"{document}: {msg}"))
+            segments = 0
+            for i, (chunk, segs) in enumerate(extractions):
+                segments += len(segs)
+                if out is not None:
+                    out.write(json.dumps({
+                        "document":   document,
+                        "chunk":      i,
+                        "prompt":     chunk.text,
+                        "completion": json.dumps({"segments": segs}, ensure_ascii=False),
+                    }, ensure_ascii=False) + "\n")
+            print(f"{document}: {segments} segments in {time.perf_counter() - start:.2f}s")
+            for stage, c in counts.stats().items():
+                print(f"    {stage:<10} computed {c['computed']:>4}  reused {c['reused']:>4}")
+    finally:
+        if out is not None:
+            out.close()
+        store.close()
+        ocr_cache.close()
+        llm_cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+TextractJobOCR against FakeTextract and FakeS3: results paged with
+NextToken come back whole and split by page, a FAILED or timed-out job
+raises TextractJobError, and the uploaded document is deleted from S3
+however the job ends.  A job backend and a sync backend sharing a
+limiter stay within its rate together, and S3 calls don't count against it.
+"""
+import fitz
+import pytest
+
+from fakes import FakeClientError, FakeClock, FakeS3, FakeTextract
+from ocr import TextractJobError, TextractJobOCR, TextractOCR, TokenBucket
+
+
+def _pdf(pages):
+    with fitz.open() as doc:
+        for n in range(pages):
+            doc.new_page().insert_text((72, 72), f"page {n + 1}")
+        return doc.tobytes()
+
+
+def _job_ocr(fake, s3, clock, **kwargs):
+    return TextractJobOCR(fake, s3, bucket="jobs", poll=1.0, tps=None,
+                          clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def _fakes(**kwargs):
+    clock = FakeClock()
+    s3 = FakeS3()
+    return clock, s3, FakeTextract(s3=s3, clock=clock, **kwargs)
+
+
+def test_results_are_paged_through():
+    document = _pdf(3)
+    clock, s3, fake = _fakes(job_polls=2)
+    whole = _job_ocr(fake, s3, clock).detect_document(document)
+    clock, s3, fake = _fakes(job_polls=2)
+    pages = _job_ocr(fake, s3, clock, max_results=7).detect_document(document)
+
+    assert pages == whole
+    assert len(pages) == 3
+    assert all(pages) and all(b["Page"] == n for n, page in enumerate(pages, 1) for b in page)
+    # one start, the IN_PROGRESS polls, then one get per page of results
+    blocks = sum(len(page) for page in pages)
+    assert fake.calls == 1 + 2 + -(-blocks // 7)
+    assert not s3.objects
+
+
+def test_in_progress_polls_back_off():
+    clock, s3, fake = _fakes(job_polls=4)
+    _job_ocr(fake, s3, clock, max_poll=3.0).detect_document(_pdf(1))
+    assert clock.sleeps == [1.0, 2.0, 3.0, 3.0]
+
+
+def test_failed_job_raises_and_cleans_up():
+    clock, s3, fake = _fakes(job_status="FAILED")
+    with pytest.raises(TextractJobError, match="FAILED"):
+        _job_ocr(fake, s3, clock).detect_document(_pdf(2))
+    assert not s3.objects
+
+
+def test_job_that_never_finishes_times_out_and_cleans_up():
+    clock, s3, fake = _fakes(job_polls=1000)
+    with pytest.raises(TextractJobError, match="still running"):
+        _job_ocr(fake, s3, clock, timeout=30.0).detect_document(_pdf(1))
+    assert clock.now <= 30.0
+    assert not s3.objects
+
+
+def test_start_error_cleans_up():
+    clock, s3, fake = _fakes()
+
+    def reject(**kwargs):
+        raise FakeClientError("InvalidS3ObjectException")
+
+    fake.start_document_text_detection = reject
+    with pytest.raises(FakeClientError):
+        _job_ocr(fake, s3, clock).detect_document(_pdf(1))
+    assert not s3.objects
+
+
+def test_backends_share_one_limiter():
+    clock, s3, fake = _fakes(job_polls=0)
+    limiter = TokenBucket(2.0, clock=clock, sleep=clock.sleep)
+    sync = TextractOCR(fake, limiter=limiter, clock=clock, sleep=clock.sleep)
+    job = TextractJobOCR(fake, s3, bucket="jobs", limiter=limiter, clock=clock, sleep=clock.sleep)
+
+    sync.detect(b"page")
+    job.detect_document(_pdf(2))
+    sync.detect(b"page")
+    # every Textract call took the next slot at 2/s; the S3 put and delete took none
+    assert fake.calls == 4
+    assert fake.accepted == [0.0, 0.5, 1.0, 1.5]
@@ -0,0 +1,112 @@
+"""
+TextractOCR against a throttling FakeTextract: throttled calls are retried
+with capped backoff, retries stop at max_attempts, and pages come back in
+input order however they finish.  Everything but the ordering check runs
+on a FakeClock, so no test actually waits.
+"""
+import random
+
+import pytest
+
+from fakes import FakeClientError, FakeClock, FakeTextract
+from ocr import TextractOCR
+
+
+def _images(count):
+    return [f"page {n}".encode() for n in range(count)]
+
+
+def _words(blocks):
+    return [b["Text"] for b in blocks if b["BlockType"] == "WORD"]
+
+
+def _expected(fake, images):
+    return [fake._page_text(image).split() for image in images]
+
+
+def _fake_clock_ocr(fake, clock, **kwargs):
+    kwargs.setdefault("max_attempts", 20)
+    return TextractOCR(fake, max_in_flight=1, clock=clock, sleep=clock.sleep,
+                       rng=random.Random(0).random, **kwargs)
+
+
+def test_throttled_calls_are_retried():
+    clock = FakeClock()
+    fake = FakeTextract(throttle=0.3, seed=1, clock=clock)
+    ocr = _fake_clock_ocr(fake, clock, tps=None)
+    images = _images(60)
+
+    assert [_words(blocks) for blocks in ocr.map(images)] == _expected(fake, images)
+    assert fake.throttled > 0
+    assert ocr.retries == fake.throttled == len(clock.sleeps)
+    assert ocr.calls == fake.calls == len(images) + fake.throttled
+
+
+def test_pacing_at_the_quota_is_never_throttled():
+    clock = FakeClock()
+    fake = FakeTextract(max_tps=5, clock=clock)
+    ocr = _fake_clock_ocr(fake, clock, tps=5)
+
+    list(ocr.map(_images(40)))
+    assert fake.throttled == 0 and ocr.retries == 0
+
+
+def test_pacing_over_the_quota_recovers():
+    clock = FakeClock()
+    fake = FakeTextract(max_tps=5, clock=clock)
+    ocr = _fake_clock_ocr(fake, clock, tps=10)
+    images = _images(40)
+
+    assert [_words(blocks) for blocks in ocr.map(images)] == _expected(fake, images)
+    assert fake.throttled > 0 and ocr.retries == fake.throttled
+
+
+def test_backoff_is_capped():
+    clock = FakeClock()
+    fake = FakeTextract(throttle=1.0, clock=clock)
+    ocr = TextractOCR(fake, tps=None, max_attempts=8, base_delay=0.25, max_delay=4.0,
+                      clock=clock, sleep=clock.sleep, rng=lambda: 1.0)
+
+    with pytest.raises(FakeClientError):
+        ocr.detect(b"page")
+    assert clock.sleeps == [0.25, 0.5, 1.0, 2.0, 4.0, 4.0, 4.0]
+
+
+def test_retries_stop_at_max_attempts():
+    clock = FakeClock()
+    fake = FakeTextract(throttle=1.0, clock=clock)
+    ocr = _fake_clock_ocr(fake, clock, tps=None, max_attempts=4)
+
+    with pytest.raises(FakeClientError) as raised:
+        ocr.detect(b"page")
+    assert raised.value.response["Error"]["Code"] == "ThrottlingException"
+    assert fake.calls == ocr.calls == 4
+    assert ocr.retries == 3
+
+
+def test_other_errors_are_not_retried():
+    clock = FakeClock()
+
+    class Rejecting:
+        calls = 0
+
+        def detect_document_text(self, Document):
+            self.calls += 1
+            raise FakeClientError("InvalidParameterException")
+
+    client = Rejecting()
+    ocr = _fake_clock_ocr(client, clock, tps=None)
+    with pytest.raises(FakeClientError):
+        ocr.detect(b"page")
+    assert client.calls == 1 and ocr.retries == 0 and not clock.sleeps
+
+
+def test_concurrent_pages_come_back_in_order():
+    # real clock: jittered latency and throttling make pages finish out of order
+    fake = FakeTextract(latency=0.005, jitter=0.9, throttle=0.3, seed=2)
+    ocr = TextractOCR(fake, max_in_flight=6, tps=None, base_delay=0.001, max_attempts=30,
+                      rng=random.Random(2).random)
+    images = _images(50)
+
+    assert [_words(blocks) for blocks in ocr.map(images)] == _expected(fake, images)
+    assert ocr.retries == fake.throttled > 0
@@ -0,0 +1,49 @@
+"""
+words_to_lines groups the same lines whether it clusters WORD blocks or
+starts from Textract's LINE blocks.
+
+Recorded responses go in tests/fixtures/textract/ as one JSON file per
+page: the response of detect_document_text (or one page's Blocks from
+get_document_text_detection), saved as returned.  LINE grouping stays off
+by default until these pass on real scans.
+"""
+import glob
+import json
+import os
+
+import pytest
+
+from chunk_pdf import words_to_lines
+from fakes import load_recordings, text_blocks
+
+RECORDED = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "fixtures", "textract",
+                                         "*.json")))
+
+
+def _blocks(path):
+    with open(path, encoding="utf-8") as f:
+        response = json.load(f)
+    return response["Blocks"] if isinstance(response, dict) else response
+
+
+@pytest.mark.skipif(not RECORDED, reason="no recorded responses in tests/fixtures/textract")
+@pytest.mark.parametrize("path", RECORDED, ids=os.path.basename)
+def test_recorded_responses_agree(path):
+    blocks = _blocks(path)
+    assert any(b["BlockType"] == "LINE" for b in blocks), "response has no LINE blocks"
+    assert words_to_lines(blocks, use_lines=True) == words_to_lines(blocks, use_lines=False)
+
+
+def test_laid_out_pages_agree():
+    for prompt, _ in load_recordings()[:20]:
+        blocks = text_blocks(prompt)
+        lines = words_to_lines(blocks)
+        assert lines == words_to_lines(blocks, use_lines=True)
+        assert " ".join(lines) == " ".join(prompt.split())
+
+
+def test_words_no_line_claims_are_kept():
+    blocks = text_blocks("THENCE North 10 feet")
+    stray = dict(blocks[0], Id="stray", Text="to")
+    stray["Geometry"] = {"BoundingBox": dict(blocks[0]["Geometry"]["BoundingBox"], Left=0.9)}
+    assert words_to_lines(blocks + [stray], use_lines=True) == ["THENCE North 10 feet to"]
@@ -0,0 +1,531 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import unicodedata
+from collections import Counter
+
+from schema_function import EXTRACT_METES_BOUNDS_SCHEMA, SYSTEM_PROMPT_LINES
+
+# Fine-tuning corpus builder.  Streams prompt/completion examples out of
+# pipeline runs (batch JSONL, output.json) and the hand-kept training files
+# (training.json, TrainingMaterials/*.jsonl chat transcripts), validates
+# each completion against EXTRACT_METES_BOUNDS_SCHEMA, drops any prompt
+# the corpus already has, and appends what's left to numbered shards.
+#
+# Memory stays flat however many examples go through: inputs are read one
+# record at a time (JSON arrays included), and the seen-prompt index is a
+# SQLite file next to the shards.  A shard is written as .part and renamed
+# when full, and its prompts are committed to the index only then, so an
+# interrupted run leaves neither a half shard nor prompts marked as seen
+# that never made it into one.  Re-running over the same inputs plus new
+# production output only adds the new examples.
+
+DEFAULT_OUT_DIR = "training_corpus"
+INDEX_NAME = "index.sqlite"
+REJECTS_NAME = "rejects.jsonl"
+SHARD_EXAMPLES = 50_000
+SHARD_BYTES = 256 << 20
+
+# read size for streaming JSON arrays; an array element that still doesn't
+# parse at _MAX_RECORD_CHARS is taken as malformed rather than read further,
+# and a parse failure within _CUT_CHARS of the buffer's end may just be the
+# buffer cutting an element short ("fals", "\u00")
+_READ_CHARS = 1 << 16
+_MAX_RECORD_CHARS = 16 << 20
+_CUT_CHARS = 16
+
+_QUOTES = str.maketrans({"“": '"', "”": '"', "„": '"', "‘": "'", "’": "'", "‚": "'"})
+
+_PY_TYPES = {"object": dict, "array": list, "string": str, "boolean": bool,
+             "number": (int, float), "integer": int, "null": type(None)}
+
+# array indices in error paths, so error kinds can be tallied
+_INDEX_RE = re.compile(r"\[\d+\]")
+
+
+# -- validation ---------------------------------------------------------------
+
+def _path(path):
+    # path is a linked (parent, key) chain, only flattened for error messages
+    parts = []
+    while path is not None:
+        path, key = path
+        parts.append(f"[{key}]" if isinstance(key, int) else f".{key}")
+    return "$" + "".join(reversed(parts))
+
+
+def _compile(schema):
+    # schema -> (check(value, path, errors), exact types, allowed values)
+    # covering the keywords the function schemas use: type, enum,
+    # properties, required, items.  The exact scalar types (and enum) let a
+    # parent accept the usual case, a str where a string is expected,
+    # without calling the child's check.
+    names = schema.get("type")
+    names = (names,) if isinstance(names, str) else tuple(names or ())
+    exact = frozenset(t for name in names for t in
+                      (_PY_TYPES[name] if isinstance(_PY_TYPES[name], tuple) else (_PY_TYPES[name],)))
+    py_types = tuple(exact)
+    boolean = "boolean" in names
+    # JSON has one number type: 2.0 is an integer, true is not
+    integer = "integer" in names and "number" not in names
+    enum = schema.get("enum")
+    # the extractor's nullable enums ("type": ["string", "null"] with only
+    # the phrases listed) mean "one of these, or null"
+    allowed = None if enum is None else frozenset(enum) | ({None} if "null" in names else set())
+    properties = [(key, *_compile(sub)) for key, sub in schema.get("properties", {}).items()]
+    required = tuple(schema.get("required", ()))
+    items, item_types, item_allowed = _compile(schema["items"]) if "items" in schema else (None,) * 3
+    expected = " or ".join(names)
+
+    def check(value, path, errors):
+        if py_types:
+            ok = isinstance(value, py_types) and (boolean or not isinstance(value, bool))
+            if not ok and integer and isinstance(value, float):
+                ok = value.is_integer()
+            if not ok:
+                errors.append(f"{_path(path)}: expected {expected}, got {type(value).__name__}")
+                return
+        if allowed is not None and value not in allowed:
+            errors.append(f"{_path(path)}: {value!r} is not one of the allowed values")
+        if isinstance(value, dict):
+            if not value.keys() >= required_keys:
+                errors.extend(f"{_path(path)}: missing {key}" for key in required if key not in value)
+            for key, sub, sub_types, sub_allowed in properties:
+                if key in value:
+                    item = value[key]
+                    if type(item) not in sub_types or (sub_allowed is not None
+                                                       and item not in sub_allowed):
+                        sub(item, (path, key), errors)
+        elif items is not None and isinstance(value, list):
+            for i, item in enumerate(value):
+                if type(item) not in item_types or (item_allowed is not None
+                                                    and item not in item_allowed):
+                    items(item, (path, i), errors)
+
+    required_keys = frozenset(required)
+    # objects and arrays always need their check
+    return check, exact - {dict, list}, allowed
+
+
+def compile_validator(schema):
+    """
+    A validator for a function-calling `schema` (its "parameters", or a
+    bare JSON schema), compiled once into nested checks.  The validator
+    returns the list of error messages for a value, empty when it's valid.
+    """
+    check, _, _ = _compile(schema.get("parameters", schema))
+
+    def validate(value):
+        errors = []
+        check(value, None, errors)
+        return errors
+
+    return validate
+
+
+validate_completion = compile_validator(EXTRACT_METES_BOUNDS_SCHEMA)
+
+_SEGMENT_SCHEMA = EXTRACT_METES_BOUNDS_SCHEMA["parameters"]["properties"]["segments"]["items"]
+# required segment keys absent from older output, and what they default to
+_SEGMENT_DEFAULTS = {key: [] if key == "pointsOnLine" else None
+                     for key in _SEGMENT_SCHEMA["required"]
+                     if key == "pointsOnLine" or "null" in _SEGMENT_SCHEMA["properties"][key]["type"]}
+
+
+def fill_defaults(completion):
+    """
+    Add the required segment keys that may be empty (null, or [] for
+    pointsOnLine) where they're absent.  Returns whether any were added.
+    """
+    filled = False
+    segments = completion.get("segments") if isinstance(completion, dict) else None
+    for segment in segments if isinstance(segments, list) else ():
+        if isinstance(segment, dict) and not segment.keys() >= _SEGMENT_DEFAULTS.keys():
+            for key, default in _SEGMENT_DEFAULTS.items():
+                if key not in segment:
+                    segment[key] = list(default) if isinstance(default, list) else default
+            filled = True
+    return filled
+
+
+# -- input --------------------------------------------------------------------
+
+def normalize_prompt(prompt):
+    """The prompt as compared for duplicates: NFKC, straight quotes, casefolded, single-spaced."""
+    prompt = unicodedata.normalize("NFKC", prompt).translate(_QUOTES).casefold()
+    return " ".join(prompt.split())
+
+
+def prompt_key(prompt):
+    return hashlib.blake2b(normalize_prompt(prompt).encode("utf-8"), digest_size=16).digest()
+
+
+def _iter_array(f):
+    # elements of the JSON array `f` is positioned at, one at a time.  An
+    # element that doesn't parse raises ValueError: the buffer only grows
+    # while the failure could be the buffer's end cutting an element short,
+    # and never past _MAX_RECORD_CHARS
+    decoder = json.JSONDecoder()
+    buffer = f.read(_READ_CHARS)
+    pos = buffer.index("[") + 1
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos == len(buffer):
+            buffer, pos = f.read(_READ_CHARS), 0
+            if not buffer:
+                raise ValueError("unterminated JSON array")
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as exc:
+            cut = len(buffer) - exc.pos <= _CUT_CHARS or exc.msg.startswith("Unterminated string")
+            if not cut or len(buffer) - pos > _MAX_RECORD_CHARS:
+                raise
+            # element runs past the buffer; read at least as much again
+            more = f.read(max(_READ_CHARS, len(buffer) - pos))
+            if not more:
+                raise
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        yield value
+        pos = end
+
+
+def _records(path):
+    # (position, raw record, error) for each record of one input file: the
+    # elements of a top-level array (a file whose first non-blank character
+    # is "["), the one object of an output.json / training.json, or JSONL
+    # lines, where position is the line number.  A JSONL line that doesn't
+    # decode comes out with the error set and the lines after it are still
+    # read; an array can't be resynchronised after a bad element, so that
+    # element comes out with the error set and ends the file
+    with open(path, encoding="utf-8") as f:
+        head = f.read(1)
+        while head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        if head == "[":
+            n = 0
+            try:
+                for record in _iter_array(f):
+                    yield n, record, None
+                    n += 1
+            except ValueError as exc:
+                reason = exc.msg if isinstance(exc, json.JSONDecodeError) else exc
+                yield n, None, f"$: array element is not JSON ({reason})"
+            return
+        if path.endswith(".json"):
+            # hand-kept, pretty-printed and small
+            try:
+                record = json.load(f)
+            except json.JSONDecodeError as exc:
+                yield 1, None, f"$: file is not JSON ({exc.msg})"
+                return
+            # training.json keeps its examples in a "segments" list
+            if isinstance(record, dict) and "completion" not in record and isinstance(
+                    record.get("segments"), list):
+                for n, example in enumerate(record["segments"]):
+                    yield n, example, None
+            else:
+                yield 1, record, None
+            return
+        for n, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield n, json.loads(line), None
+                except json.JSONDecodeError as exc:
+                    yield n, None, f"$: line is not JSON ({exc.msg})"
+
+
+def _example(record):
+    # (prompt, completion text) from a prompt/completion record or a chat
+    # transcript (bare list of messages or {"messages": [...]})
+    messages = record.get("messages") if isinstance(record, dict) else record
+    if isinstance(messages, list):
+        prompt = completion = None
+        for message in messages:
+            if message.get("role") == "user":
+                prompt = message.get("content")
+            elif message.get("role") == "assistant":
+                call = message.get("function_call")
+                completion = call.get("arguments") if call else message.get("content")
+        return prompt, completion
+    return record.get("prompt"), record.get("completion")
+
+
+def iter_examples(paths):
+    """
+    (source, prompt, completion text, error) from pipeline output and
+    training files; directories contribute their *.jsonl files.  `source`
+    is the file and line (or array position) of the record.  A record
+    that can't be read yields an item with the error set, so it can be
+    counted; only a JSON array that stops parsing loses the rest of its
+    file.
+    """
+    for item in paths:
+        files = (sorted(glob.glob(os.path.join(glob.escape(item), "**", "*.jsonl"), recursive=True))
+                 if os.path.isdir(item) else [item])
+        for path in files:
+            try:
+                for n, record, error in _records(path):
+                    if error is not None:
+                        yield f"{path}:{n}", None, None, error
+                        continue
+                    try:
+                        prompt, completion = _example(record)
+                    except AttributeError:
+                        yield f"{path}:{n}", None, None, "$: not an example record"
+                        continue
+                    if isinstance(completion, (dict, list)):
+                        completion = json.dumps(completion, ensure_ascii=False)
+                    yield f"{path}:{n}", prompt, completion, None
+            except ValueError as exc:
+                yield path, None, None, f"$: unreadable ({type(exc).__name__})"
+
+
+# -- output -------------------------------------------------------------------
+
+class CorpusIndex:
+    """
+    On-disk set of prompt keys already in the corpus (with a hash of the
+    completion each was kept with, to spot conflicting labels), plus the
+    shards written so far.  Changes are uncommitted until commit().
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS prompts ("
+                           " key BLOB PRIMARY KEY, completion BLOB NOT NULL, shard TEXT)"
+                           " WITHOUT ROWID")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS shards ("
+                           " name TEXT PRIMARY KEY, examples INTEGER NOT NULL,"
+                           " bytes INTEGER NOT NULL, written REAL NOT NULL)")
+        self._conn.execute("BEGIN")
+
+    def seen(self, key):
+        """The stored completion hash for `key`, or None."""
+        row = self._conn.execute("SELECT completion FROM prompts WHERE key = ?", (key,)).fetchone()
+        return row and row[0]
+
+    def add(self, key, completion, shard):
+        self._conn.execute("INSERT INTO prompts (key, completion, shard) VALUES (?, ?, ?)",
+                           (key, completion, shard))
+
+    def shards(self):
+        return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(examples), 0) FROM shards").fetchone()
+
+    def add_shard(self, name, examples, size):
+        self._conn.execute("INSERT OR REPLACE INTO shards VALUES (?, ?, ?, ?)",
+                           (name, examples, size, time.time()))
+
+    def commit(self):
+        self._conn.execute("COMMIT")
+        self._conn.execute("BEGIN")
+
+    def close(self, commit=True):
+        self._conn.execute("COMMIT" if commit else "ROLLBACK")
+        self._conn.close()
+
+
+class ShardWriter:
+    """
+    Appends JSON lines to `<prefix>-NNNNN.jsonl` shards in `out_dir`,
+    starting a new one after `max_examples` lines or `max_bytes` bytes.
+    Each shard is written as .part and renamed, and the index committed,
+    when it closes.
+    """
+
+    def __init__(self, out_dir, index, prefix="train", max_examples=SHARD_EXAMPLES,
+                 max_bytes=SHARD_BYTES):
+        self.out_dir = out_dir
+        self.index = index
+        self.prefix = prefix
+        self.max_examples = max_examples
+        self.max_bytes = max_bytes
+        self.written = []
+        self._number = index.shards()[0]
+        self._file = None
+
+    @property
+    def name(self):
+        return f"{self.prefix}-{self._number:05d}.jsonl"
+
+    def write(self, line):
+        """Write one line; returns the shard it lands in."""
+        if self._file is None:
+            self._examples = self._bytes = 0
+            self._file = open(os.path.join(self.out_dir, self.name + ".part"), "wb")
+        data = line.encode("utf-8") + b"\n"
+        self._file.write(data)
+        self._examples += 1
+        self._bytes += len(data)
+        name = self.name
+        if self._examples >= self.max_examples or self._bytes >= self.max_bytes:
+            self.close()
+        return name
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        path = os.path.join(self.out_dir, self.name)
+        os.replace(path + ".part", path)
+        self.index.add_shard(self.name, self._examples, self._bytes)
+        self.index.commit()
+        self.written.append(self.name)
+        self._number += 1
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(os.path.join(self.out_dir, self.name + ".part"))
+
+
+# the system message is the same in every transcript, so it's encoded once
+_CHAT_HEAD = ('{"messages": ['
+              + json.dumps({"role": "system", "content": SYSTEM_PROMPT_LINES}, ensure_ascii=False)
+              + ', {"role": "user", "content": ')
+
+
+def example_line(prompt, completion, chat=True):
+    """One shard line: a chat transcript with the extraction system prompt, or prompt/completion."""
+    prompt = json.dumps(prompt, ensure_ascii=False)
+    completion = json.dumps(completion, ensure_ascii=False)
+    if chat:
+        return f'{_CHAT_HEAD}{prompt}}}, {{"role": "assistant", "content": {completion}}}]}}'
+    return f'{{"prompt": {prompt}, "completion": {completion}}}'
+
+
+def _error_kind(error):
+    return _INDEX_RE.sub("[*]", error.split(" is not one")[0])
+
+
+def build_corpus(paths, out_dir=DEFAULT_OUT_DIR, check_only=False, fill=True, chat=True,
+                 max_examples=SHARD_EXAMPLES, max_bytes=SHARD_BYTES, log=print):
+    """
+    Validate and deduplicate the examples in `paths`, appending the new
+    valid ones to shards in `out_dir` (chat transcripts with the
+    extraction system prompt, or prompt/completion records when `chat` is
+    off) and the invalid ones to rejects.jsonl.  With `check_only` nothing
+    is written and duplicates are counted against a scratch index.
+    Returns (counts, error kinds) as Counters.
+    """
+    counts = Counter()
+    kinds = Counter()
+    scratch = None
+    if check_only:
+        scratch = tempfile.TemporaryDirectory()
+        index = CorpusIndex(os.path.join(scratch.name, INDEX_NAME))
+        writer = rejects = None
+    else:
+        os.makedirs(out_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(glob.escape(out_dir), "*.part")):
+            os.remove(stale)
+        index = CorpusIndex(os.path.join(out_dir, INDEX_NAME))
+        writer = ShardWriter(out_dir, index, max_examples=max_examples, max_bytes=max_bytes)
+        rejects = open(os.path.join(out_dir, REJECTS_NAME), "a", encoding="utf-8")
+    ok = False
+    try:
+        for source, prompt, text, error in iter_examples(paths):
+            counts["read"] += 1
+            if counts["read"] % 100_000 == 0:
+                log(f"{counts['read']:,} read, {counts['kept']:,} kept")
+            if error is not None:
+                errors = [error]
+            elif not isinstance(prompt, str) or not prompt.strip():
+                errors = ["$: no prompt"]
+            elif not isinstance(text, str):
+                errors = ["$: no completion"]
+            else:
+                try:
+                    completion = json.loads(text)
+                except json.JSONDecodeError as exc:
+                    errors = [f"$: completion is not JSON ({exc.msg})"]
+                else:
+                    if fill and fill_defaults(completion):
+                        text = json.dumps(completion, ensure_ascii=False)
+                    errors = validate_completion(completion)
+            if errors:
+                counts["invalid"] += 1
+                kinds.update({_error_kind(e) for e in errors})
+                if rejects is not None:
+                    rejects.write(json.dumps({"source": source, "errors": errors[:20],
+                                              "prompt": prompt, "completion": text},
+                                             ensure_ascii=False) + "\n")
+                continue
+
+            key = prompt_key(prompt)
+            label = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+            previous = index.seen(key)
+            if previous is not None:
+                counts["duplicate"] += 1
+                if previous != label:
+                    counts["conflicting"] += 1
+                continue
+            if writer is None:
+                index.add(key, label, None)
+            else:
+                index.add(key, label, writer.write(example_line(prompt, text, chat)))
+            counts["kept"] += 1
+        ok = True
+    finally:
+        if writer is not None:
+            if ok:
+                writer.close()
+                counts["shards"] = len(writer.written)
+            else:
+                writer.abort()
+            rejects.close()
+        index.close(commit=ok and not check_only)
+        if scratch is not None:
+            scratch.cleanup()
+    return counts, kinds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a deduplicated, validated fine-tuning corpus "
+                                                 "from pipeline output and training files.")
+    parser.add_argument("inputs", nargs="+",
+                        help="batch output directories, JSONL/JSON files, or chat transcript files")
+    parser.add_argument("--out", default=DEFAULT_OUT_DIR,
+                        help=f"directory for shards, the prompt index and rejects (default {DEFAULT_OUT_DIR})")
+    parser.add_argument("--check", action="store_true",
+                        help="only validate and count duplicates; write nothing")
+    parser.add_argument("--no-fill", action="store_true",
+                        help="reject segments missing nullable keys instead of filling them with null")
+    parser.add_argument("--prompt-completion", action="store_true",
+                        help="write prompt/completion records instead of chat transcripts")
+    parser.add_argument("--shard-examples", type=int, default=SHARD_EXAMPLES,
+                        help=f"examples per shard (default {SHARD_EXAMPLES})")
+    parser.add_argument("--shard-mb", type=int, default=SHARD_BYTES >> 20,
+                        help=f"shard size limit in MB (default {SHARD_BYTES >> 20})")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    counts, kinds = build_corpus(args.inputs, args.out, args.check, not args.no_fill,
+                                 not args.prompt_completion, args.shard_examples, args.shard_mb << 20)
+    seconds = time.perf_counter() - start
+    print(f"{counts['read']:,} examples in {seconds:.1f}s: {counts['kept']:,} new, "
+          f"{counts['duplicate']:,} duplicate ({counts['conflicting']:,} with a different completion), "
+          f"{counts['invalid']:,} invalid"
+          + ("" if args.check else f"; {counts['shards']} shards written to {args.out}"))
+    for kind, n in kinds.most_common(10):
+        print(f"  {n:6,}  {kind}")
+
+
+if __name__ == "__main__":
+    main()
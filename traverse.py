@@ -0,0 +1,365 @@
+import argparse
+import json
+import math
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from call_parser import parse_bearing
+
+# Traverse geometry for extracted segments.  Each parcel's courses (lines,
+# and curves by their chord) become azimuth/length rows; a whole batch of
+# parcels is then solved at once with NumPy: cumulative coordinates from
+# the parcel's base northing/easting, misclosure, precision ratio and the
+# enclosed area (shoelace over the chords plus the circular segment each
+# curve adds or cuts off).  Only the per-segment string parsing is Python.
+
+# feet per unit; a course with no unit is taken to be in feet
+UNIT_FEET = {
+    "feet": 1.0, "foot": 1.0, "ft": 1.0, "'": 1.0,
+    "chains": 66.0, "chain": 66.0, "ch": 66.0,
+    "links": 0.66, "link": 0.66,
+    "rods": 16.5, "rod": 16.5, "poles": 16.5, "pole": 16.5, "perches": 16.5,
+    "varas": 100 / 36, "vara": 100 / 36,  # Texas vara, 33 1/3 inches
+    "yards": 3.0, "yard": 3.0,
+    "meters": 3937 / 1200, "meter": 3937 / 1200, "m": 3937 / 1200,  # US survey feet
+}
+
+SQFT_PER_ACRE = 43560.0
+
+# precision below 1:MIN_PRECISION fails closure
+MIN_PRECISION = 5000
+# misclosure under this many feet is rounding noise; the traverse is exact
+EXACT_FEET = 1e-6
+
+_NUMBER_RE = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+")
+_SIDE_RE = re.compile(r"\bto\s+the\s+(left|right)\b", re.IGNORECASE)
+_DUE_RE = re.compile(r"^\s*due\s+(north|south|east|west)\s*$", re.IGNORECASE)
+_ANGLE_RE = re.compile(r"""
+    ^\s*(?P<deg>\d+(?:\.\d+)?)\s*(?:°|º|degrees?|deg\.?)?\s*
+    (?:(?P<min>\d+(?:\.\d+)?)\s*(?:'|’|′|minutes?|min\.?)\s*)?
+    (?:(?P<sec>\d+(?:\.\d+)?)\s*(?:"|”|″|''|seconds?|sec\.?)\s*)?$
+""", re.IGNORECASE | re.VERBOSE)
+
+# (north, east) unit vector for "due" bearings
+_DUE = {"north": (1.0, 0.0), "south": (-1.0, 0.0), "east": (0.0, 1.0), "west": (0.0, -1.0)}
+
+# one course of a parcel: direction cosines, length in feet, arc length
+# and the signed circular-segment area (left curves positive) for curves,
+# and whether it is a tie from a commencement point rather than boundary
+Course = namedtuple("Course", "segment cos_n sin_e length arc arc_area tie")
+
+# a parcel's courses plus what the per-segment parse found: base
+# coordinates, "closed" or "open" (ends at a point of termination/exit),
+# and problems that make its closure unreliable
+Parcel = namedtuple("Parcel", "courses base_north base_east kind problems")
+
+# solve() result.  Per course (flattened across parcels, `parcel` holds the
+# owning parcel's index): parcel, segment, north, east (at the end of the
+# course).  Per parcel: misclosure_north/east, misclosure, perimeter,
+# precision (perimeter / misclosure, inf when exact), area (sq ft), acres,
+# closed (kind and precision both good) and flags (list of strings).
+Traverses = namedtuple("Traverses", "parcel segment north east misclosure_north misclosure_east "
+                                    "misclosure perimeter precision area acres closed flags")
+
+
+def _number(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    m = _NUMBER_RE.search(str(value))
+    return float(m.group().replace(",", "")) if m else None
+
+
+def _unit_feet(unit):
+    if unit is None:
+        return 1.0
+    return UNIT_FEET.get(str(unit).strip().strip(".").lower())
+
+
+def direction(bearing):
+    """(north, east) unit vector for a quadrant bearing, or None when it doesn't parse."""
+    if not bearing:
+        return None
+    parts = parse_bearing(bearing)
+    if parts is None:
+        m = _DUE_RE.match(bearing)
+        return _DUE[m.group(1).lower()] if m else None
+    ns, deg, minutes, seconds, ew = parts
+    theta = math.radians(deg + minutes / 60 + seconds / 3600)
+    return ((1.0 if ns == "N" else -1.0) * math.cos(theta),
+            (1.0 if ew == "E" else -1.0) * math.sin(theta))
+
+
+def central_angle(angle):
+    """Curve central angle in radians from DMS or words, or None."""
+    if angle is None:
+        return None
+    if isinstance(angle, (int, float)):
+        return math.radians(angle)
+    m = _ANGLE_RE.match(angle)
+    if not m:
+        return None
+    return math.radians(float(m.group("deg")) + float(m.group("min") or 0) / 60
+                        + float(m.group("sec") or 0) / 3600)
+
+
+def _marker(segment):
+    # what a segment's locationDescription says about the traverse
+    loc = (segment.get("locationDescription") or "").upper()
+    if not loc:
+        return None
+    if "COMMENC" in loc:
+        return "commence"
+    if "TERMIN" in loc or "EXIT" in loc:
+        return "end"
+    bearing = segment.get("bearing")
+    if "POINT OF BEGIN" in loc or "PLACE OF BEGIN" in loc:
+        return "pob" if bearing else "begin"
+    if loc.startswith("BEGIN") and "OF A" not in loc and not bearing:
+        return "begin"
+    return None
+
+
+def split_parcels(segments):
+    """
+    Split one document's segments into parcels.  A parcel starts at each
+    COMMENCING clause and at each BEGINNING clause that isn't the point of
+    beginning the current COMMENCING tie leads to.
+    """
+    parcels = []
+    current = None
+    tying = False
+    for segment in segments:
+        marker = _marker(segment)
+        if current is None or marker == "commence" or (marker == "begin" and not tying):
+            current = []
+            parcels.append(current)
+            tying = marker == "commence"
+        elif marker in ("begin", "pob"):
+            tying = False
+        current.append(segment)
+    return parcels
+
+
+def _curve(segment, chord, feet):
+    # (arc length, signed segment area, problem) for a curve whose chord is
+    # known; radius and arc are in the segment's unit like the chord
+    radius = _number(segment.get("radius"))
+    radius = radius and radius * feet
+    delta = central_angle(segment.get("angle"))
+    arc = _number(segment.get("arcDistance"))
+    arc = arc and arc * feet
+    if radius and not delta and arc:
+        delta = arc / radius
+    if radius and not delta and chord <= 2 * radius:
+        delta = 2 * math.asin(chord / (2 * radius))
+    if delta and not radius and math.sin(delta / 2):
+        radius = chord / (2 * math.sin(delta / 2))
+    if not (radius and delta):
+        return arc or chord, 0.0, "curve without radius/angle"
+    side = (segment.get("direction") or "").lower()
+    if side not in ("left", "right"):
+        # "BEGINNING OF A CURVE TO THE RIGHT" often carries it instead
+        m = _SIDE_RE.search(f"{segment.get('locationDescription')} {segment.get('description')}")
+        side = m.group(1).lower() if m else side
+    if side not in ("left", "right"):
+        return radius * delta, 0.0, "curve direction unknown"
+    area = radius * radius / 2 * (delta - math.sin(delta))
+    return radius * delta, area if side == "left" else -area, None
+
+
+def parse_parcel(segments):
+    """Turn one parcel's segments into a Parcel (the scalar, per-segment part of the work)."""
+    courses = []
+    problems = []
+    base_north = base_east = None
+    tie = _marker(segments[0]) == "commence" if segments else False
+    closing = kind = None
+    for i, segment in enumerate(segments):
+        marker = _marker(segment)
+        if base_north is None and segment.get("baseNorth") is not None:
+            base_north, base_east = _number(segment["baseNorth"]), _number(segment.get("baseEast"))
+        if marker == "begin":
+            tie = False
+        if marker == "end":
+            kind = "open"
+
+        if segment.get("callType") == "point" or (segment.get("bearing") is None
+                                                  and segment.get("distance") is None):
+            continue
+        vector = direction(segment.get("bearing"))
+        distance = _number(segment.get("distance"))
+        feet = _unit_feet(segment.get("unit"))
+        if vector is None or distance is None or feet is None:
+            problems.append(f"segment {i}: can't use bearing {segment.get('bearing')!r}, "
+                            f"distance {segment.get('distance')!r} {segment.get('unit') or ''}".rstrip())
+            continue
+        length = distance * feet
+        arc, arc_area = length, 0.0
+        if segment.get("callType") == "curve":
+            arc, arc_area, problem = _curve(segment, length, feet)
+            if problem:
+                problems.append(f"segment {i}: {problem}")
+        courses.append(Course(i, vector[0], vector[1], length, arc, arc_area, tie))
+        if marker == "pob":
+            if tie:
+                # the tie ends at the point of beginning; the boundary starts here
+                tie = False
+            else:
+                closing = len(courses)
+
+    if closing is not None:
+        # anything after the closing course isn't part of the boundary
+        courses = courses[:closing]
+    return Parcel(courses, base_north or 0.0, base_east or 0.0, kind or "closed", problems)
+
+
+def _segmented_cumsum(values, starts):
+    # running sum restarting at each index in `starts` (sorted, starts[0] == 0)
+    total = np.cumsum(values)
+    offsets = np.concatenate(([0.0], total))[starts]
+    counts = np.diff(np.append(starts, len(values)))
+    return total - np.repeat(offsets, counts)
+
+
+def solve_parcels(parcels, min_precision=MIN_PRECISION):
+    """Solve a batch of Parcels (see parse_parcel) in one vectorized pass."""
+    count = len(parcels)
+    sizes = np.fromiter((len(p.courses) for p in parcels), dtype=np.int64, count=count)
+    rows = [c for p in parcels for c in p.courses]
+    parcel = np.repeat(np.arange(count), sizes)
+    if rows:
+        segment, cos_n, sin_e, length, arc, arc_area, tie = (np.array(col) for col in zip(*rows))
+        tie = tie.astype(bool)
+    else:
+        segment = np.zeros(0, dtype=np.int64)
+        cos_n = sin_e = length = arc = arc_area = np.zeros(0)
+        tie = np.zeros(0, dtype=bool)
+
+    dn = cos_n * length
+    de = sin_e * length
+    nonempty = sizes > 0
+    starts = (np.cumsum(sizes) - sizes)[nonempty]
+    base_n = np.array([p.base_north for p in parcels], dtype=float)
+    base_e = np.array([p.base_east for p in parcels], dtype=float)
+    if len(dn):
+        north = base_n[parcel] + _segmented_cumsum(dn, starts)
+        east = base_e[parcel] + _segmented_cumsum(de, starts)
+    else:
+        north = east = np.zeros(0)
+
+    boundary = ~tie
+
+    def per_parcel(values):
+        # sum of `values` over each parcel's boundary courses
+        return np.bincount(parcel[boundary], weights=values[boundary], minlength=count)
+
+    mis_n = per_parcel(dn)
+    mis_e = per_parcel(de)
+    misclosure = np.hypot(mis_n, mis_e)
+    misclosure[misclosure < EXACT_FEET] = 0.0
+    perimeter = per_parcel(arc)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(misclosure > 0, perimeter / misclosure, np.inf)
+
+    # shoelace over the boundary chords, relative to each parcel's point of
+    # beginning (the start of its first boundary course), so the implied
+    # closing line back to it adds nothing
+    prev_n, prev_e = north - dn, east - de
+    index = np.flatnonzero(boundary)
+    parcels_with, first = np.unique(parcel[index], return_index=True)
+    pob_n = np.zeros(count)
+    pob_e = np.zeros(count)
+    pob_n[parcels_with] = prev_n[index[first]]
+    pob_e[parcels_with] = prev_e[index[first]]
+    rel_n = prev_n - pob_n[parcel]
+    rel_e = prev_e - pob_e[parcel]
+    twice = per_parcel(rel_e * dn - de * rel_n)
+    area = np.abs(twice / 2 + per_parcel(arc_area))
+    closed_kind = np.array([p.kind == "closed" for p in parcels], dtype=bool)
+    closed = closed_kind & (precision >= min_precision) & (per_parcel(np.ones_like(dn)) > 0)
+
+    flags = []
+    for i, p in enumerate(parcels):
+        parcel_flags = list(p.problems)
+        if not p.courses:
+            parcel_flags.append("no courses")
+        elif p.kind == "closed" and precision[i] < min_precision:
+            parcel_flags.append(f"misclosure {misclosure[i]:.2f} ft (1:{precision[i]:.0f})")
+        flags.append(parcel_flags)
+    return Traverses(parcel, segment, north, east, mis_n, mis_e, misclosure, perimeter,
+                     precision, np.where(closed_kind, area, 0.0),
+                     np.where(closed_kind, area / SQFT_PER_ACRE, 0.0), closed, flags)
+
+
+def solve(segment_lists, min_precision=MIN_PRECISION):
+    """Solve a batch of parcels given as segment lists (one list per parcel)."""
+    return solve_parcels([parse_parcel(segments) for segments in segment_lists], min_precision)
+
+
+def iter_documents(paths):
+    """
+    (document, segments) from pipeline output: batch JSONL (one record per
+    chunk, segments joined in chunk order) or an output.json.
+    """
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".json"):
+                record = json.load(f)
+                yield path, json.loads(record["completion"]).get("segments", [])
+                continue
+            documents = {}
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    documents.setdefault(record.get("document", path), []).extend(
+                        json.loads(record["completion"]).get("segments", []))
+            yield from documents.items()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Closure and area QA over extracted segments.")
+    parser.add_argument("paths", nargs="+", help="batch JSONL files or output.json files")
+    parser.add_argument("--min-precision", type=float, default=MIN_PRECISION,
+                        help=f"closure below 1:N is flagged (default {MIN_PRECISION})")
+    parser.add_argument("--json", action="store_true", help="one JSON record per parcel")
+    args = parser.parse_args(argv)
+
+    labels = []
+    parcels = []
+    for document, segments in iter_documents(args.paths):
+        for n, segments in enumerate(split_parcels(segments)):
+            labels.append((document, n))
+            parcels.append(parse_parcel(segments))
+    result = solve_parcels(parcels, args.min_precision)
+
+    failed = 0
+    for i, ((document, n), p) in enumerate(zip(labels, parcels)):
+        record = {
+            "document":   document,
+            "parcel":     n,
+            "kind":       p.kind,
+            "courses":    len(p.courses),
+            "perimeter":  round(float(result.perimeter[i]), 3),
+            "misclosure": round(float(result.misclosure[i]), 3),
+            "precision":  None if math.isinf(result.precision[i]) else round(float(result.precision[i])),
+            "acres":      round(float(result.acres[i]), 4),
+            "flags":      result.flags[i],
+        }
+        failed += bool(record["flags"])
+        if args.json:
+            print(json.dumps(record, ensure_ascii=False))
+        else:
+            precision = "exact" if record["precision"] is None else f"1:{record['precision']}"
+            status = "FLAG" if record["flags"] else "ok"
+            print(f"{status:<4} {document} #{n}: {p.kind}, {record['courses']} courses, "
+                  f"{record['perimeter']:.2f} ft, closure {precision}, {record['acres']:.4f} ac")
+            for flag in record["flags"]:
+                print(f"       {flag}")
+    if not args.json:
+        print(f"{len(parcels)} parcels, {failed} flagged")
+
+
+if __name__ == "__main__":
+    main()